@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+# Local stand-ins for the GitHub REST/GraphQL endpoints and the Notion database/page/block
+# endpoints that main.py talks to, backed by a synthetic in-memory dataset. Every
+# request is counted per endpoint along with the bytes in and out, and the servers can
+# add latency and enforce rate limits like the real APIs.
+import json
+import hashlib
+import random
+import threading
+import time
+import uuid
+import datetime
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+OWNERS = [
+    'all-but-dissertation',
+    'cornell-cdses',
+    'minimod-nutrition',
+    'staaars-plus',
+    'uganda-rideshare-projects',
+    'amichuda'
+]
+
+LABELS = ['bug', 'enhancement', 'question', 'documentation', 'wontfix']
+
+# notion's errors for a block that doesn't exist and for one that was deleted
+NOT_FOUND = {'object' : 'error', 'status' : 404, 'code' : 'object_not_found', 'message' : 'Not Found'}
+
+ARCHIVED_BLOCK = {'object' : 'error', 'status' : 400, 'code' : 'validation_error',
+                  'message' : "Can't edit block that is archived. You must unarchive the block before editing."}
+
+# the oldest Notion-Version whose block payloads (`rich_text`) and timestamp filters the
+# stand-in speaks; older clients get the 400 notion would give them
+NOTION_VERSION = "2022-06-28"
+
+def timestamp(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def notion_timestamp(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def rich_text(content):
+    return [{'type' : 'text', 'text' : {'content' : content}, 'plain_text' : content}]
+
+class Dataset:
+
+    # `repos` repositories spread round-robin over the owners main.py syncs, each with
+    # `issues` issues updated at random times over the last 30 days
+    def __init__(self, repos=50, issues=200, body_size=800, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        now = datetime.datetime.utcnow()
+
+        self.repos = {}
+        self.issues = {}
+
+        for r in range(repos):
+            owner = OWNERS[r % len(OWNERS)]
+            name = f"repo-{r:03d}"
+
+            self.repos[(owner, name)] = []
+
+            for number in range(1, issues + 1):
+                self.repos[(owner, name)].append(number)
+                self.issues[(owner, name, number)] = {
+                    'title' : f"Issue {number} in {name}",
+                    'state' : self.random.choice(['open', 'closed']),
+                    'body' : ''.join(self.random.choice('abcdefghij \n') for _ in range(body_size)),
+                    'labels' : self.random.sample(LABELS, self.random.randint(0, 2)),
+                    'updated_at' : now - datetime.timedelta(seconds = self.random.randint(3600, 30 * 86400))
+                }
+
+        # up to three comments per issue, from a generator of their own so that the
+        # issues stay the same for a given seed
+        comment_random = random.Random(seed + 1)
+        self.comments = {}
+
+        for owner, name, number in sorted(self.issues):
+            for _ in range(comment_random.randint(0, 3)):
+                self.add_comment(owner, name, number,
+                                 ''.join(comment_random.choice('abcdefghij \n') for _ in range(body_size // 4)),
+                                 self.issues[(owner, name, number)]['updated_at'])
+
+        # notion pages by id, their content blocks by parent id, (parent, page) of each block
+        # and the ids of deleted blocks, which notion keeps as archived
+        self.pages = {}
+        self.blocks = {}
+        self.block_pages = {}
+        self.archived_blocks = set()
+
+    def add_comment(self, owner, name, number, body, moment):
+        comment_id = len(self.comments) + 1
+
+        self.comments[comment_id] = {'id' : comment_id,
+                                     'key' : (owner, name, number),
+                                     'user' : {'login' : 'someone'},
+                                     'body' : body,
+                                     'created_at' : moment,
+                                     'updated_at' : moment}
+
+    def touch_github(self, fraction):
+        # edit a random `fraction` of the github issues, as if people had been working
+        with self.lock:
+            keys = self.random.sample(sorted(self.issues), int(len(self.issues) * fraction))
+
+            for n, key in enumerate(keys):
+                self.issues[key]['title'] += " (edited)"
+                self.issues[key]['updated_at'] = datetime.datetime.utcnow()
+
+                # and add a paragraph to every other body, and a comment to every third issue
+                if n % 2 == 0:
+                    self.issues[key]['body'] += "\n\nOne more paragraph."
+
+                if n % 3 == 0:
+                    self.add_comment(*key, "A new comment.", datetime.datetime.utcnow())
+
+        return len(keys)
+
+    def touch_notion(self, fraction):
+        # edit a random `fraction` of the notion pages
+        with self.lock:
+            ids = self.random.sample(sorted(self.pages), int(len(self.pages) * fraction))
+
+            for page_id in ids:
+                page = self.pages[page_id]
+                labels = [{'name' : label} for label in self.random.sample(LABELS, 1)]
+                page['properties']['Labels'] = {'type' : 'multi_select', 'multi_select' : labels}
+                page['last_edited_time'] = notion_timestamp(datetime.datetime.utcnow())
+
+        return len(ids)
+
+    def drift(self):
+        # one of each thing reconciliation looks for: an issue deleted and one transferred
+        # to another repo on github, a page archived by hand and a page duplicated
+        with self.lock:
+            deleted, moved = self.random.sample(sorted(self.issues), 2)
+
+            self.repos[deleted[:2]].remove(deleted[2])
+            del self.issues[deleted]
+
+            # a transferred issue gets the next free number in its new repo
+            target = self.random.choice([repo for repo in sorted(self.repos) if repo != moved[:2]])
+            number = max(self.repos[target]) + 1
+
+            self.repos[moved[:2]].remove(moved[2])
+            self.repos[target].append(number)
+            self.issues[(*target, number)] = self.issues.pop(moved)
+
+            for comment in self.comments.values():
+                if comment['key'] == moved:
+                    comment['key'] = (*target, number)
+
+            def key(page):
+                properties = page['properties']
+                return (properties['Organization']['rich_text'][0]['plain_text'],
+                        properties['Repo']['rich_text'][0]['plain_text'],
+                        properties['Github Issue Number']['number'])
+
+            pages = [page for page in self.pages.values() if not page['archived'] and key(page) not in (deleted, moved)]
+            archived, duplicated = self.random.sample(sorted(pages, key = lambda page : page['id']), 2)
+
+            archived['archived'] = True
+
+            copy = json.loads(json.dumps(duplicated))
+            copy['id'] = str(uuid.uuid4())
+            copy['created_time'] = copy['last_edited_time'] = notion_timestamp(datetime.datetime.utcnow())
+
+            self.pages[copy['id']] = copy
+            self.blocks[copy['id']] = []
+
+        return {'deleted' : list(deleted), 'transferred' : [list(moved), [*target, number]],
+                'archived' : archived['id'], 'duplicated' : duplicated['id']}
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.statuses = defaultdict(int)
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, endpoint, status, bytes_in, bytes_out):
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.statuses[status] += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests' : dict(self.requests),
+                    'statuses' : {str(k) : v for k, v in self.statuses.items()},
+                    'total_requests' : sum(self.requests.values()),
+                    'bytes_in' : self.bytes_in,
+                    'bytes_out' : self.bytes_out}
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.statuses.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlsplit(self.path)
+
+        endpoint, status, payload, headers = self.server.route(self, method, url.path, parse_qs(url.query), body)
+
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+
+        self.send_response(status)
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+        self.server.stats.record(f"{method} {endpoint}", status, len(body), len(data))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+class MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, dataset, latency=0.0):
+        super().__init__(('127.0.0.1', 0), MockHandler)
+        self.dataset = dataset
+        self.latency = latency
+        self.stats = Stats()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target = self.serve_forever, daemon = True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class MockGithub(MockServer):
+
+    # `quota` requests per hour, like the authenticated REST limit; 304s are free
+    def __init__(self, dataset, latency=0.0, quota=5000):
+        super().__init__(dataset, latency)
+        self.quota = quota
+        self.used = 0
+        self.reset_at = int(time.time()) + 3600
+        self.quota_lock = threading.Lock()
+
+    def _rate_headers(self, counted):
+        with self.quota_lock:
+            if counted:
+                self.used += 1
+
+            return {'X-RateLimit-Limit' : str(self.quota),
+                    'X-RateLimit-Remaining' : str(max(self.quota - self.used, 0)),
+                    'X-RateLimit-Reset' : str(self.reset_at)}
+
+    def _issue_payload(self, owner, name, number):
+        issue = self.dataset.issues[(owner, name, number)]
+
+        return {'number' : number,
+                'title' : issue['title'],
+                'state' : issue['state'],
+                'body' : issue['body'],
+                'labels' : [{'name' : label} for label in issue['labels']],
+                'html_url' : f"https://github.com/{owner}/{name}/issues/{number}",
+                'url' : f"{self.url}/repos/{owner}/{name}/issues/{number}",
+                'updated_at' : timestamp(issue['updated_at'])}
+
+    def _comment_payload(self, comment):
+        owner, name, number = comment['key']
+
+        return {'id' : comment['id'],
+                'issue_url' : f"{self.url}/repos/{owner}/{name}/issues/{number}",
+                'user' : comment['user'],
+                'body' : comment['body'],
+                'created_at' : timestamp(comment['created_at']),
+                'updated_at' : timestamp(comment['updated_at'])}
+
+    def _page(self, handler, path, query, items):
+        # per_page/page pagination with a `Link: rel="next"` header
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+
+        headers = {}
+
+        if page * per_page < len(items):
+            next_query = {k : v[0] for k, v in query.items()}
+            next_query['page'] = page + 1
+            headers['Link'] = f'<{self.url}{path}?{urlencode(next_query)}>; rel="next"'
+
+        return items[(page - 1) * per_page : page * per_page], headers
+
+    def _conditional(self, handler, endpoint, payload, headers):
+        # answer with a free 304 when the client already has this body
+        etag = '"' + hashlib.sha1(json.dumps(payload).encode('utf-8')).hexdigest() + '"'
+
+        if handler.headers.get('If-None-Match') == etag:
+            return endpoint, 304, None, {**headers, **self._rate_headers(False), 'ETag' : etag}
+
+        if self.used >= self.quota:
+            return endpoint, 403, {'message' : 'API rate limit exceeded'}, self._rate_headers(False)
+
+        return endpoint, 200, payload, {**headers, **self._rate_headers(True), 'ETag' : etag}
+
+    def route(self, handler, method, path, query, body):
+        parts = path.strip('/').split('/')
+
+        with self.dataset.lock:
+            if method == 'GET' and len(parts) == 3 and parts[0] in ('orgs', 'users') and parts[2] == 'repos':
+                repos = [{'name' : name, 'url' : f"{self.url}/repos/{owner}/{name}", 'owner' : {'login' : owner}}
+                         for owner, name in sorted(self.dataset.repos) if owner == parts[1]]
+
+                items, headers = self._page(handler, path, query, repos)
+
+                return self._conditional(handler, f"/{parts[0]}/{{owner}}/repos", items, headers)
+
+            if method == 'GET' and len(parts) == 4 and parts[0] == 'repos' and parts[3] == 'issues':
+                owner, name = parts[1], parts[2]
+
+                issues = [self._issue_payload(owner, name, number) for number in self.dataset.repos.get((owner, name), [])]
+
+                if 'since' in query:
+                    issues = [issue for issue in issues if issue['updated_at'] >= query['since'][0]]
+
+                issues.sort(key = lambda issue : issue['updated_at'], reverse = query.get('direction', ['desc'])[0] == 'desc')
+
+                items, headers = self._page(handler, path, query, issues)
+
+                return self._conditional(handler, "/repos/{owner}/{repo}/issues", items, headers)
+
+            if method == 'GET' and parts[0] == 'repos' and parts[3] == 'issues' and parts[-1] == 'comments':
+                owner, name = parts[1], parts[2]
+
+                # the repo-wide listing, or one issue's comments
+                if len(parts) == 5:
+                    keys = {(owner, name, number) for number in self.dataset.repos.get((owner, name), [])}
+                    endpoint = "/repos/{owner}/{repo}/issues/comments"
+                else:
+                    keys = {(owner, name, int(parts[4]))}
+                    endpoint = "/repos/{owner}/{repo}/issues/{number}/comments"
+
+                comments = [self._comment_payload(comment) for comment in self.dataset.comments.values() if comment['key'] in keys]
+
+                if 'since' in query:
+                    comments = [comment for comment in comments if comment['updated_at'] >= query['since'][0]]
+
+                comments.sort(key = lambda comment : (comment['updated_at'], comment['id']),
+                              reverse = query.get('direction', ['asc'])[0] == 'desc')
+
+                items, headers = self._page(handler, path, query, comments)
+
+                return self._conditional(handler, endpoint, items, headers)
+
+            if len(parts) == 5 and parts[0] == 'repos' and parts[3] == 'issues':
+                key = (parts[1], parts[2], int(parts[4]))
+                endpoint = "/repos/{owner}/{repo}/issues/{number}"
+
+                if key not in self.dataset.issues:
+                    return endpoint, 404, {'message' : 'Not Found'}, {}
+
+                if method == 'PATCH':
+                    changes = json.loads(body.decode('utf-8'))
+                    issue = self.dataset.issues[key]
+
+                    for field in ('title', 'state', 'body'):
+                        if field in changes:
+                            issue[field] = changes[field]
+
+                    if 'labels' in changes:
+                        issue['labels'] = [label['name'] if isinstance(label, dict) else label for label in changes['labels']]
+
+                    issue['updated_at'] = datetime.datetime.utcnow()
+
+                    return endpoint, 200, self._issue_payload(*key), self._rate_headers(True)
+
+                return self._conditional(handler, endpoint, self._issue_payload(*key), {})
+
+            if method == 'POST' and path == '/graphql':
+                return "/graphql", 200, {'data' : self._graphql(json.loads(body.decode('utf-8'))['variables'])}, self._rate_headers(True)
+
+        return path, 404, {'message' : 'Not Found'}, {}
+
+    def _graphql(self, variables):
+        # main.py's aliased issues query: r{n} is described by owner{n}/name{n}/since{n}/after{n}
+        data = {}
+        n = 0
+
+        while f"owner{n}" in variables:
+            owner, name = variables[f"owner{n}"], variables[f"name{n}"]
+            since = variables.get(f"since{n}")
+            after = int(variables.get(f"after{n}") or 0)
+
+            issues = [self._issue_payload(owner, name, number) for number in self.dataset.repos.get((owner, name), [])]
+
+            if since is not None:
+                issues = [issue for issue in issues if issue['updated_at'] >= since]
+
+            issues.sort(key = lambda issue : issue['updated_at'], reverse = True)
+
+            nodes = [{'number' : issue['number'],
+                      'title' : issue['title'],
+                      'state' : issue['state'].upper(),
+                      'body' : issue['body'],
+                      'url' : issue['html_url'],
+                      'updatedAt' : issue['updated_at'],
+                      'labels' : {'nodes' : issue['labels']}} for issue in issues[after:after + 100]]
+
+            data[f"r{n}"] = {'issues' : {'pageInfo' : {'hasNextPage' : after + 100 < len(issues),
+                                                       'endCursor' : str(after + 100)},
+                                         'nodes' : nodes}}
+            n += 1
+
+        return data
+
+class MockNotion(MockServer):
+
+    # at most `rate` requests per second, answering 429 with a Retry-After past that
+    def __init__(self, dataset, latency=0.0, rate=3):
+        super().__init__(dataset, latency)
+        self.rate = rate
+        self.window = []
+        self.window_lock = threading.Lock()
+
+    def _limited(self):
+        if not self.rate:
+            return False
+
+        with self.window_lock:
+            now = time.monotonic()
+            self.window = [t for t in self.window if now - t < 1]
+
+            if len(self.window) >= self.rate:
+                return True
+
+            self.window.append(now)
+            return False
+
+    def _normalize(self, properties):
+        # fill in the fields notion adds to what it was sent, such as `plain_text`
+        normalized = {}
+
+        for name, value in properties.items():
+            value = dict(value)
+
+            for kind in ('title', 'rich_text'):
+                if kind in value:
+                    value[kind] = rich_text(''.join(part['text']['content'] for part in value[kind]))
+                    value['type'] = kind
+
+            normalized[name] = value
+
+        return normalized
+
+    def _content(self, block_type, content):
+        return {'rich_text' : self._normalize({'text' : content})['text']['rich_text']}
+
+    def _block(self, parent_id, page_id, block):
+        block = {'object' : 'block',
+                 'id' : str(uuid.uuid4()),
+                 'type' : block['type'],
+                 block['type'] : self._content(block['type'], block[block['type']])}
+
+        self.dataset.block_pages[block['id']] = (parent_id, page_id)
+        self.dataset.blocks[block['id']] = []
+
+        return block
+
+    def _matches(self, page, query_filter):
+        if query_filter is None:
+            return True
+
+        if query_filter.get('timestamp') == 'last_edited_time':
+            return page['last_edited_time'] >= query_filter['last_edited_time']['on_or_after']
+
+        if 'and' in query_filter:
+            return all(self._matches(page, part) for part in query_filter['and'])
+
+        value = page['properties'].get(query_filter['property'], {})
+
+        if 'rich_text' in query_filter:
+            return ''.join(part['plain_text'] for part in value.get('rich_text', [])) == query_filter['rich_text']['equals']
+
+        if 'number' in query_filter:
+            return value.get('number') == query_filter['number']['equals']
+
+        return True
+
+    def _endpoint(self, parts):
+        # the path as the stats label it, with the id in it replaced
+        return '/' + '/'.join('{id}' if n == 2 else part for n, part in enumerate(parts))
+
+    def route(self, handler, method, path, query, body):
+        parts = path.strip('/').split('/')
+
+        if self._limited():
+            return self._endpoint(parts), 429, {'object' : 'error', 'status' : 429, 'message' : 'rate limited'}, {'Retry-After' : '1'}
+
+        if (handler.headers.get('Notion-Version') or '') < NOTION_VERSION:
+            return self._endpoint(parts), 400, {'object' : 'error', 'status' : 400, 'code' : 'validation_error',
+                               'message' : f"Notion-Version {handler.headers.get('Notion-Version')} is not supported"}, {}
+
+        data = json.loads(body.decode('utf-8')) if body else {}
+        now = notion_timestamp(datetime.datetime.utcnow())
+
+        with self.dataset.lock:
+            pages = self.dataset.pages
+
+            if method == 'GET' and parts[:2] == ['v1', 'databases'] and len(parts) == 3:
+                return "/v1/databases/{id}", 200, {'object' : 'database', 'id' : parts[2]}, {}
+
+            if method == 'POST' and parts[:2] == ['v1', 'databases'] and parts[-1] == 'query':
+                results = [page for page in pages.values() if not page['archived'] and self._matches(page, data.get('filter'))]
+
+                if data.get('sorts'):
+                    results.sort(key = lambda page : page['last_edited_time'], reverse = data['sorts'][0].get('direction') == 'descending')
+
+                start = int(data.get('start_cursor') or 0)
+                size = min(int(data.get('page_size', 100)), 100)
+
+                has_more = start + size < len(results)
+
+                return "/v1/databases/{id}/query", 200, {'object' : 'list',
+                                                         'results' : results[start:start + size],
+                                                         'has_more' : has_more,
+                                                         'next_cursor' : str(start + size) if has_more else None}, {}
+
+            if method == 'POST' and parts == ['v1', 'pages']:
+                page = {'object' : 'page',
+                        'id' : str(uuid.uuid4()),
+                        'created_time' : now,
+                        'last_edited_time' : now,
+                        'archived' : False,
+                        'parent' : data.get('parent'),
+                        'properties' : self._normalize(data['properties'])}
+
+                pages[page['id']] = page
+                self.dataset.blocks[page['id']] = [self._block(page['id'], page['id'], block) for block in data.get('children', [])]
+
+                return "/v1/pages", 200, page, {}
+
+            if method == 'PATCH' and parts[:2] == ['v1', 'pages'] and len(parts) == 3:
+                if parts[2] not in pages:
+                    return "/v1/pages/{id}", 404, NOT_FOUND, {}
+
+                page = pages[parts[2]]
+                page['properties'].update(self._normalize(data.get('properties', {})))
+                page['archived'] = data.get('archived', page['archived'])
+                page['last_edited_time'] = now
+
+                return "/v1/pages/{id}", 200, page, {}
+
+            blocks = self.dataset.blocks
+
+            if method == 'GET' and parts[:2] == ['v1', 'blocks'] and parts[-1] == 'children':
+                children = blocks.get(parts[2], [])
+
+                start = int(query.get('start_cursor', ['0'])[0])
+                size = min(int(query.get('page_size', ['100'])[0]), 100)
+
+                has_more = start + size < len(children)
+
+                return "/v1/blocks/{id}/children", 200, {'object' : 'list',
+                                                         'results' : children[start:start + size],
+                                                         'has_more' : has_more,
+                                                         'next_cursor' : str(start + size) if has_more else None}, {}
+
+            if method == 'PATCH' and parts[:2] == ['v1', 'blocks'] and parts[-1] == 'children':
+                if parts[2] in self.dataset.archived_blocks:
+                    return "/v1/blocks/{id}/children", 400, ARCHIVED_BLOCK, {}
+
+                if parts[2] not in blocks:
+                    return "/v1/blocks/{id}/children", 404, NOT_FOUND, {}
+
+                if len(data.get('children', [])) > 100:
+                    return "/v1/blocks/{id}/children", 400, {'object' : 'error', 'status' : 400, 'code' : 'validation_error',
+                                                             'message' : 'Invalid request'}, {}
+
+                # blocks can be appended to a page or nested under another block
+                page_id = parts[2] if parts[2] in pages else self.dataset.block_pages[parts[2]][1]
+                children = blocks[parts[2]]
+                new = [self._block(parts[2], page_id, block) for block in data['children']]
+
+                position = len(children)
+
+                if data.get('after') is not None:
+                    position = [block['id'] for block in children].index(data['after']) + 1
+
+                children[position:position] = new
+                pages[page_id]['last_edited_time'] = now
+
+                return "/v1/blocks/{id}/children", 200, {'object' : 'list', 'results' : new, 'has_more' : False}, {}
+
+            if method in ('PATCH', 'DELETE') and parts[:2] == ['v1', 'blocks'] and len(parts) == 3:
+                if parts[2] in self.dataset.archived_blocks:
+                    return "/v1/blocks/{id}", 400, ARCHIVED_BLOCK, {}
+
+                parent_id, page_id = self.dataset.block_pages.get(parts[2], (None, None))
+                children = blocks.get(parent_id, [])
+                found = [block for block in children if block['id'] == parts[2]]
+
+                if not found:
+                    return "/v1/blocks/{id}", 404, NOT_FOUND, {}
+
+                block = found[0]
+
+                if method == 'DELETE':
+                    children.remove(block)
+                    block['archived'] = True
+                    self.dataset.archived_blocks.add(block['id'])
+                else:
+                    block[block['type']] = self._content(block['type'], data[block['type']])
+
+                pages[page_id]['last_edited_time'] = now
+
+                return "/v1/blocks/{id}", 200, block, {}
+
+        return path, 404, NOT_FOUND, {}
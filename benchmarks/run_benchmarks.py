@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Offline benchmarks for the sync. Starts the stand-in GitHub and Notion servers from
+# mock_api.py with a synthetic dataset, runs main.py against them in a fresh working
+# directory and reports wall time, requests per endpoint, bytes transferred and the
+# child's peak memory for each scenario.
+#
+#   python benchmarks/run_benchmarks.py --repos 50 --issues 200 --json results.json
+#   python benchmarks/run_benchmarks.py --baseline results.json   # exits 1 on a regression
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_api import Dataset, MockGithub, MockNotion
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# runs inside the child so peak memory is the sync's own, not the benchmark's
+CHILD = """
+import resource, runpy, sys
+try:
+    {code}
+finally:
+    sys.stderr.write("BENCH_MAXRSS=%d\\n" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def run_child(code, workdir, env, verbose=False):
+    started = time.monotonic()
+
+    result = subprocess.run([sys.executable, '-c', CHILD.format(code = code)],
+                            cwd = workdir,
+                            env = env,
+                            stdout = None if verbose else subprocess.DEVNULL,
+                            stderr = subprocess.PIPE,
+                            text = True)
+
+    wall_time = time.monotonic() - started
+
+    peak = None
+
+    for line in result.stderr.splitlines():
+        if line.startswith("BENCH_MAXRSS="):
+            peak = int(line.split("=")[1])
+        elif verbose or result.returncode != 0:
+            print(line, file = sys.stderr)
+
+    return {'wall_time' : round(wall_time, 3), 'peak_rss_kb' : peak, 'returncode' : result.returncode}
+
+def main_flow(*args):
+    return f"sys.argv = ['main.py', *{list(args)!r}]; runpy.run_path({str(ROOT / 'main.py')!r}, run_name='__main__')"
+
+def run_scenario(name, code, servers, workdir, env, verbose=False):
+    for server in servers:
+        server.stats.reset()
+
+    print(f"Running {name}...", file = sys.stderr)
+
+    result = run_child(code, workdir, env, verbose)
+
+    requests = {}
+    statuses = {}
+    bytes_in = 0
+    bytes_out = 0
+
+    for label, server in zip(('github', 'notion'), servers):
+        stats = server.stats.snapshot()
+
+        for endpoint, count in stats['requests'].items():
+            requests[f"{label} {endpoint}"] = count
+
+        for status, count in stats['statuses'].items():
+            statuses[f"{label} {status}"] = count
+
+        # what the client sent is what the server read, and vice versa
+        bytes_out += stats['bytes_in']
+        bytes_in += stats['bytes_out']
+
+    result.update({'requests' : requests,
+                   'total_requests' : sum(requests.values()),
+                   'statuses' : statuses,
+                   'bytes_sent' : bytes_out,
+                   'bytes_received' : bytes_in})
+
+    return result
+
+def make_env(github, notion, args):
+    env = dict(os.environ)
+    env.update({'GITHUB_API_URL' : github.url,
+                'NOTION_API_URL' : notion.url,
+                'GITHUB_KEY' : 'benchmark',
+                'NOTION_KEY' : 'benchmark',
+                'NOTION_DATABASE' : 'benchmark-database',
+                'NOTION_RATE_LIMIT' : str(args.notion_rate or 1000),
+                'SYNC_WORKERS' : str(args.workers),
+                'GITHUB_BACKEND' : args.backend,
+                'PYTHONPATH' : str(ROOT)})
+    return env
+
+def run_benchmarks(args):
+    results = {}
+
+    # full flow: bulk import, the first poll after it, an idle poll, a poll with edits on
+    # both sides, then a reconciliation after issues and pages were deleted, transferred
+    # and duplicated
+    dataset = Dataset(repos = args.repos, issues = args.issues, body_size = args.body_size, seed = args.seed)
+    github = MockGithub(dataset, latency = args.latency, quota = args.github_quota).start()
+    notion = MockNotion(dataset, latency = args.latency, rate = args.notion_rate).start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        (Path(workdir) / 'cache').mkdir()
+        env = make_env(github, notion, args)
+
+        results['import'] = run_scenario('import', main_flow('import'), (github, notion), workdir, env, args.verbose)
+        # the first poll still reads the pages the import wrote, so it isn't idle
+        results['sync_after_import'] = run_scenario('sync_after_import', main_flow(), (github, notion), workdir, env, args.verbose)
+        results['sync_idle'] = run_scenario('sync_idle', main_flow(), (github, notion), workdir, env, args.verbose)
+
+        changed_github = dataset.touch_github(args.change_fraction)
+        changed_notion = dataset.touch_notion(args.change_fraction)
+
+        results['sync_changes'] = run_scenario('sync_changes', main_flow(), (github, notion), workdir, env, args.verbose)
+        results['sync_changes']['changed'] = {'github' : changed_github, 'notion' : changed_notion}
+
+        drift = dataset.drift()
+
+        results['reconcile'] = run_scenario('reconcile', main_flow('reconcile'), (github, notion), workdir, env, args.verbose)
+        results['reconcile']['drift'] = drift
+
+    github.stop()
+    notion.stop()
+
+    # upload_all_issues on its own, into an empty database, like a rebuild from scratch
+    dataset = Dataset(repos = args.repos, issues = args.issues, body_size = args.body_size, seed = args.seed)
+    github = MockGithub(dataset, latency = args.latency, quota = args.github_quota).start()
+    notion = MockNotion(dataset, latency = args.latency, rate = args.notion_rate).start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        (Path(workdir) / 'cache').mkdir()
+        env = make_env(github, notion, args)
+
+        code = f"from notion_github_sync.sync import upload_all_issues; upload_all_issues(cache=True, since=None, workers={args.workers})"
+
+        results['upload_all_issues'] = run_scenario('upload_all_issues', code, (github, notion), workdir, env, args.verbose)
+
+    github.stop()
+    notion.stop()
+
+    return results
+
+def report(results):
+    for name, result in results.items():
+        print(f"\n{name}")
+        print(f"  wall time       {result['wall_time']:.2f}s (exit {result['returncode']})")
+        print(f"  requests        {result['total_requests']}")
+        print(f"  sent/received   {result['bytes_sent']:,} / {result['bytes_received']:,} bytes")
+        print(f"  peak memory     {result['peak_rss_kb']:,} KB" if result['peak_rss_kb'] else "  peak memory     unknown")
+
+        for endpoint, count in sorted(result['requests'].items(), key = lambda item : -item[1]):
+            print(f"    {count:>7}  {endpoint}")
+
+        if result['statuses']:
+            print("  statuses        " + ", ".join(f"{status}: {count}" for status, count in sorted(result['statuses'].items())))
+
+def compare(results, baseline, tolerance):
+    # scenarios that got slower, chattier or hungrier than the baseline by more than `tolerance`
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        for metric in ('wall_time', 'total_requests', 'bytes_received', 'peak_rss_kb'):
+            before = baseline[name].get(metric)
+            after = result.get(metric)
+
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {before} -> {after}")
+
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the sync against local stand-in servers")
+    parser.add_argument('--repos', type = int, default = 50)
+    parser.add_argument('--issues', type = int, default = 200, help = "issues per repo")
+    parser.add_argument('--body-size', type = int, default = 800)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--latency', type = float, default = 0.0, help = "seconds added to every response")
+    parser.add_argument('--github-quota', type = int, default = 100000,
+                        help = "requests per hour before 403s; 5000 matches github, but the client then paces itself to it")
+    parser.add_argument('--notion-rate', type = int, default = 100, help = "requests per second before 429s (0 for none)")
+    parser.add_argument('--change-fraction', type = float, default = 0.05, help = "share of issues edited before sync_changes")
+    parser.add_argument('--workers', type = int, default = 8)
+    parser.add_argument('--backend', choices = ['rest', 'graphql'], default = 'graphql')
+    parser.add_argument('--json', help = "write the results here")
+    parser.add_argument('--baseline', help = "results from an earlier --json run to check for regressions")
+    parser.add_argument('--tolerance', type = float, default = 0.2)
+    parser.add_argument('--verbose', action = 'store_true', help = "show the sync's own output")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent = 2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+# Sync GitHub issues with a Notion database.
+#
+#   from notion_github_sync import SyncEngine
+#
+#   engine = SyncEngine(github_token = ..., notion_token = ..., database_id = ..., orgs = [...])
+#   engine.sync()
+#
+# Importing the package only loads the configuration classes; requests and the clients
+# are loaded by the first command that needs them.
+from .engine import SyncConfig, SyncEngine, current_engine
+
+__all__ = ['SyncConfig', 'SyncEngine', 'current_engine']
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# `python -m notion_github_sync <command>`. Only argparse is imported before the arguments
+# are parsed; the clients and their dependencies load when the command needs them.
+import argparse
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger("notion_github_sync")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog = "notion_github_sync",
+                                     description = "Sync GitHub issues with a Notion database. Configured through "
+                                                   "the environment or a .env file.")
+    commands = parser.add_subparsers(dest = "command", metavar = "command")
+    
+    commands.add_parser("sync", help = "poll github and notion once and apply the changes (the default)")
+    commands.add_parser("import", help = "seed the database from every issue; re-running resumes it")
+    
+    plan = commands.add_parser("plan", help = "print what a run would write and what it would cost, without writing")
+    plan.add_argument("path", nargs = "?", help = "also save the full plan as JSON here")
+    
+    reconcile = commands.add_parser("reconcile", help = "find and repair deleted, transferred, orphaned and duplicated issues")
+    reconcile.add_argument("--dry-run", action = "store_true", help = "only report them")
+    
+    commands.add_parser("daemon", help = "keep running, polling each repo on its own schedule")
+    
+    shard = commands.add_parser("shard", help = "split the repos between N daemon processes")
+    shard.add_argument("processes", nargs = "?", type = int, help = "defaults to one per CPU")
+    
+    # started by `shard`, one per worker process
+    commands.add_parser("shard-worker")
+    
+    return parser.parse_args(argv)
+
+def configure_logging():
+    # without LOG_LEVEL the output stays the plain progress messages; set it (INFO, WARNING, ...)
+    # for leveled, timestamped logging without the per-issue chatter
+    log_level = os.getenv("LOG_LEVEL")
+    
+    if log_level:
+        logging.basicConfig(level = log_level.upper(), format = "%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        logger.addHandler(logging.StreamHandler(sys.stdout))
+        logger.setLevel(logging.DEBUG)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    configure_logging()
+    
+    from .engine import SyncEngine
+    
+    engine = SyncEngine.from_env()
+    
+    if args.command == "import":
+        engine.bulk_import()
+        
+    elif args.command == "plan":
+        # exits with 2 when the run would exceed the github quota or patch too many issues
+        plan, flagged = engine.plan()
+        
+        if args.path:
+            with open(args.path, 'w') as f:
+                json.dump({**plan.summary(engine.config.workers), 'actions' : plan.actions}, f, indent = 2)
+                
+        sys.exit(2 if flagged else 0)
+        
+    elif args.command == "reconcile":
+        engine.reconcile(dry_run = args.dry_run)
+        
+    elif args.command == "daemon":
+        engine.daemon()
+        
+    elif args.command == "shard":
+        # hosts sharing ISSUE_STORE split the repos between each other the same way, and
+        # GITHUB_KEYS (comma separated) spreads the workers over several tokens
+        engine.shard(args.processes)
+        
+    elif args.command == "shard-worker":
+        engine.shard_worker()
+        
+    else:
+        engine.sync()
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+# Long-running and sharded sync daemons
+import os
+from pathlib import Path
+import threading
+import contextvars
+import time
+import heapq
+import signal
+import sys
+import socket
+import subprocess
+import logging
+
+from .metrics import metrics
+from .transport import connection_stats
+from .store import StoreHighWaterMarks, PendingMarks
+from .sync import (discover_repos, upload_all_issues, sync_comments, sync_cached_issues, updated_records, poll_notion_changes,
+                   apply_pending_commands)
+from .webhooks import start_webhook_receiver
+from .engine import current_engine, github, store, notion
+
+logger = logging.getLogger("notion_github_sync")
+
+# Long-running sync that keeps the repo list, notion pages and HTTP sessions warm between
+# cycles. Each repo sits in a priority queue keyed on when it is next due: repos with
+# fresh activity are polled every `min_interval` seconds, and idle ones back off by
+# doubling up to `max_interval`.
+class SyncDaemon:
+    
+    def __init__(self, since, high_water_marks, notion_marks, workers=1, min_interval=60, max_interval=4 * 3600,
+                 notion_interval=300, discovery_interval=3600):
+        self.since = since
+        self.high_water_marks = high_water_marks
+        self.notion_marks = notion_marks
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.notion_interval = notion_interval
+        self.discovery_interval = discovery_interval
+        
+        # (next_due, org, name) entries; `repos` and `intervals` are keyed by (org, name)
+        self.queue = []
+        self.repos = {}
+        self.intervals = {}
+        
+        self.notion_refreshed = float('-inf')
+        self.discovered = 0
+        
+        # a shard worker keeps its own notion checkpoint and only handles its own repos
+        self.notion_mark_key = None
+        
+        self.stopping = threading.Event()
+        
+    def scope(self):
+        # the (org, repo)s this daemon is responsible for, or None for all of them
+        return None
+        
+    def stop(self, signum=None, frame=None):
+        # finish the cycle in flight, then return from `run`
+        logger.info("Shutting down after the current cycle...")
+        self.stopping.set()
+        
+    def discover(self):
+        for (name, url), org in discover_repos():
+            if (org, name) not in self.repos:
+                # new repos are due straight away
+                heapq.heappush(self.queue, (time.monotonic(), org, name))
+                self.intervals[(org, name)] = self.min_interval
+                
+            self.repos[(org, name)] = ((name, url), org)
+            
+        self.discovered = time.monotonic()
+        
+    def reschedule(self, org, name, changed):
+        if changed:
+            interval = self.min_interval
+        else:
+            interval = min(self.intervals[(org, name)] * 2, self.max_interval)
+            
+        self.intervals[(org, name)] = interval
+        heapq.heappush(self.queue, (time.monotonic() + interval, org, name))
+        
+    def due_repos(self):
+        now = time.monotonic()
+        due = []
+        
+        while self.queue and self.queue[0][0] <= now:
+            _, org, name = heapq.heappop(self.queue)
+            
+            # repos that disappeared since discovery just drop out of the queue
+            if (org, name) in self.repos:
+                due.append(self.repos[(org, name)])
+                
+        return due
+        
+    def next_wakeup(self):
+        # seconds until the next repo is due, polling at least every `min_interval`
+        wait = self.queue[0][0] - time.monotonic() if self.queue else self.min_interval
+        
+        return max(min(wait, self.min_interval), 0)
+        
+    def run_cycle(self, due):
+        # the marks only move once the listed issues are diffed, so the repos of a failed
+        # cycle are listed again from where they were when they are retried
+        marks = PendingMarks(self.high_water_marks)
+        
+        changed = upload_all_issues(cache = True, since = self.since, high_water_marks = marks, workers = self.workers,
+                                    repos = due)
+        
+        if current_engine().config.sync_comments:
+            sync_comments(due, workers = self.workers)
+        
+        # only issues github just reported as updated need a github-side check
+        sync_cached_issues(updated_records(), None, workers = self.workers, check_notion = False)
+        marks.commit()
+        
+        # the notion side only looks at pages edited since the last poll
+        if time.monotonic() - self.notion_refreshed >= self.notion_interval:
+            poll_notion_changes(self.notion_marks, workers = self.workers, repos = self.scope(),
+                                mark_key = self.notion_mark_key)
+            self.notion_refreshed = time.monotonic()
+        
+        apply_pending_commands(workers = self.workers, repos = self.scope())
+        
+        github.issue_snapshot.clear()
+        
+        for (org, name), repo_changed in changed.items():
+            self.reschedule(org, name, repo_changed)
+            
+        metrics.gauge("repos_scheduled", len(self.repos))
+        current_engine().export_metrics()
+            
+    def run(self, webhook_secret=None, webhook_port=8080):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        
+        # with webhooks pushing changes, polling is only a slow reconciliation pass
+        if webhook_secret is not None:
+            server, webhook_worker, webhook_stopping = start_webhook_receiver(webhook_secret, port = webhook_port,
+                                                                              workers = self.workers)
+        
+        while not self.stopping.is_set():
+            if not self.repos or time.monotonic() - self.discovered >= self.discovery_interval:
+                try:
+                    self.discover()
+                except Exception as e:
+                    # keep polling the repos we already know about
+                    logger.warning(f"Repo discovery failed: {e}")
+                    self.discovered = time.monotonic()
+            
+            due = self.due_repos()
+            
+            if due:
+                logger.info(f"Syncing {len(due)} due repos")
+                
+                try:
+                    self.run_cycle(due)
+                except Exception as e:
+                    # keep the daemon alive; the failed repos are retried at their current interval
+                    logger.warning(f"Sync cycle failed: {e}")
+                    
+                    github.issue_snapshot.clear()
+                    
+                    for (name, url), org in due:
+                        heapq.heappush(self.queue, (time.monotonic() + self.intervals[(org, name)], org, name))
+                
+            # sleep until the next repo is due, waking early on shutdown
+            self.stopping.wait(self.next_wakeup())
+            
+        if webhook_secret is not None:
+            server.shutdown()
+            webhook_stopping.set()
+            webhook_worker.join()
+            
+        logger.info(f"Github connections: {connection_stats(github.session)}")
+        logger.info(f"Notion connections: {connection_stats(notion.session)}")
+        
+        current_engine().export_metrics()
+
+# A SyncDaemon over one worker's share of the repos, for running several processes or
+# hosts side by side. Ownership is a lease per repo in the shared IssueStore: a heartbeat
+# thread renews this worker's leases every `lease_ttl / 3` seconds and the split is
+# rebalanced every `rebalance_interval`, so the repos of a worker that dies or hangs go
+# to the live ones once its leases expire. A worker only diffs cached records and applies
+# commands for repos it owns. Repo high-water marks are kept in the store, so they move
+# with the lease, and each worker keeps its own notion checkpoint.
+class ShardedSyncDaemon(SyncDaemon):
+    
+    def __init__(self, since, owner, workers=1, lease_ttl=300, rebalance_interval=60, **kwargs):
+        marks = StoreHighWaterMarks(store)
+        
+        super().__init__(since, marks, marks, workers = workers, **kwargs)
+        
+        self.owner = owner
+        self.lease_ttl = lease_ttl
+        self.rebalance_interval = rebalance_interval
+        self.notion_mark_key = ("notion", f"{notion.database_id}/{owner}")
+        
+        # every repo discovered, whoever owns it
+        self.all_repos = {}
+        self.rebalanced = float('-inf')
+        
+    def scope(self):
+        return set(self.repos)
+        
+    def discover(self):
+        # the repo list only needs refreshing every `discovery_interval`, the leases more often
+        if not self.all_repos or time.monotonic() - self.discovered >= self.discovery_interval:
+            self.all_repos = {(org, name) : ((name, url), org) for (name, url), org in discover_repos()}
+            self.discovered = time.monotonic()
+            
+        self.rebalance()
+        
+    def rebalance(self):
+        owned, taken_over = store.acquire_leases(self.owner, list(self.all_repos), self.lease_ttl)
+        owned = set(owned)
+        
+        if owned != set(self.repos):
+            logger.info(f"Shard {self.owner} owns {len(owned)} of {len(self.all_repos)} repos")
+            
+        # repos new to this worker are due straight away
+        for org, name in owned - set(self.repos):
+            heapq.heappush(self.queue, (time.monotonic(), org, name))
+            self.intervals[(org, name)] = self.min_interval
+            
+        self.queue = [entry for entry in self.queue if (entry[1], entry[2]) in owned]
+        heapq.heapify(self.queue)
+        
+        # the previous owner's notion poll may not have reached ours for the repos taken
+        # over, so go back to its checkpoint (or to a full scan if it never polled)
+        for previous in set(taken_over.values()):
+            logger.info(f"Shard {self.owner} took over repos from {previous}")
+            
+            self.notion_marks.rewind(*self.notion_mark_key,
+                                     self.notion_marks.get("notion", f"{notion.database_id}/{previous}"))
+            self.notion_refreshed = float('-inf')
+            
+        self.repos = {repo : self.all_repos[repo] for repo in owned}
+        self.rebalanced = time.monotonic()
+        
+    def due_repos(self):
+        if time.monotonic() - self.rebalanced >= self.rebalance_interval:
+            try:
+                self.rebalance()
+            except Exception as e:
+                # the leases held are still renewed by the heartbeat
+                logger.warning(f"Rebalancing shard {self.owner} failed: {e}")
+                
+        return super().due_repos()
+    
+    def next_wakeup(self):
+        # wake up for rebalancing too, even with no repos of our own
+        return max(min(super().next_wakeup(), self.rebalanced + self.rebalance_interval - time.monotonic()), 0)
+    
+    def heartbeat(self):
+        while not self.stopping.wait(self.lease_ttl / 3):
+            try:
+                store.renew_leases(self.owner, self.lease_ttl)
+            except Exception as e:
+                logger.warning(f"Renewing the leases of shard {self.owner} failed: {e}")
+        
+    def run(self):
+        # started in a copy of this context, so the heartbeat renews this engine's leases
+        threading.Thread(target = contextvars.copy_context().run, args = (self.heartbeat,), daemon = True).start()
+        
+        try:
+            super().run()
+        finally:
+            store.release_leases(self.owner)
+
+def run_shards(processes, github_keys=None):
+    # Start `processes` shard workers of the current engine's config and wait for them. Worker ids are
+    # stable across restarts, so a restarted worker picks up its own notion checkpoint.
+    # GitHub tokens are dealt out round-robin, and each worker gets its slice of the
+    # quota of the token it shares and of this host's notion rate.
+    config = current_engine().config
+    
+    host = socket.gethostname()
+    keys = github_keys or [config.github_token]
+    
+    prometheus_path = config.metrics_textfile
+    summary_path = config.metrics_summary
+    
+    # the package has to be importable by the workers, wherever they are started from
+    package_parent = str(Path(__file__).resolve().parent.parent)
+    python_path = os.pathsep.join(path for path in (package_parent, os.getenv("PYTHONPATH")) if path)
+    
+    children = []
+    
+    for n in range(processes):
+        sharing = len(range(n % len(keys), processes, len(keys)))
+        
+        env = dict(os.environ, **config.environ())
+        env.update(PYTHONPATH = python_path,
+                   SHARD_ID = f"{host}-{n}",
+                   GITHUB_KEY = keys[n % len(keys)],
+                   GITHUB_RATE_SHARE = str(1 / sharing),
+                   NOTION_RATE_LIMIT = str(config.notion_rate / processes),
+                   METRICS_TEXTFILE = str(prometheus_path.with_name(f"{prometheus_path.stem}-{n}{prometheus_path.suffix}")),
+                   METRICS_SUMMARY = str(summary_path.with_name(f"{summary_path.stem}-{n}{summary_path.suffix}")))
+        
+        children.append(subprocess.Popen([sys.executable, "-m", "notion_github_sync", "shard-worker"], env = env))
+        
+    logger.info(f"Started {processes} shard workers with {len(keys)} github tokens")
+        
+    def stop(signum, frame):
+        for child in children:
+            child.send_signal(signal.SIGTERM)
+            
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    # a worker that exits is not restarted; its leases expire and the others take its repos
+    for n, child in enumerate(children):
+        child.wait()
+        logger.info(f"Shard worker {host}-{n} exited with {child.returncode}")
@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+# SyncConfig and SyncEngine: one sync setup (tokens, orgs, database, cache directory) with
+# its clients built on first use. The module-level sync functions reach the clients of the
+# engine active in the current context through the `github`, `notion` and `store` proxies,
+# so several engines can run side by side in one interpreter.
+import os
+import datetime
+import pickle
+import threading
+import contextvars
+import logging
+from pathlib import Path
+from contextlib import contextmanager
+
+logger = logging.getLogger("notion_github_sync")
+
+DEFAULT_ORGS = [
+    'all-but-dissertation',
+    'cornell-cdses',
+    'minimod-nutrition',
+    'staaars-plus',
+    'uganda-rideshare-projects'
+]
+
+class SyncConfig:
+    
+    def __init__(self, github_token=None, notion_token=None, database_id=None, user="amichuda", orgs=None,
+                 github_keys=None, github_api_url="https://api.github.com", notion_api_url="https://api.notion.com",
+                 backend="graphql", cache_dir="cache", store_path=None, workers=8, notion_rate=3,
+                 github_rate_share=1, sync_comments=True, plan_mass_change=0.2, metrics_textfile=None,
+                 metrics_summary=None, webhook_secret=None, webhook_port=8080, reconcile_interval=3600,
+                 lease_ttl=300, shard_id=None, merge_budget=10000):
+        self.github_token = github_token
+        self.notion_token = notion_token
+        self.database_id = database_id
+        self.user = user
+        self.orgs = list(orgs) if orgs is not None else list(DEFAULT_ORGS)
+        
+        # several tokens to spread shard workers over; the first one is used otherwise
+        self.github_keys = list(github_keys) if github_keys else []
+        
+        if self.github_token is None and self.github_keys:
+            self.github_token = self.github_keys[0]
+            
+        # overridable so the sync can be pointed at stand-in servers, e.g. by the benchmarks
+        self.github_api_url = github_api_url
+        self.notion_api_url = notion_api_url
+        self.backend = backend
+        
+        self.cache_dir = Path(cache_dir)
+        self.store_path = Path(store_path) if store_path is not None else self.cache_dir / "issues.sqlite3"
+        
+        # requests are throttled per service by the token buckets, so `workers` only bounds threads
+        self.workers = workers
+        self.notion_rate = notion_rate
+        self.github_rate_share = github_rate_share
+        
+        self.sync_comments = sync_comments
+        self.plan_mass_change = plan_mass_change
+        
+        # rows reconciliation sorts in memory before spilling a sorted run to disk
+        self.merge_budget = merge_budget
+        
+        self.metrics_textfile = Path(metrics_textfile or self.cache_dir / "metrics" / "metrics.prom")
+        self.metrics_summary = Path(metrics_summary or self.cache_dir / "metrics" / "run_summary.json")
+        
+        self.webhook_secret = webhook_secret
+        self.webhook_port = webhook_port
+        self.reconcile_interval = reconcile_interval
+        self.lease_ttl = lease_ttl
+        self.shard_id = shard_id
+        
+    @classmethod
+    def from_env(cls, environ=None):
+        # the settings the command line has always taken from the environment and .env
+        if environ is None:
+            from dotenv import load_dotenv
+            
+            load_dotenv()
+            environ = os.environ
+            
+        def listed(name):
+            return [value.strip() for value in environ.get(name, "").split(",") if value.strip()]
+            
+        return cls(github_token = environ.get("GITHUB_KEY"),
+                   notion_token = environ.get("NOTION_KEY"),
+                   database_id = environ.get("NOTION_DATABASE"),
+                   user = environ.get("GITHUB_USER", "amichuda"),
+                   orgs = listed("GITHUB_ORGS") or None,
+                   github_keys = listed("GITHUB_KEYS"),
+                   github_api_url = environ.get("GITHUB_API_URL", "https://api.github.com"),
+                   notion_api_url = environ.get("NOTION_API_URL", "https://api.notion.com"),
+                   backend = environ.get("GITHUB_BACKEND", "graphql"),
+                   cache_dir = environ.get("SYNC_CACHE_DIR", "cache"),
+                   store_path = environ.get("ISSUE_STORE"),
+                   workers = int(environ.get("SYNC_WORKERS", 8)),
+                   notion_rate = float(environ.get("NOTION_RATE_LIMIT", 3)),
+                   github_rate_share = float(environ.get("GITHUB_RATE_SHARE", 1)),
+                   sync_comments = environ.get("SYNC_COMMENTS", "1") != "0",
+                   plan_mass_change = float(environ.get("PLAN_MASS_CHANGE", 0.2)),
+                   metrics_textfile = environ.get("METRICS_TEXTFILE"),
+                   metrics_summary = environ.get("METRICS_SUMMARY"),
+                   webhook_secret = environ.get("GITHUB_WEBHOOK_SECRET"),
+                   webhook_port = int(environ.get("WEBHOOK_PORT", 8080)),
+                   reconcile_interval = int(environ.get("RECONCILE_INTERVAL", 3600)),
+                   lease_ttl = int(environ.get("SHARD_LEASE_TTL", 300)),
+                   shard_id = environ.get("SHARD_ID"),
+                   merge_budget = int(environ.get("RECONCILE_BUFFER_ROWS", 10000)))
+    
+    def environ(self):
+        # the inverse of from_env, for handing this config to a child process
+        environ = {"GITHUB_USER" : self.user,
+                   "GITHUB_ORGS" : ",".join(self.orgs),
+                   "GITHUB_KEYS" : ",".join(self.github_keys),
+                   "GITHUB_API_URL" : self.github_api_url,
+                   "NOTION_API_URL" : self.notion_api_url,
+                   "GITHUB_BACKEND" : self.backend,
+                   "SYNC_CACHE_DIR" : str(self.cache_dir),
+                   "ISSUE_STORE" : str(self.store_path),
+                   "SYNC_WORKERS" : str(self.workers),
+                   "NOTION_RATE_LIMIT" : str(self.notion_rate),
+                   "GITHUB_RATE_SHARE" : str(self.github_rate_share),
+                   "SYNC_COMMENTS" : "1" if self.sync_comments else "0",
+                   "PLAN_MASS_CHANGE" : str(self.plan_mass_change),
+                   "METRICS_TEXTFILE" : str(self.metrics_textfile),
+                   "METRICS_SUMMARY" : str(self.metrics_summary),
+                   "WEBHOOK_PORT" : str(self.webhook_port),
+                   "RECONCILE_INTERVAL" : str(self.reconcile_interval),
+                   "SHARD_LEASE_TTL" : str(self.lease_ttl),
+                   "RECONCILE_BUFFER_ROWS" : str(self.merge_budget)}
+        
+        optional = {"GITHUB_KEY" : self.github_token,
+                    "NOTION_KEY" : self.notion_token,
+                    "NOTION_DATABASE" : self.database_id,
+                    "GITHUB_WEBHOOK_SECRET" : self.webhook_secret,
+                    "SHARD_ID" : self.shard_id}
+        
+        environ.update({name : value for name, value in optional.items() if value is not None})
+        
+        return environ
+
+_active = contextvars.ContextVar("notion_github_sync_engine", default = None)
+_default = None
+_default_lock = threading.Lock()
+
+def current_engine():
+    # the engine activated in this context, else one configured from the environment
+    global _default
+    
+    engine = _active.get()
+    
+    if engine is not None:
+        return engine
+        
+    with _default_lock:
+        if _default is None:
+            _default = SyncEngine(SyncConfig.from_env())
+            
+        return _default
+
+# Stands in for one of the current engine's clients, so that code written against the
+# old module globals (`github.get_all_issue_urls()`, `store.get(...)`) keeps working
+class ClientProxy:
+    
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        
+    def _target(self):
+        return getattr(current_engine(), self._name)
+        
+    def __getattr__(self, attribute):
+        return getattr(self._target(), attribute)
+        
+    def __setattr__(self, attribute, value):
+        setattr(self._target(), attribute, value)
+        
+    def __len__(self):
+        return len(self._target())
+        
+    def __repr__(self):
+        return f"<{self._name} of {current_engine()!r}>"
+
+github = ClientProxy("github")
+notion = ClientProxy("notion")
+store = ClientProxy("store")
+
+class SyncEngine:
+    
+    def __init__(self, config=None, **options):
+        # either a SyncConfig or its keyword arguments
+        self.config = config if config is not None else SyncConfig(**options)
+        
+        self._clients = {}
+        self.lock = threading.RLock()
+        self.prepared = False
+        
+    @classmethod
+    def from_env(cls):
+        return cls(SyncConfig.from_env())
+        
+    def __repr__(self):
+        return f"SyncEngine(database_id={self.config.database_id!r}, orgs={self.config.orgs!r})"
+        
+    def _client(self, name, build):
+        # built on first use, so an engine that is only configured imports and connects nothing
+        with self.lock:
+            if name not in self._clients:
+                self._clients[name] = build()
+                
+            return self._clients[name]
+            
+    @property
+    def github(self):
+        def build():
+            from .github import GithubData, ResponseCache
+            
+            if not self.config.github_token:
+                raise Exception("No github token configured; set GITHUB_KEY or pass github_token")
+                
+            return GithubData(self.config.user, self.config.github_token,
+                              orgs = self.config.orgs,
+                              base_url = self.config.github_api_url,
+                              response_cache = ResponseCache(self.config.cache_dir / "http"),
+                              backend = self.config.backend,
+                              rate_share = self.config.github_rate_share,
+                              pool_size = self.config.workers * 2)
+        
+        return self._client("github", build)
+        
+    @property
+    def notion(self):
+        def build():
+            from .notion import NotionDatabase
+            
+            if not self.config.notion_token or not self.config.database_id:
+                raise Exception("No notion token or database configured; set NOTION_KEY and NOTION_DATABASE "
+                                "or pass notion_token and database_id")
+            
+            return NotionDatabase(self.config.database_id, self.config.notion_token,
+                                  base_url = self.config.notion_api_url,
+                                  rate = self.config.notion_rate,
+                                  pool_size = self.config.workers * 2)
+        
+        return self._client("notion", build)
+        
+    @property
+    def store(self):
+        def build():
+            from .store import IssueStore
+            
+            return IssueStore(self.config.store_path)
+            
+        return self._client("store", build)
+        
+    @property
+    def high_water_marks(self):
+        # repos without a high-water mark yet fall back to the time file
+        def build():
+            from .store import HighWaterMarks
+            
+            return HighWaterMarks(self.config.cache_dir / 'high_water_marks.pickle')
+            
+        return self._client("high_water_marks", build)
+        
+    @property
+    def notion_marks(self):
+        def build():
+            from .store import HighWaterMarks
+            
+            return HighWaterMarks(self.config.cache_dir / 'notion_last_edited.pickle')
+            
+        return self._client("notion_marks", build)
+        
+    @property
+    def since(self):
+        # the time of the first run, saved so later runs look back to it
+        def build():
+            path = self.config.cache_dir / 'time_last_run.pickle'
+            
+            if path.is_file():
+                logger.info("found time file; reading...")
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+                    
+            logger.info("didn't find time file")
+            now_minus_twenty = datetime.datetime.utcnow() + datetime.timedelta(minutes=-20)
+            
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'wb') as f:
+                pickle.dump(now_minus_twenty, f)
+                
+            return now_minus_twenty
+            
+        return self._client("since", build)
+        
+    @contextmanager
+    def activate(self):
+        # route the module-level functions to this engine's clients within the block,
+        # including the worker threads they start
+        token = _active.set(self)
+        
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+            
+    def prepare(self):
+        # every command writes the time file if it is missing, and does the one-time move of
+        # the old cache/*.json files and command directories into the store
+        with self.lock:
+            if not self.prepared:
+                self.since
+                
+                self.store.migrate_directory(self.config.cache_dir, self.config.cache_dir / "json_backup")
+                self.store.migrate_command_directories(self.config.cache_dir)
+                self.prepared = True
+                
+    def export_metrics(self):
+        from .metrics import metrics
+        
+        metrics.export(self.config.metrics_textfile, self.config.metrics_summary)
+        
+    def log_connections(self):
+        from .transport import connection_stats
+        
+        logger.info(f"Github connections: {connection_stats(self.github.session)}")
+        logger.info(f"Notion connections: {connection_stats(self.notion.session)}")
+        
+    def sync(self):
+        # one polling run: new and updated issues and comments from github, pages edited in
+        # notion, then the commands they produced
+        from .sync import (discover_repos, upload_all_issues, sync_comments, sync_cached_issues, updated_records,
+                           poll_notion_changes, apply_pending_commands)
+        from .store import PendingMarks
+        
+        workers = self.config.workers
+        
+        with self.activate():
+            self.prepare()
+            since = self.since
+            
+            logger.info(f"Check issues since {since}")
+            repos = discover_repos()
+            
+            # the marks only move once the listed issues are diffed, so a run that fails
+            # before then lists them again
+            marks = PendingMarks(self.high_water_marks)
+            
+            try:
+                # check for any new issues created since NOW (using ISO 8601 format)
+                upload_all_issues(cache=True, since = since, high_water_marks = marks, workers = workers, repos = repos)
+                
+                # new and edited comments onto the issues' pages
+                if self.config.sync_comments:
+                    sync_comments(repos, workers = workers)
+                    
+                # Check for changes in github to be patched to notion, for the issues the
+                # listings since each repo's mark just returned
+                sync_cached_issues(updated_records(), None, workers = workers, check_notion = False)
+                marks.commit()
+                
+                # ...and for pages edited in notion since the last run, to be patched to github
+                poll_notion_changes(self.notion_marks, workers = workers)
+                
+                apply_pending_commands(workers = workers)
+            finally:
+                # a warm engine runs again later, and the next run lists its own updates
+                self.github.issue_snapshot.clear()
+            
+            self.log_connections()
+            self.export_metrics()
+            
+    def bulk_import(self, restart=False):
+        # seed the database from every issue; re-running resumes it
+        from .sync import bulk_import
+        
+        with self.activate():
+            self.prepare()
+            
+            bulk_import(workers = self.config.workers, high_water_marks = self.high_water_marks, restart = restart,
+                        notion_marks = self.notion_marks, comments = self.config.sync_comments)
+            self.export_metrics()
+            
+    def plan(self):
+        # what a run would write and what it would cost, as a SyncPlan, and whether it
+        # would exceed the github quota or patch too many issues
+        from .plan import plan_sync, report_plan
+        
+        with self.activate():
+            self.prepare()
+            since = self.since
+            
+            plan = plan_sync(since, self.high_water_marks, self.notion_marks, workers = self.config.workers)
+            
+            return plan, report_plan(plan, workers = self.config.workers)
+            
+    def reconcile(self, dry_run=False):
+        from .reconcile import reconcile
+        
+        with self.activate():
+            self.prepare()
+            
+            result = reconcile(workers = self.config.workers, repair = not dry_run)
+            self.export_metrics()
+            
+            return result
+            
+    def daemon(self):
+        # keep running, polling each repo on its own schedule until SIGTERM or SIGINT
+        from .daemon import SyncDaemon
+        
+        webhook_secret = self.config.webhook_secret
+        
+        # webhooks deliver changes within seconds, so polling can back off to a reconciliation pass
+        min_interval = self.config.reconcile_interval if webhook_secret else 60
+        
+        with self.activate():
+            self.prepare()
+            since = self.since
+            
+            SyncDaemon(since, self.high_water_marks, self.notion_marks, workers = self.config.workers,
+                       min_interval = min_interval, max_interval = max(min_interval, 4 * 3600)).run(
+                           webhook_secret = webhook_secret, webhook_port = self.config.webhook_port)
+    
+    def shard(self, processes=None):
+        # split the repos between `processes` daemon processes (one per CPU by default)
+        from .daemon import run_shards
+        from .store import StoreHighWaterMarks
+        
+        with self.activate():
+            self.prepare()
+            
+            StoreHighWaterMarks(self.store).seed(self.high_water_marks)
+            
+            run_shards(processes or os.cpu_count(), self.config.github_keys)
+            
+    def shard_worker(self):
+        import socket
+        from .daemon import ShardedSyncDaemon
+        
+        lease_ttl = self.config.lease_ttl
+        
+        with self.activate():
+            self.prepare()
+            since = self.since
+            
+            ShardedSyncDaemon(since, self.config.shard_id or f"{socket.gethostname()}-{os.getpid()}",
+                              workers = self.config.workers, lease_ttl = lease_ttl,
+                              rebalance_interval = min(60, lease_ttl / 3)).run()
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+# GitHub client: REST listings with conditional GETs against an on-disk response cache,
+# and GraphQL batches of issues for many repos per request
+import requests
+import json
+import os
+from pathlib import Path
+import datetime
+import hashlib
+import threading
+import logging
+
+from .transport import GithubRateLimiter, make_session, rate_limited_request
+
+logger = logging.getLogger("notion_github_sync")
+
+# Raised when github answers that the issue being written to no longer exists (404) or
+# was deleted (410), rather than the request failing
+class IssueGone(Exception):
+    pass
+
+# ETag/Last-Modified validators and bodies per URL, kept on disk and evicting
+# the least recently used entries once the directory grows past `max_bytes`
+class ResponseCache:
+    
+    def __init__(self, path="cache/http", max_bytes=50 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        
+        self.sizes = {p.name : p.stat().st_size for p in self.path.glob("*.json")} if self.path.is_dir() else {}
+        self.lock = threading.Lock()
+        
+    def _entry_path(self, key):
+        return self.path / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+        
+    def get(self, key):
+        path = self._entry_path(key)
+        
+        # another thread can evict the entry at any point, so a missing or half-gone file
+        # is just a miss
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+                
+            # touch so eviction treats it as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        
+        return entry
+    
+    def set(self, key, entry):
+        self.path.mkdir(parents=True, exist_ok=True)
+        
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+            
+        os.replace(tmp_path, path)
+        
+        with self.lock:
+            self.sizes[path.name] = path.stat().st_size
+            
+            self._evict()
+        
+    def _evict(self):
+        total = sum(self.sizes.values())
+        
+        if total <= self.max_bytes:
+            return
+        
+        def last_used(name):
+            try:
+                return (self.path / name).stat().st_mtime
+            except FileNotFoundError:
+                return 0
+        
+        for name in sorted(self.sizes, key = last_used):
+            (self.path / name).unlink(missing_ok=True)
+            total -= self.sizes.pop(name)
+            
+            if total <= self.max_bytes:
+                break
+
+class GithubData:
+        
+    def __init__(self, username, token, orgs=None, base_url="https://api.github.com", response_cache=None,
+                 backend="rest", graphql_batch_size=20, rate_share=1, pool_size=16):
+        self.username =  username
+        self.token = token
+        self.base_url = base_url
+        
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        
+        # "graphql" fetches issues for many repos per request, "rest" is one listing per repo
+        self.backend = backend
+        self.graphql_batch_size = graphql_batch_size
+        
+        # each client paces itself to its token's quota over its own connection pool
+        self.limiter = GithubRateLimiter(share = rate_share)
+        self.session = make_session(pool_size = pool_size)
+        
+        # issues fetched during this run, keyed by (org, repo, number), so
+        # github_command can skip the per-issue GET for them
+        self.issue_snapshot = {}
+        
+        self.orgs = list(orgs) if orgs is not None else []
+    
+    @property
+    def headers(self):
+        return {"Authorization": "token " + self.token, 
+                                          "Accept": "application/vnd.github.v3+json"}
+        
+    def request(self, method, url, **kwargs):
+        return rate_limited_request(self.limiter, self.session, method, url, service = "github", **kwargs)
+        
+    def get(self, url, params=None, headers=None):
+        # conditional GET: a 304 doesn't count against the rate limit and has no body
+        headers = dict(headers if headers is not None else self.headers)
+        
+        key = requests.Request('GET', url, params = params).prepare().url
+        
+        entry = self.response_cache.get(key)
+        
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        response = self.request('get', url,
+                                params = params,
+                                headers = headers)
+        
+        if response.status_code == 304 and entry is not None:
+            # unchanged, so serve the stored body as if github had sent it
+            response.status_code = 200
+            response._content = entry['body'].encode('utf-8')
+            
+            if entry['link']:
+                response.headers['Link'] = entry['link']
+                
+        elif response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+            self.response_cache.set(key, {'etag' : response.headers.get('ETag'),
+                                          'last_modified' : response.headers.get('Last-Modified'),
+                                          'link' : response.headers.get('Link'),
+                                          'body' : response.content.decode('utf-8')})
+            
+        return response
+        
+    def _paginate(self, url, params=None):
+        # follow the `Link: rel="next"` header, yielding one item at a time
+        while url is not None:
+            response = self.get(url, params = params)
+            
+            if response.status_code != 200:
+                raise Exception(f'Response Status: {response.status_code}')
+            
+            yield from response.json()
+            
+            # the next link already carries the query string
+            url = response.links.get('next', {}).get('url')
+            params = None
+        
+    def _get_user_repos(self):
+        return list(self._paginate(f'{self.base_url}/users/{self.username}/repos',
+                                   params = {"per_page" : 100}))
+        
+    def _get_org_repos(self, org):
+        return list(self._paginate(f'{self.base_url}/orgs/{org}/repos',
+                                   params = {"per_page" : 100}))
+    
+    def _get_repo_name(self, repo):
+        return repo['name']
+    
+    def _get_repo_url(self, repo):
+        return repo['url']
+    
+    def _get_issues_url(self, repo_url):
+        return f"{self._get_repo_url(repo_url)}/issues"
+        
+    def get_all_issue_urls(self):
+        
+        # request each org
+        repo_list = []
+        
+        for org in self.orgs:
+            repo_list.append(self._get_org_repos(org))
+            
+        repo_list.append(self._get_user_repos())
+            
+        # one pass over the listings, rather than concatenating them pairwise
+        flattened_repo_list = [repo for repos in repo_list for repo in repos]
+        
+        # [((name, issues_url), owner), ...]: repos are told apart by owner and name, as
+        # two owners can have a repo of the same name, and one listed twice is kept once
+        seen = set()
+        repos = []
+        
+        for r in flattened_repo_list:
+            key = (r['owner']['login'], self._get_repo_name(r))
+            
+            if key not in seen:
+                seen.add(key)
+                repos.append(((self._get_repo_name(r), self._get_issues_url(r)), r['owner']['login']))
+                
+        return repos
+    
+    def iter_issues(self, url, since=None):
+        
+        # newest updates first, so we can stop as soon as we pass `since`
+        params = {'state' : "all", "per_page" : 100, "sort" : "updated", "direction" : "desc"}
+        
+        # let github do the filtering so unchanged issues are never sent
+        if since is not None:
+            params['since'] = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+        
+        for issue in self._paginate(url, params = params):
+            
+            # an issue updated in the mark's own second may not have been listed yet, so
+            # those come again and turn out unchanged if they were
+            if since is not None and datetime.datetime.strptime(issue['updated_at'], "%Y-%m-%dT%H:%M:%SZ") < since:
+                logger.debug(f"Reached issues updated before {since}, stopping")
+                break
+            
+            # the REST listing includes pull requests; graphql's `issues` doesn't, and
+            # both backends have to agree on what an issue is
+            if 'pull_request' in issue:
+                continue
+            
+            yield issue
+            
+    def iter_comments(self, url, since=None):
+        # comments on every issue of the repo whose issues `url` is, updated on or after
+        # `since`, oldest update first: one paged listing instead of a request per issue
+        params = {"per_page" : 100, "sort" : "updated", "direction" : "asc"}
+        
+        if since is not None:
+            params['since'] = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+            
+        return self._paginate(f"{url}/comments", params = params)
+        
+    def iter_issue_comments(self, api_url):
+        # every comment on the issue whose API url is `api_url`, oldest first
+        return self._paginate(f"{api_url}/comments", params = {"per_page" : 100})
+        
+    def graphql(self, query, variables):
+        response = self.request('post', f'{self.base_url}/graphql',
+                                  headers = self.headers,
+                                  data = json.dumps({'query' : query, 'variables' : variables}),
+                                  idempotent = True)
+        
+        if response.status_code != 200:
+            raise Exception(f'Response Status: {response.status_code}')
+        
+        response = response.json()
+        
+        if response.get('errors'):
+            raise Exception(response['errors'])
+        
+        return response['data']
+    
+    def _graphql_issues_query(self, count):
+        # one aliased `repository` field per repo, each with its own cursor and `since`
+        arguments = []
+        fields = []
+        
+        for n in range(count):
+            arguments.append(f"$owner{n}: String!, $name{n}: String!, $since{n}: DateTime, $after{n}: String")
+            fields.append(f"""
+                r{n}: repository(owner: $owner{n}, name: $name{n}) {{
+                    issues(first: 100, after: $after{n}, filterBy: {{since: $since{n}}}, orderBy: {{field: UPDATED_AT, direction: DESC}}) {{
+                        pageInfo {{ hasNextPage endCursor }}
+                        nodes {{
+                            number title state body url updatedAt
+                            labels(first: 100) {{ nodes {{ name }} }}
+                        }}
+                    }}
+                }}""")
+            
+        return f"query({', '.join(arguments)}) {{{''.join(fields)}\n}}"
+    
+    def _graphql_to_rest(self, node, org, name):
+        # shape a graphql issue like the REST payload the rest of the sync expects
+        return {'number' : node['number'],
+                'title' : node['title'],
+                'state' : node['state'].lower(),
+                'body' : node['body'],
+                'html_url' : node['url'],
+                'url' : f"{self.base_url}/repos/{org}/{name}/issues/{node['number']}",
+                'updated_at' : node['updatedAt'],
+                'labels' : [{'name' : label['name']} for label in node['labels']['nodes']]}
+    
+    def request_issues_graphql(self, repos):
+        # `repos` is a list of (org, name, since); returns {(org, name) : [issues]} with
+        # only the issues updated since each repo's `since`
+        issues = {(org, name) : [] for org, name, _ in repos}
+        
+        for repo, page, done in self.iter_issues_graphql(repos):
+            issues[repo].extend(page)
+            
+        return issues
+        
+    def iter_issues_graphql(self, repos):
+        # the same listing as request_issues_graphql, as ((org, name), [issues], done) for each
+        # page of each repo as it arrives, where `done` marks a repo's last page
+        cursors = {(org, name) : None for org, name, _ in repos}
+        since = {(org, name) : repo_since for org, name, repo_since in repos}
+        
+        # keep querying the repos that still have pages left
+        pending = list(cursors)
+        
+        while pending:
+            variables = {}
+            
+            for n, (org, name) in enumerate(pending):
+                variables[f"owner{n}"] = org
+                variables[f"name{n}"] = name
+                variables[f"since{n}"] = since[(org, name)].strftime("%Y-%m-%dT%H:%M:%SZ") if since[(org, name)] is not None else None
+                variables[f"after{n}"] = cursors[(org, name)]
+                
+            data = self.graphql(self._graphql_issues_query(len(pending)), variables)
+            
+            next_pending = []
+            
+            for n, (org, name) in enumerate(pending):
+                connection = data[f"r{n}"]['issues']
+                has_next = connection['pageInfo']['hasNextPage']
+                
+                if has_next:
+                    cursors[(org, name)] = connection['pageInfo']['endCursor']
+                    next_pending.append((org, name))
+                    
+                yield (org, name), [self._graphql_to_rest(node, org, name) for node in connection['nodes']], not has_next
+                
+            pending = next_pending
+            
+    def update_issue(self, owner, repo, issue_number):
+        pass
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Sorted streams of (key, item) pairs that don't have to fit in memory, and a merge-join
+# over them
+import os
+import heapq
+import pickle
+import tempfile
+import itertools
+import logging
+
+from .metrics import metrics
+
+logger = logging.getLogger("notion_github_sync")
+
+def first(pair):
+    return pair[0]
+
+# Collects (key, item) pairs and gives them back sorted by key. Up to `budget` pairs are
+# held and sorted in memory; each time the buffer fills up it is sorted and spilled to a
+# run file in `directory`, and iterating merges the runs back a pair at a time. Items
+# with equal keys keep the order they were added in.
+class SortedRuns:
+    
+    def __init__(self, budget=10000, directory=None):
+        self.budget = max(int(budget), 1)
+        self.directory = directory
+        self.buffer = []
+        self.runs = []
+        self.count = 0
+        
+    def add(self, key, item):
+        self.buffer.append((key, item))
+        self.count += 1
+        
+        if len(self.buffer) >= self.budget:
+            self.spill()
+            
+    def spill(self):
+        if not self.buffer:
+            return
+            
+        self.buffer.sort(key = first)
+        
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok = True)
+            
+        descriptor, path = tempfile.mkstemp(prefix = "run-", suffix = ".pickle", dir = self.directory)
+        
+        # one pickle per pair, so that reading the run back holds one pair at a time
+        with os.fdopen(descriptor, 'wb') as f:
+            for pair in self.buffer:
+                pickle.dump(pair, f, protocol = pickle.HIGHEST_PROTOCOL)
+                
+        self.runs.append(path)
+        self.buffer = []
+        
+        metrics.count("merge_runs_spilled")
+        
+    def read_run(self, path):
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+                    
+    def __iter__(self):
+        self.buffer.sort(key = first)
+        
+        if not self.runs:
+            return iter(self.buffer)
+            
+        # runs come first on ties since they were filled first
+        return heapq.merge(*[self.read_run(path) for path in self.runs], self.buffer, key = first)
+        
+    def __len__(self):
+        return self.count
+        
+    def close(self):
+        for path in self.runs:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+                
+        self.runs = []
+        self.buffer = []
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc_info):
+        self.close()
+
+def merge_join(*streams):
+    # (key, [items of the first stream], [items of the second], ...) for every key in any of
+    # `streams`, each an iterable of (key, item) pairs sorted by key. Only the pairs of the
+    # current key are held, so sorted streams of any length can be joined
+    def tagged(n, stream):
+        for key, item in stream:
+            yield key, n, item
+            
+    merged = heapq.merge(*[tagged(n, stream) for n, stream in enumerate(streams)], key = lambda entry : entry[:2])
+    
+    for key, entries in itertools.groupby(merged, key = first):
+        matched = tuple([] for _ in streams)
+        
+        for _, n, item in entries:
+            matched[n].append(item)
+            
+        yield (key, *matched)
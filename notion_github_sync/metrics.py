@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Phase timings, request counts and latency histograms, written out as a Prometheus
+# textfile and a JSON summary after each run
+import json
+import os
+from pathlib import Path
+import datetime
+import re
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("notion_github_sync")
+
+# path patterns collapsed into one endpoint label each, so metrics don't get a series per issue
+ENDPOINT_PATTERNS = [
+    (re.compile(r'^/repos/[^/]+/[^/]+/issues/comments/\d+$'), '/repos/{owner}/{repo}/issues/comments/{id}'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/issues/comments$'), '/repos/{owner}/{repo}/issues/comments'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/issues/\d+$'), '/repos/{owner}/{repo}/issues/{number}'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/issues$'), '/repos/{owner}/{repo}/issues'),
+    (re.compile(r'^/orgs/[^/]+/repos$'), '/orgs/{org}/repos'),
+    (re.compile(r'^/users/[^/]+/repos$'), '/users/{user}/repos'),
+    (re.compile(r'^/v1/databases/[^/]+/query$'), '/v1/databases/{id}/query'),
+    (re.compile(r'^/v1/databases/[^/]+/?$'), '/v1/databases/{id}'),
+    (re.compile(r'^/v1/pages/[^/]+$'), '/v1/pages/{id}'),
+    (re.compile(r'^/v1/blocks/[^/]+/children$'), '/v1/blocks/{id}/children'),
+    (re.compile(r'^/v1/blocks/[^/]+$'), '/v1/blocks/{id}'),
+]
+
+def endpoint_label(method, url):
+    path = urlsplit(url).path
+    
+    for pattern, label in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            path = label
+            break
+        
+    return f"{method.upper()} {path}"
+
+# Per-run instrumentation: phase timers, HTTP calls per endpoint with latency
+# histograms and status counts, counters and gauges. Exported as a Prometheus
+# textfile (for node_exporter's textfile collector) and a JSON run summary
+class Metrics:
+    
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+        
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.phases = {}
+            self.requests = {}
+            self.counters = {}
+            self.gauges = {}
+        
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            
+            with self.lock:
+                seconds, count = self.phases.get(name, (0, 0))
+                self.phases[name] = (seconds + elapsed, count + 1)
+                
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+            
+    def observe_request(self, service, method, url, status, seconds):
+        key = (service, endpoint_label(method, url))
+        
+        with self.lock:
+            entry = self.requests.setdefault(key, {'count' : 0, 'seconds' : 0, 'statuses' : {},
+                                                   'buckets' : [0] * len(self.BUCKETS)})
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+            
+            for n, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][n] += 1
+                    
+    def summary(self):
+        with self.lock:
+            status_totals = {}
+            
+            for entry in self.requests.values():
+                for status, count in entry['statuses'].items():
+                    status_totals[status] = status_totals.get(status, 0) + count
+            
+            return {'started' : datetime.datetime.utcfromtimestamp(self.started).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    'duration_seconds' : round(time.time() - self.started, 3),
+                    'phases' : {name : {'seconds' : round(seconds, 3), 'count' : count}
+                                for name, (seconds, count) in self.phases.items()},
+                    'requests' : {f"{service} {endpoint}" : {'count' : entry['count'],
+                                                             'mean_seconds' : round(entry['seconds'] / entry['count'], 4),
+                                                             'statuses' : {str(k) : v for k, v in entry['statuses'].items()}}
+                                  for (service, endpoint), entry in self.requests.items()},
+                    'status_totals' : {str(k) : v for k, v in status_totals.items()},
+                    'not_modified' : status_totals.get(304, 0),
+                    'rate_limited' : status_totals.get(429, 0),
+                    'server_errors' : sum(v for k, v in status_totals.items() if k >= 500),
+                    'counters' : dict(self.counters),
+                    'gauges' : dict(self.gauges)}
+        
+    def prometheus(self):
+        lines = []
+        
+        with self.lock:
+            lines.append("# TYPE notion_github_sync_phase_seconds counter")
+            for name, (seconds, _) in sorted(self.phases.items()):
+                lines.append(f'notion_github_sync_phase_seconds{{phase="{name}"}} {seconds:.6f}')
+                
+            lines.append("# TYPE notion_github_sync_requests_total counter")
+            for (service, endpoint), entry in sorted(self.requests.items()):
+                for status, count in sorted(entry['statuses'].items()):
+                    lines.append(f'notion_github_sync_requests_total{{service="{service}",endpoint="{endpoint}",status="{status}"}} {count}')
+                    
+            lines.append("# TYPE notion_github_sync_request_seconds histogram")
+            for (service, endpoint), entry in sorted(self.requests.items()):
+                labels = f'service="{service}",endpoint="{endpoint}"'
+                
+                for bound, count in zip(self.BUCKETS, entry['buckets']):
+                    le = "+Inf" if bound == float('inf') else bound
+                    lines.append(f'notion_github_sync_request_seconds_bucket{{{labels},le="{le}"}} {count}')
+                    
+                lines.append(f'notion_github_sync_request_seconds_sum{{{labels}}} {entry["seconds"]:.6f}')
+                lines.append(f'notion_github_sync_request_seconds_count{{{labels}}} {entry["count"]}')
+                
+            lines.append("# TYPE notion_github_sync_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'notion_github_sync_events_total{{event="{name}"}} {value}')
+                
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE notion_github_sync_{name} gauge")
+                lines.append(f"notion_github_sync_{name} {value}")
+                
+            lines.append("# TYPE notion_github_sync_last_run_timestamp_seconds gauge")
+            lines.append(f"notion_github_sync_last_run_timestamp_seconds {time.time():.0f}")
+            
+        return "\n".join(lines) + "\n"
+    
+    def export(self, prometheus_path=None, summary_path=None):
+        # both written through a temporary file, so a scraper never reads half a file
+        for path, content in ((prometheus_path, self.prometheus), (summary_path, lambda : json.dumps(self.summary(), indent = 2))):
+            if path is None:
+                continue
+            
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + '.tmp')
+            
+            with open(tmp_path, 'w') as f:
+                f.write(content())
+                
+            os.replace(tmp_path, path)
+
+metrics = Metrics()
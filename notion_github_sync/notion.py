@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+# Notion client for the issues database: rows, their properties and their body blocks
+import json
+import difflib
+import logging
+
+from .metrics import metrics
+from .transport import TokenBucket, make_session, rate_limited_request
+from .records import COMMENTS_TOGGLE, NOTION_BLOCK_BATCH, paragraph_block, block_digest, body_chunks, page_key
+
+logger = logging.getLogger("notion_github_sync")
+
+# Raised by the block methods when notion reports the block (or page) they write to is
+# gone, deleted or archived, rather than the request failing
+class BlockGone(Exception):
+    pass
+
+def check_block_response(response):
+    # a block that doesn't exist is a 404 object_not_found; one deleted in notion stays
+    # as an archived block, which can't be edited and answers a 400
+    if response.status_code == 404:
+        raise BlockGone(response.content)
+    
+    if response.status_code == 400 and b'archived' in response.content:
+        raise BlockGone(response.content)
+    
+    if response.status_code != 200:
+        raise Exception(response.content)
+
+#TODO: methods that create the table if it doesn't exist (it's empty if it isn't equivalent or something?)
+class NotionDatabase:
+    
+    def __init__(self, database_id, token, base_url="https://api.notion.com", rate=3, pool_size=16):
+        self.database_id = database_id
+        self.token = token
+        self.base_url = base_url
+            
+        # block content is under `rich_text` from 2022-02-22 on, and the database query's
+        # `timestamp` filter on last_edited_time needs 2022-06-28
+        self.headers = {"Authorization": "Bearer " + token, 
+                                        "Content-Type": "application/json",
+                                        "Notion-Version" : "2022-06-28"}
+        
+        self.limiter = TokenBucket(rate = rate, capacity = 3)
+        self.session = make_session(pool_size = pool_size)
+            
+    def request(self, method, url, **kwargs):
+        return rate_limited_request(self.limiter, self.session, method, url, service = "notion", **kwargs)
+    
+    def request_database(self):
+        return self.request('get', f'{self.base_url}/v1/databases/{self.database_id}/', 
+                            headers = self.headers)
+    
+    def post_page(self, data):
+        return self.request('post', f'{self.base_url}/v1/pages',
+                                headers=self.headers,
+                                data = json.dumps(data)
+                                )
+    
+    def query_database(self, query_dict):
+        # a query only reads, so it can be retried like a GET
+        return self.request('post', f"{self.base_url}/v1/databases/{self.database_id}/query",
+                              headers = self.headers,
+                              data = json.dumps(query_dict),
+                              idempotent = True)
+    
+    def iter_pages(self, query_dict=None):
+        # page through the whole database, 100 rows per request
+        query_dict = dict(query_dict or {})
+        query_dict['page_size'] = 100
+        
+        while True:
+            response = self.query_database(query_dict)
+            
+            if response.status_code != 200:
+                raise Exception(response.content)
+            
+            response = response.json()
+            
+            yield from response['results']
+            
+            if not response.get('has_more'):
+                break
+            
+            query_dict['start_cursor'] = response['next_cursor']
+    
+    def iter_edited_since(self, since=None):
+        # pages edited on or after `since` (a naive UTC datetime), oldest edit first;
+        # every page when `since` is None
+        query_dict = {'sorts' : [{'timestamp' : 'last_edited_time', 'direction' : 'ascending'}]}
+        
+        if since is not None:
+            query_dict['filter'] = {'timestamp' : 'last_edited_time',
+                                    'last_edited_time' : {'on_or_after' : since.strftime("%Y-%m-%dT%H:%M:%S.000Z")}}
+            
+        return self.iter_pages(query_dict)
+    
+    def page_blocks(self, page_id):
+        # the page's top-level content as [[block_id, type, text], ...]
+        blocks = []
+        params = {'page_size' : 100}
+        
+        while True:
+            response = self.request('get', f"{self.base_url}/v1/blocks/{page_id}/children",
+                                      headers = self.headers,
+                                      params = params)
+            
+            if response.status_code != 200:
+                raise Exception(response.content)
+            
+            response = response.json()
+            
+            for block in response['results']:
+                text = ''.join(part['plain_text'] for part in block.get(block['type'], {}).get('rich_text', []))
+                blocks.append([block['id'], block['type'], text])
+                
+            if not response.get('has_more'):
+                break
+            
+            params['start_cursor'] = response['next_cursor']
+            
+        return blocks
+    
+    def read_body(self, page_id):
+        # the page's blocks less the toggle github comments are mirrored into
+        return [block for block in self.page_blocks(page_id) if block[1:] != ['toggle', COMMENTS_TOGGLE]]
+    
+    def with_body(self, page):
+        # the page with its body blocks under 'body_blocks', which IssueRecord.from_notion reads the body from
+        page['body_blocks'] = self.read_body(page['id'])
+        
+        return page
+    
+    def append_toggle(self, page_id, title):
+        # an empty toggle block at the end of the page, for blocks to be appended into
+        response = self.request('patch', f"{self.base_url}/v1/blocks/{page_id}/children",
+                                  headers = self.headers,
+                                  data = json.dumps({'children' : [{'object' : 'block',
+                                                                    'type' : 'toggle',
+                                                                    'toggle' : {'rich_text' : [{'type' : 'text', 'text' : {'content' : title}}]}}]}),
+                                  idempotent = False)
+        
+        check_block_response(response)
+        
+        return response.json()['results'][0]['id']
+    
+    def append_blocks(self, block_id, chunks, after=None):
+        # add a paragraph per chunk under `block_id`, after the child `after` or at the end;
+        # returns the new blocks as [[block_id, type, digest], ...]
+        appended = []
+        
+        for start in range(0, len(chunks), NOTION_BLOCK_BATCH):
+            data = {'children' : [paragraph_block(chunk) for chunk in chunks[start:start + NOTION_BLOCK_BATCH]]}
+            
+            if after is not None:
+                data['after'] = after
+            
+            # appending twice would duplicate the paragraphs, so this is not retried
+            response = self.request('patch', f"{self.base_url}/v1/blocks/{block_id}/children",
+                                      headers = self.headers,
+                                      data = json.dumps(data),
+                                      idempotent = False)
+            
+            check_block_response(response)
+            
+            for block, chunk in zip(response.json()['results'], chunks[start:start + NOTION_BLOCK_BATCH]):
+                appended.append([block['id'], 'paragraph', block_digest(chunk)])
+                
+            after = appended[-1][0]
+            
+        return appended
+    
+    def update_block(self, block_id, chunk):
+        response = self.request('patch', f"{self.base_url}/v1/blocks/{block_id}",
+                                  headers = self.headers,
+                                  data = json.dumps({'paragraph' : paragraph_block(chunk)['paragraph']}))
+        
+        check_block_response(response)
+        
+    def delete_block(self, block_id):
+        response = self.request('delete', f"{self.base_url}/v1/blocks/{block_id}",
+                                  headers = self.headers)
+        
+        check_block_response(response)
+        
+    def write_body(self, page_id, body, blocks):
+        # Bring the page's blocks in line with `body`, given its current blocks as
+        # [[block_id, type, digest], ...], and return the blocks afterwards. Unchanged
+        # paragraphs are left alone, changed ones are rewritten in place, and only the
+        # surplus is appended or deleted. Blocks added in notion that aren't paragraphs
+        # never match, so they get replaced.
+        chunks = body_chunks(body)
+        digests = [block_digest(chunk) for chunk in chunks]
+        
+        old = [digest if block_type == 'paragraph' else None for _, block_type, digest in blocks]
+        
+        written = []
+        skip = 0
+        
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, digests, autojunk = False).get_opcodes():
+            if tag == 'equal':
+                written.extend(blocks[i1 + skip:i2])
+                skip = 0
+                continue
+            
+            reused = 0
+            
+            while i1 + reused < i2 and j1 + reused < j2 and blocks[i1 + reused][1] == 'paragraph':
+                self.update_block(blocks[i1 + reused][0], chunks[j1 + reused])
+                written.append([blocks[i1 + reused][0], 'paragraph', digests[j1 + reused]])
+                reused += 1
+                
+            for block in blocks[i1 + reused:i2]:
+                self.delete_block(block[0])
+                
+            if j1 + reused == j2:
+                continue
+            
+            if written or i2 == len(blocks):
+                written.extend(self.append_blocks(page_id, chunks[j1 + reused:j2], after = written[-1][0] if written else None))
+                continue
+            
+            # notion only inserts after a block, so for new leading paragraphs the next
+            # unchanged block takes the first of them and its own text moves down behind the rest
+            self.update_block(blocks[i2][0], chunks[j1 + reused])
+            written.append([blocks[i2][0], 'paragraph', digests[j1 + reused]])
+            written.extend(self.append_blocks(page_id, chunks[j1 + reused + 1:j2 + 1], after = blocks[i2][0]))
+            skip = 1
+            
+        return written
+    
+    def archive_page(self, page_id):
+        response = self.request('patch', f"{self.base_url}/v1/pages/{page_id}",
+                                  headers = self.headers,
+                                  data = json.dumps({'archived' : True}))
+        
+        if response.status_code != 200:
+            raise Exception(response.content)
+        
+    def link_page(self, page_id, row, name, organization):
+        # point an existing page at the github issue `row`, e.g. after it was transferred
+        response = self.request('patch', f"{self.base_url}/v1/pages/{page_id}",
+                                  headers = self.headers,
+                                  data = json.dumps({'properties' : {"Organization" : self.org(organization),
+                                                                     "Repo" : self.repo(name),
+                                                                     "URL" : self.url(row),
+                                                                     "Github Issue Number" : self.issue_number(row),
+                                                                     "Github API URL" : self.api_url(row)}}))
+        
+        if response.status_code != 200:
+            raise Exception(response.content)
+        
+        return response.json()
+    
+    @metrics.phase("notion_query")
+    def build_index(self):
+        # one pass over the database, keyed by (org, repo, issue_number)
+        index = {}
+        
+        for page in self.iter_pages():
+            key = page_key(page)
+            
+            if key is not None:
+                index[key] = page
+                
+        logger.info(f"Indexed {len(index)} notion pages")
+        
+        return index
+    
+    def title(self, row):
+        return {"title" : [{ "text" : {"content" : row['title']}}]}
+    
+    def state(self, row):
+        return {"rich_text" : [{"text" : { "content" : row['state']}}]}
+    
+    def body(self, row):
+        # the full body as paragraph blocks of page content, rather than a 2000 character property
+        return [paragraph_block(chunk) for chunk in body_chunks(row['body'])]
+        
+    def org(self, organization):
+        return {"rich_text" : [{"text" : { "content" : organization}}]} 
+    
+    def repo(self, name):
+        return {"rich_text" : [{"text" : { "content" : name}}]} 
+            
+    def label(self, row):
+        return {"multi_select" : [{"name" : lab['name'] } for lab in row['labels']]} \
+            if row['labels'] else {"multi_select" : [{"name" : lab['name'] } for lab in row['labels']]}
+            
+    def url(self, row):
+        return {"url" : row['html_url']} 
+    
+    def api_url(self, row):
+        return {"url" : row['url']} 
+    
+    def issue_number(self, row):
+        return {"number" : row['number']}
+    
+    @property
+    def github_type(self):
+        return {'multi_select' : [{'name' : 'github'}]}
+    
+            
+    def upload_issues(self, row, name, organization):
+        
+        github_issues = {}
+        
+        github_issues["title"] = self.title(row)
+        github_issues["state"] = self.state(row)
+        body = self.body(row)
+        github_issues["org"] = self.org(organization)
+        github_issues['repo'] = self.repo(name)
+        github_issues['labels'] = self.label(row)
+        github_issues['url'] = self.url(row)
+        github_issues['api_url'] = self.api_url(row)
+        github_issues['issue_number'] = self.issue_number(row)
+        
+        notion_dict = {"parent" : {"database_id" : self.database_id}, 
+            "properties" : {"Title" : github_issues['title'],
+                            "State" : github_issues['state'],
+                            "Organization" : github_issues['org'],
+                            "Repo" : github_issues["repo"],
+                            "Labels" : github_issues['labels'],
+                            "URL" : github_issues['url'],
+                            "Github Issue Number" : github_issues['issue_number'],
+                            "Github API URL" : github_issues['api_url'],
+                            "Type" : self.github_type
+                            },
+            "children" : body[:NOTION_BLOCK_BATCH]
+            }
+        
+        notion_post = self.post_page(data = notion_dict)
+        
+        # a page can only be created with so many blocks, the rest go on afterwards
+        if notion_post.status_code == 200 and len(body) > NOTION_BLOCK_BATCH:
+            self.append_blocks(notion_post.json()['id'], body_chunks(row['body'])[NOTION_BLOCK_BATCH:])
+            
+        return notion_post
+    
+        
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+# Dry runs that project a sync's writes and API cost
+import datetime
+import logging
+
+from .metrics import metrics
+from .transport import run_concurrently
+from .records import NOTION_BLOCK_BATCH, block_digest, body_chunks, SYNCED_FIELDS, IssueRecord, issue_fingerprint, page_key, changed_fields
+from .notion import NotionDatabase
+from .store import StoreHighWaterMarks
+from .sync import discover_repos, iter_repo_listings, comment_text
+from .engine import notion, github, store, current_engine
+
+logger = logging.getLogger("notion_github_sync")
+
+# Stands in for the notion client in NotionDatabase.write_body, counting the requests a
+# body write would take instead of sending them
+class NotionWriteCounter(NotionDatabase):
+    
+    def __init__(self):
+        super().__init__(notion.database_id, notion.token, notion.base_url)
+        self.requests = 0
+        
+    def append_blocks(self, block_id, chunks, after=None):
+        self.requests += -(-len(chunks) // NOTION_BLOCK_BATCH)
+        
+        return [[None, 'paragraph', block_digest(chunk)] for chunk in chunks]
+    
+    def update_block(self, block_id, chunk):
+        self.requests += 1
+        
+    def delete_block(self, block_id):
+        self.requests += 1
+
+# What a run would write, per issue and field, and what it would cost in requests
+class SyncPlan:
+    
+    def __init__(self):
+        # {'action', 'key', 'fields', 'requests' : {api : count}} per create or patch
+        self.actions = []
+        
+        # reads the run makes before it writes anything, and how many of the github ones
+        # are conditional GETs that come back 304 and cost no quota
+        self.reads = {'github' : 0, 'notion' : 0}
+        self.free_reads = 0
+        
+    def add(self, action, key, fields=(), **requests):
+        self.actions.append({'action' : action, 'key' : list(key), 'fields' : list(fields), 'requests' : requests})
+        
+    def totals(self):
+        totals = dict(self.reads)
+        
+        for action in self.actions:
+            for api, count in action['requests'].items():
+                totals[api] = totals.get(api, 0) + count
+                
+        return totals
+    
+    def estimate(self, workers=1):
+        # seconds per api: the requests at the rate the limiters currently allow, or at the
+        # latency seen while planning spread over the workers, whichever is slower
+        totals = self.totals()
+        latency = {}
+        
+        for (service, _), entry in metrics.requests.items():
+            seconds, count = latency.get(service, (0, 0))
+            latency[service] = (seconds + entry['seconds'], count + entry['count'])
+            
+        rates = {'github' : github.limiter.rate, 'notion' : notion.limiter.rate}
+        charged = {'github' : totals['github'] - self.free_reads, 'notion' : totals['notion']}
+        
+        estimate = {}
+        
+        for api in ('github', 'notion'):
+            seconds, count = latency.get(api, (0, 0))
+            mean = seconds / count if count else 0
+            
+            estimate[api] = max(charged[api] / rates[api], totals[api] * mean / max(workers, 1))
+            
+        return estimate
+    
+    def summary(self, workers=1):
+        counts = {}
+        fields = {}
+        
+        for action in self.actions:
+            counts[action['action']] = counts.get(action['action'], 0) + 1
+            
+            for field in action['fields']:
+                fields.setdefault(action['action'], {})
+                fields[action['action']][field] = fields[action['action']].get(field, 0) + 1
+                
+        patched = {}
+        
+        for action in self.actions:
+            if action['action'] in ('patch_github', 'patch_notion'):
+                patched.setdefault(tuple(action['key']), set()).add(action['action'])
+        
+        return {'counts' : counts,
+                'fields' : fields,
+                'conflicts' : [list(key) for key, actions in patched.items() if len(actions) > 1],
+                'requests' : self.totals(),
+                'free_github_reads' : self.free_reads,
+                'estimated_seconds' : {api : round(seconds, 1) for api, seconds in self.estimate(workers).items()}}
+
+@metrics.phase("plan")
+def plan_sync(since, high_water_marks, notion_marks, workers=1, repos=None):
+    # Work out what a run (upload_all_issues, sync_comments, sync_cached_issues,
+    # poll_notion_changes and apply_pending_commands) would write, from the store and the
+    # same reads the run starts with: the github listings since each repo's mark, the
+    # comments since the comment marks and the notion pages edited since the notion mark.
+    # Nothing is written, and no mark moves.
+    plan = SyncPlan()
+    
+    def reads(service, status=None):
+        return sum(entry['count'] if status is None else entry['statuses'].get(status, 0)
+                   for (name, _), entry in metrics.requests.items() if name == service)
+    
+    github_before, notion_before, not_modified_before = reads("github"), reads("notion"), reads("github", 304)
+    
+    if repos is None:
+        repos = discover_repos()
+    
+    def repo_since(org, name):
+        return high_water_marks.get(org, name, default=since)
+    
+    # issues github reports as updated: new ones get a page, cached ones are diffed, and
+    # the rest of the cached issues aren't read at all
+    updated = {}
+    
+    for (org, name), issues in iter_repo_listings(repos, workers = workers, since = repo_since):
+        for issue in issues:
+            updated[(org, name, issue['number'])] = issue
+            
+    def body_cost(record, body):
+        # requests for patch_notion_page to write `body` over what the cache has for the page
+        counter = NotionWriteCounter()
+        blocks = record.blocks
+        
+        if blocks is None:
+            blocks = [[None, 'paragraph', block_digest(chunk)] for chunk in body_chunks(record.body)]
+            counter.requests += max(-(-len(blocks) // NOTION_BLOCK_BATCH), 1)
+            
+        counter.write_body(record.page_id, body, blocks)
+        
+        return counter.requests
+    
+    # {key : record} of what each side would have the issue be, as commands would
+    github_side = {}
+    notion_side = {}
+    cached = {}
+    
+    for key, issue in updated.items():
+        record = store.get(*key)
+        
+        if record is None:
+            chunks = body_chunks(issue['body'])
+            plan.add('create_page', key, SYNCED_FIELDS,
+                     notion = 1 + -(-max(len(chunks) - NOTION_BLOCK_BATCH, 0) // NOTION_BLOCK_BATCH))
+            continue
+        
+        cached[key] = record
+        
+        gh_record = IssueRecord.from_github(issue, *key[:2], page_id = record.page_id)
+        
+        if issue_fingerprint(gh_record) != issue_fingerprint(record):
+            github_side[key] = gh_record
+            
+    # comments new or edited since each repo's comment mark
+    if current_engine().config.sync_comments:
+        comment_marks = StoreHighWaterMarks(store)
+        
+        for (name, url), org in repos:
+            by_issue = {}
+            
+            for comment in github.iter_comments(url, since = comment_marks.get("comments", f"{org}/{name}")):
+                by_issue.setdefault(int(comment['issue_url'].rsplit('/', 1)[1]), []).append(comment)
+                
+            for issue_number, comments in by_issue.items():
+                record = store.get(org, name, issue_number)
+                
+                if record is None or not record.page_id:
+                    continue
+                
+                mirrored = store.comment_blocks(org, name, [comment['id'] for comment in comments])
+                
+                new = [comment for comment in comments if comment['id'] not in mirrored]
+                edited = [comment for comment in comments if comment['id'] in mirrored
+                          and mirrored[comment['id']][1] != block_digest(comment_text(comment))]
+                
+                if not new and not edited:
+                    continue
+                
+                toggle = 1 if new and store.comment_toggle(org, name, issue_number) is None else 0
+                
+                plan.add('mirror_comments', (org, name, issue_number), ['comments'],
+                         notion = toggle + -(-len(new) // NOTION_BLOCK_BATCH) + len(edited))
+                
+    # pages edited in notion since the last poll, with their bodies
+    with metrics.phase("notion_query"):
+        pages = {}
+        
+        for page in notion.iter_edited_since(notion_marks.get("notion", notion.database_id)):
+            key = page_key(page)
+            
+            if key is not None and store.contains(*key):
+                pages[key] = page
+                
+        run_concurrently(notion.with_body, list(pages.values()), workers = workers)
+        
+    for key, page in pages.items():
+        record = cached.get(key) or store.get(*key)
+        cached[key] = record
+        
+        notion_record = IssueRecord.from_notion(page)
+        
+        if issue_fingerprint(notion_record) != issue_fingerprint(record):
+            notion_side[key] = notion_record
+            
+    # commands journaled by earlier runs and not applied yet; a newer change found now wins
+    for source, side in (("notion", notion_side), ("github", github_side)):
+        for ids, record in store.pending_commands(source):
+            if record.key not in side:
+                side[record.key] = record
+                cached.setdefault(record.key, store.get(*record.key))
+                
+    plan.reads['github'] += reads("github") - github_before
+    plan.reads['notion'] += reads("notion") - notion_before
+    
+    # the run repeats these reads, and the listings that came back 304 cost no quota then either
+    plan.free_reads = reads("github", 304) - not_modified_before
+    
+    # the run checks the database once, and its poll reads back the pages it created or
+    # mirrored comments into earlier in the run, as they count as edited
+    plan.reads['notion'] += 1 + len({tuple(action['key']) for action in plan.actions} - set(pages))
+    
+    # applied in the same order as apply_pending_commands: notion's changes go to github
+    # first and become the cached record that github's changes are then diffed against
+    for key, record in notion_side.items():
+        fields = changed_fields(cached[key], record)
+        
+        if fields:
+            plan.add('patch_github', key, fields, github = 1)
+            cached[key] = record
+            
+    for key, record in github_side.items():
+        fields = changed_fields(cached[key], record)
+        
+        if not fields:
+            continue
+        
+        requests = 1 if [field for field in fields if field != 'body'] else 0
+        
+        if 'body' in fields:
+            requests += body_cost(cached[key], record.body)
+            
+        plan.add('patch_notion', key, fields, notion = requests)
+        
+    return plan
+
+def report_plan(plan, workers=1):
+    # print what plan_sync found; returns whether anything looks worth a second look
+    summary = plan.summary(workers)
+    
+    cached = len(store)
+    patched = len({tuple(action['key']) for action in plan.actions if action['action'].startswith('patch')})
+    remaining = metrics.gauges.get("github_ratelimit_remaining")
+    
+    print("Planned changes:")
+    
+    for action, count in sorted(summary['counts'].items()):
+        fields = summary['fields'].get(action, {})
+        print(f"  {action:<16} {count:>6}  " + ", ".join(f"{field} {n}" for field, n in sorted(fields.items())))
+        
+    if not summary['counts']:
+        print("  nothing to do")
+        
+    if summary['conflicts']:
+        print(f"  {len(summary['conflicts'])} issues changed on both sides; notion's changes are applied first")
+        
+    print("Projected requests:")
+    print(f"  github {summary['requests']['github']:>8}  ({summary['free_github_reads']} of them conditional GETs that cost no quota)")
+    print(f"  notion {summary['requests']['notion']:>8}")
+    
+    seconds = summary['estimated_seconds']
+    
+    print(f"Estimated time: {datetime.timedelta(seconds = int(sum(seconds.values())))} "
+          f"(github {seconds['github']}s at {github.limiter.rate:.2f} req/s, notion {seconds['notion']}s at {notion.limiter.rate:.2f} req/s)")
+    
+    warnings = []
+    
+    charged = summary['requests']['github'] - summary['free_github_reads']
+    
+    if remaining is not None and charged > remaining:
+        warnings.append(f"the run needs {charged} github requests but only {remaining} are left this hour")
+        
+    if cached and patched > current_engine().config.plan_mass_change * cached:
+        warnings.append(f"{patched} of {cached} issues would be patched")
+        
+    for warning in warnings:
+        print(f"WARNING: {warning}")
+        
+    return bool(warnings)
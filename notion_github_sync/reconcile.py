@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Reconciliation of GitHub, the Notion database and the issue store, as a merge-join of
+# their issues sorted by key
+import logging
+
+from .metrics import metrics
+from .transport import run_concurrently
+from .merge import SortedRuns, merge_join
+from .records import page_key, issue_fingerprint, is_pull_request_page, IssueRecord
+from .sync import discover_repos, iter_listing_pages, upload_issue, apply_pending_commands
+from .engine import notion, store, current_engine
+
+logger = logging.getLogger("notion_github_sync")
+
+@metrics.phase("reconcile")
+def reconcile(repos=None, workers=1, repair=True, budget=None):
+    # Check that github, the notion database and the store agree on which issues exist,
+    # with one merge-join of a full github listing, a scan of the database and the store's
+    # index, each in (org, repo, issue_number) order, rather than a lookup per issue. The
+    # listing and the scan are sorted in runs of up to `budget` rows that are spilled to
+    # disk, so memory doesn't grow with the number of issues; only the keys that need
+    # something done are held. Every key that doesn't line up is one of
+    #   orphaned     its issue is gone from github: the pages are archived, the record dropped
+    #   missing      it has no live page, which is created, or no record, which is re-linked
+    #   duplicated   it has several pages: the linked (or else oldest) one stays, the rest are archived
+    #   transferred  its issue is gone but one with the same content turned up under a new
+    #                key without a page: the page is pointed at the new key
+    # and a key that lines up but whose issue changed since it was synced is
+    #   updated      a github command is queued and applied, as a regular sync would
+    # Only repos that were listed in full are judged, and pull requests never are. With
+    # `repair` off nothing is written.
+    # Returns {class : [key, ...]}, with (old key, new key) pairs for transfers.
+    config = current_engine().config
+    budget = budget or config.merge_budget
+    
+    if repos is None:
+        repos = discover_repos()
+        
+    scope = {(org, name) for (name, url), org in repos}
+    
+    # the keys that need something done, with the issue, live pages and cached
+    # (page_id, content_hash) of each, and the github side of keys that changed
+    listed_repos = set()
+    issues = {}
+    pages = {}
+    cached = {}
+    gone = []
+    changed = []
+    unchanged = 0
+    
+    with SortedRuns(budget, config.cache_dir / "spill") as rows, SortedRuns(budget, config.cache_dir / "spill") as listing:
+        with metrics.phase("notion_query"):
+            for page in notion.iter_pages():
+                key = page_key(page)
+                
+                if key is not None and key[:2] in scope:
+                    rows.add(key, page)
+                    
+        # a repo counts as listed once its last page is in; a relisted repo's issues come
+        # again, and the join takes the last copy of each
+        for (org, name), repo_issues, done in iter_listing_pages(repos, workers = workers):
+            for issue in repo_issues:
+                listing.add((org, name, issue['number']), issue)
+                
+            if done:
+                listed_repos.add((org, name))
+                
+        with metrics.phase("diffing"):
+            for key, listed, live, records in merge_join(listing, rows, store.iter_keys(scope)):
+                if key[:2] not in listed_repos:
+                    continue
+                
+                record = records[0] if records else None
+                
+                if not listed:
+                    # a pull request's page isn't gone just because the listings leave pull
+                    # requests out, so it is kept as it is
+                    if any(is_pull_request_page(page) for page in live):
+                        continue
+                    
+                    gone.append(key)
+                    pages[key] = live
+                    
+                    if record is not None:
+                        cached[key] = record
+                    continue
+                
+                issue = listed[-1]
+                
+                if record is not None and len(live) == 1 and live[0]['id'] == record[0]:
+                    github_record = IssueRecord.from_github(issue, *key[:2], page_id = record[0])
+                    
+                    if issue_fingerprint(github_record) != record[1]:
+                        changed.append(github_record)
+                    else:
+                        unchanged += 1
+                    continue
+                
+                issues[key] = issue
+                pages[key] = live
+                
+                if record is not None:
+                    cached[key] = record
+                    
+    found = {name : [] for name in ('orphaned', 'missing', 'duplicated', 'transferred')}
+    found['updated'] = [record.key for record in changed]
+    
+    # issues without a page or a record, by fingerprint, for gone keys to be matched against
+    unclaimed = {}
+    
+    for key, issue in issues.items():
+        if not pages[key] and key not in cached:
+            unclaimed.setdefault(issue_fingerprint(IssueRecord.from_github(issue, *key[:2])), []).append(key)
+            
+    for key in gone:
+        matches = unclaimed.get(cached[key][1]) if key in cached and pages[key] else None
+        
+        if matches:
+            found['transferred'].append((key, matches.pop(0)))
+        else:
+            found['orphaned'].append(key)
+            
+    transferred_to = {new for _, new in found['transferred']}
+    
+    # what to keep for each listed key with more than one page or a stale link
+    keep = {}
+    
+    for key in sorted(issues):
+        live = pages.get(key, [])
+        
+        if key in transferred_to:
+            continue
+        
+        if not live:
+            found['missing'].append(key)
+            continue
+        
+        linked = [page for page in live if key in cached and page['id'] == cached[key][0]]
+        keep[key] = (linked or sorted(live, key = lambda page : page['created_time']))[0]
+        
+        if len(live) > 1:
+            found['duplicated'].append(key)
+        
+        if key not in cached or cached[key][0] != keep[key]['id']:
+            found['missing'].append(key)
+            
+    metrics.count("reconcile_unchanged", unchanged)
+    
+    for name, keys in found.items():
+        metrics.count(f"reconcile_{name}", len(keys))
+        
+    logger.info("Reconciliation found " + ", ".join(f"{len(keys)} {name}" for name, keys in found.items()))
+    
+    if not repair:
+        return found
+    
+    def attempt(function):
+        # one repair failing doesn't stop the rest; the next pass finds it again
+        def wrapper(item):
+            try:
+                function(item)
+            except Exception as e:
+                logger.warning(f"Repair of {item} failed: {e}")
+                
+        return wrapper
+    
+    # archive orphaned pages and surplus duplicates in one go
+    archived = [page['id'] for key in found['orphaned'] for page in pages.get(key, [])]
+    archived += [page['id'] for key in found['duplicated'] for page in pages[key] if page['id'] != keep[key]['id']]
+    
+    run_concurrently(attempt(notion.archive_page), archived, workers = workers)
+    
+    # records of gone issues, and of those whose page is gone and gets made again
+    store.delete_many([key for key in found['orphaned'] if key in cached] +
+                      [key for key in found['missing'] if key in cached and key not in keep])
+    
+    def transfer(keys):
+        old, new = keys
+        page = pages[old][0]
+        
+        notion.link_page(page['id'], issues[new], new[1], new[0])
+        
+        record = IssueRecord.from_github(issues[new], *new[:2], page_id = page['id'])
+        record.blocks = store.get(*old).blocks
+        
+        store.move(old, record)
+        
+    run_concurrently(attempt(transfer), found['transferred'], workers = workers)
+    
+    # pages the store lost track of are linked again, with the body from github
+    store.put_many([IssueRecord.from_notion(keep[key], body = issues[key]['body'] or "")
+                    for key in found['missing'] if key in keep])
+    
+    run_concurrently(attempt(lambda key : upload_issue(issues[key], key[1], key[0])),
+                     [key for key in found['missing'] if key not in keep], workers = workers)
+    
+    # issues that changed on github go through the command journal, as in a regular sync
+    for record in changed:
+        store.enqueue_command("github", record)
+        
+    if changed:
+        apply_pending_commands(workers = workers, repos = scope)
+    
+    return found
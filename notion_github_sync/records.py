@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# IssueRecord and the helpers to fingerprint, diff and chunk issues
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger("notion_github_sync")
+
+# notion caps a rich_text item at 2000 characters and a request at 100 blocks
+NOTION_TEXT_LIMIT = 2000
+
+NOTION_BLOCK_BATCH = 100
+
+# title of the toggle block on each page that github comments are mirrored into
+COMMENTS_TOGGLE = "GitHub comments"
+
+def body_chunks(body):
+    # the body's paragraphs, so that "\n\n".join(chunks) gives the normalized body back
+    body = (body or "").replace('\r\n', '\n').rstrip()
+    
+    return body.split('\n\n') if body else []
+
+def paragraph_block(chunk):
+    # long paragraphs are split over several rich_text items, which read back as one string
+    return {'object' : 'block',
+            'type' : 'paragraph',
+            'paragraph' : {'rich_text' : [{'type' : 'text', 'text' : {'content' : chunk[start:start + NOTION_TEXT_LIMIT]}}
+                                          for start in range(0, len(chunk), NOTION_TEXT_LIMIT)]}}
+
+def block_digest(text):
+    # kept per block in the cached record, to diff paragraphs without storing them twice
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[0:16]
+
+SYNCED_FIELDS = ('title', 'state', 'labels', 'body')
+
+def normalized_fields(record):
+    # the synced fields in a form that compares equal whether the record came from
+    # github, notion or the cache, with line endings and trailing whitespace normalized
+    return {'title' : record.title.strip(),
+            'state' : record.state,
+            'labels' : sorted(record.labels),
+            'body' : '\n\n'.join(body_chunks(record.body))}
+
+def issue_fingerprint(record):
+    # stable hash over the synced fields only, worked out once per record
+    if record.fingerprint is None:
+        fields = normalized_fields(record)
+        
+        canonical = json.dumps([fields[field] for field in SYNCED_FIELDS])
+        
+        record.fingerprint = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+        
+    return record.fingerprint
+
+def changed_fields(previous, record):
+    # synced fields that differ between two records; all of them if there is no previous one
+    if previous is None:
+        return list(SYNCED_FIELDS)
+    
+    old = normalized_fields(previous)
+    new = normalized_fields(record)
+    
+    return [field for field in SYNCED_FIELDS if old[field] != new[field]]
+
+def page_key(notion_dict):
+    # (org, repo, issue_number) for a notion page, or None if the row isn't a github issue
+    properties = notion_dict['properties']
+    
+    try:
+        org = properties['Organization']['rich_text'][0]['plain_text']
+        repo = properties['Repo']['rich_text'][0]['plain_text']
+        issue_number = properties['Github Issue Number']['number']
+    except (KeyError, IndexError):
+        return None
+    
+    if issue_number is None:
+        return None
+    
+    return org, repo, int(issue_number)
+
+def is_pull_request_page(notion_dict):
+    # pages of pull requests, which the REST listing used to include and which neither
+    # listing returns now
+    return '/pull/' in (notion_dict['properties'].get('URL', {}).get('url') or "")
+
+def lookup_notion_page(notion_index, org, repo, issue_number):
+    
+    try:
+        return notion_index[(org, repo, issue_number)]
+    except KeyError:
+        raise Exception(f"No notion page found for {org}/{repo}/{issue_number}")
+
+# One issue as the sync sees it, whichever side it came from. Records are built straight
+# from github and notion payloads and only turned into JSON at the store and HTTP
+# boundaries. The synced fields aren't changed after construction, which lets the
+# fingerprint be worked out once and, for stored records, read back from the store.
+class IssueRecord:
+    
+    __slots__ = ('title', 'url', 'state', 'labels', 'organization', 'repo', 'issue_number',
+                 'body', 'api_url', 'page_id', 'blocks', 'fingerprint')
+    
+    FIELDS = ('title', 'url', 'state', 'labels', 'organization', 'repo', 'issue_number', 'body', 'api_url', 'page_id')
+    
+    def __init__(self, title, url, state, labels, organization, repo, issue_number, body, api_url, page_id="",
+                 blocks=None, fingerprint=None):
+        self.title = title
+        self.url = url
+        self.state = state
+        self.labels = labels
+        self.organization = organization
+        self.repo = repo
+        self.issue_number = int(issue_number)
+        self.body = body if body is not None else ""
+        self.api_url = api_url
+        self.page_id = page_id
+        # [[block_id, type, digest], ...] of the page's body, see patch_notion_page
+        self.blocks = blocks
+        self.fingerprint = fingerprint
+        
+    @property
+    def key(self):
+        return self.organization, self.repo, self.issue_number
+    
+    @classmethod
+    def from_github(cls, issue, org, repo, page_id=""):
+        return cls(title = issue['title'],
+                   url = issue['html_url'],
+                   state = issue['state'],
+                   labels = [label['name'] for label in issue['labels']],
+                   organization = org,
+                   repo = repo,
+                   issue_number = issue['number'],
+                   body = issue['body'],
+                   api_url = issue['url'],
+                   page_id = page_id)
+    
+    @classmethod
+    def from_notion(cls, page, body=None):
+        properties = page['properties']
+        
+        # the body is the page content when it has been read (see NotionDatabase.with_body);
+        # pages from before bodies were blocks only have the old truncated `Body` property
+        blocks = None
+        
+        if body is None and page.get('body_blocks'):
+            body = '\n\n'.join(text for _, _, text in page['body_blocks'])
+            blocks = [[block_id, block_type, block_digest(text)] for block_id, block_type, text in page['body_blocks']]
+        elif body is None:
+            body = ''.join(part['plain_text'] for part in properties.get('Body', {}).get('rich_text', []))
+            
+        return cls(title = properties['Title']['title'][0]['plain_text'],
+                   url = properties['URL']['url'],
+                   state = properties['State']['rich_text'][0]['plain_text'],
+                   labels = [label['name'] for label in properties['Labels']['multi_select']],
+                   organization = properties['Organization']['rich_text'][0]['plain_text'],
+                   repo = properties['Repo']['rich_text'][0]['plain_text'],
+                   issue_number = properties['Github Issue Number']['number'],
+                   body = body,
+                   api_url = properties['Github API URL']['url'],
+                   page_id = page['id'],
+                   blocks = blocks)
+    
+    @classmethod
+    def from_dict(cls, record, fingerprint=None):
+        # a record as stored, see to_dict
+        return cls(**{field : record[field] for field in cls.FIELDS},
+                   blocks = record.get('blocks'), fingerprint = fingerprint)
+    
+    def to_dict(self):
+        record = {field : getattr(self, field) for field in self.FIELDS}
+        
+        if self.blocks is not None:
+            record['blocks'] = self.blocks
+            
+        return record
+    
+    def github_patch(self, fields=SYNCED_FIELDS):
+        github_dict = {
+            'title' : self.title,
+            'state' : self.state,
+            'labels' : [{'name' : label} for label in self.labels],
+            'body' : self.body,
+        }
+        
+        # only send what changed, so unchanged labels and bodies don't add timeline events
+        return {field : value for field, value in github_dict.items() if field in fields}
+    
+    def notion_patch(self, fields=None):
+        notion_dict = {
+                "properties" : {
+                    'Title' : {
+                        'title' : [{"text" : {'content' : self.title }}]
+                    },
+                    "State" : {
+                        'rich_text' : [{ "text" : {'content' : self.state}}]
+                    },
+                    'Labels' : {
+                        'multi_select' : [{'name' : label} for label in self.labels]
+                    },
+                    'Type' : {
+                        'multi_select' : [{'name' : 'github'}]
+                    }
+                }
+            }
+        
+        # with a field list, only those properties go out (and not the constant `Type`);
+        # the body is page content, written by patch_notion_page
+        if fields is not None:
+            properties = {'title' : 'Title', 'state' : 'State', 'labels' : 'Labels'}
+            
+            notion_dict['properties'] = {properties[field] : notion_dict['properties'][properties[field]]
+                                         for field in fields if field in properties}
+            
+        return notion_dict
+    
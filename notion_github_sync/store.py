@@ -0,0 +1,660 @@
+# -*- coding: utf-8 -*-
+# Local state: the SQLite issue store, its command journal and leases, and the
+# per-repo high-water marks
+import json
+import os
+from pathlib import Path
+import datetime
+import pickle
+import threading
+import time
+import sqlite3
+import logging
+
+from .records import issue_fingerprint, IssueRecord
+
+logger = logging.getLogger("notion_github_sync")
+
+# per-repo `updated_at` of the newest issue that was synced successfully,
+# pickled next to time_last_run.pickle so it stays out of the cache/*.json glob
+class HighWaterMarks:
+    
+    def __init__(self, path="cache/high_water_marks.pickle"):
+        self.path = Path(path)
+        
+        if self.path.is_file():
+            with open(self.path, 'rb') as f:
+                self.marks = pickle.load(f)
+        else:
+            self.marks = {}
+            
+        self.lock = threading.Lock()
+            
+    def get(self, org, repo, default=None):
+        return self.marks.get((org, repo), default)
+    
+    def advance(self, org, repo, updated_at):
+        with self.lock:
+            # never move a mark backwards
+            current = self.get(org, repo)
+            
+            if current is not None and updated_at <= current:
+                return
+            
+            self.marks[(org, repo)] = updated_at
+            self.save()
+        
+    def save(self):
+        # write to a temporary file first so a killed run can't leave a torn file
+        tmp_path = self.path.with_suffix('.tmp')
+        
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.marks, f)
+            
+        os.replace(tmp_path, self.path)
+
+# The marks a run moves forward, held back until the run has diffed and journaled what it
+# listed. `get` still answers with the committed marks, and `commit` advances them, so a
+# run that dies between listing and diffing lists the same issues again next time
+class PendingMarks:
+    
+    def __init__(self, marks):
+        self.marks = marks
+        self.pending = {}
+        self.lock = threading.Lock()
+        
+    def get(self, org, repo, default=None):
+        return self.marks.get(org, repo, default)
+    
+    def advance(self, org, repo, updated_at):
+        with self.lock:
+            current = self.pending.get((org, repo))
+            
+            if current is None or updated_at > current:
+                self.pending[(org, repo)] = updated_at
+                
+    def commit(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            
+        for (org, repo), updated_at in pending.items():
+            self.marks.advance(org, repo, updated_at)
+            
+# The same interface as HighWaterMarks, kept in the shared IssueStore instead of a pickle,
+# so a repo's mark moves along with its lease between shard workers
+class StoreHighWaterMarks:
+    
+    def __init__(self, store):
+        self.store = store
+        
+    def get(self, org, repo, default=None):
+        mark = self.store.get_mark(org, repo)
+        
+        return mark if mark is not None else default
+    
+    def advance(self, org, repo, updated_at):
+        self.store.set_mark(org, repo, updated_at)
+        
+    def rewind(self, org, repo, updated_at):
+        # move a mark back to `updated_at`; None drops it, so the next poll starts from scratch
+        current = self.get(org, repo)
+        
+        if current is not None and (updated_at is None or updated_at < current):
+            self.store.set_mark(org, repo, updated_at, backwards = True)
+        
+    def save(self):
+        # every advance is already committed
+        pass
+    
+    def seed(self, high_water_marks):
+        # carry over the marks from a pickled HighWaterMarks
+        for (org, repo), mark in high_water_marks.marks.items():
+            self.advance(org, repo, mark)
+
+# Changes to the tables of existing stores, each applied once, in order; a store's
+# `PRAGMA user_version` counts those it has had
+MIGRATIONS = [
+    # failed attempts at applying a command, the last error, and when it was given up on
+    "ALTER TABLE commands ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE commands ADD COLUMN error TEXT",
+    "ALTER TABLE commands ADD COLUMN failed_at TEXT",
+    # records are only ever looked up by key, so the other indexes were only a write cost
+    "DROP INDEX IF EXISTS issues_page_id",
+    "DROP INDEX IF EXISTS issues_updated_at",
+    "DROP INDEX IF EXISTS issues_content_hash",
+]
+
+# Cached issue records in a single SQLite file, replacing one cache/*.json file per issue
+class IssueStore:
+    
+    def __init__(self, path="cache/issues.sqlite3"):
+        self.path = Path(path)
+        self._connection = None
+        self.lock = threading.Lock()
+        
+    @property
+    def connection(self):
+        # connect lazily so that importing doesn't touch the disk
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            
+            # shard processes share the file, so wait on each other's write locks rather than fail
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            
+            with self._connection:
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS issues (
+                        organization TEXT NOT NULL,
+                        repo TEXT NOT NULL,
+                        issue_number INTEGER NOT NULL,
+                        page_id TEXT,
+                        updated_at TEXT NOT NULL,
+                        content_hash TEXT NOT NULL,
+                        record TEXT NOT NULL,
+                        PRIMARY KEY (organization, repo, issue_number)
+                    )
+                """)
+                
+                # append-only journal of pending changes; `source` is where the change was
+                # found, so "notion" commands patch github and "github" commands patch notion
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS commands (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        source TEXT NOT NULL,
+                        organization TEXT NOT NULL,
+                        repo TEXT NOT NULL,
+                        issue_number INTEGER NOT NULL,
+                        content_hash TEXT NOT NULL,
+                        record TEXT NOT NULL,
+                        created_at TEXT NOT NULL,
+                        applied_at TEXT
+                    )
+                """)
+                self._connection.execute("CREATE INDEX IF NOT EXISTS commands_pending ON commands (source, applied_at)")
+                
+                # repos a bulk import has finished; issues it created are tracked by `issues` itself
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS import_checkpoints (
+                        organization TEXT NOT NULL,
+                        repo TEXT NOT NULL,
+                        completed_at TEXT NOT NULL,
+                        PRIMARY KEY (organization, repo)
+                    )
+                """)
+                
+                # which shard worker owns a repo, until `expires_at` (unix time) unless renewed
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS leases (
+                        organization TEXT NOT NULL,
+                        repo TEXT NOT NULL,
+                        owner TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        PRIMARY KEY (organization, repo)
+                    )
+                """)
+                
+                # live shard workers, so a worker without leases yet still counts towards the split
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS workers (
+                        owner TEXT PRIMARY KEY,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                
+                # github comments mirrored onto notion pages, each as one block in the
+                # page's comments toggle, and that toggle's block per issue
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS comments (
+                        organization TEXT NOT NULL,
+                        repo TEXT NOT NULL,
+                        comment_id INTEGER NOT NULL,
+                        issue_number INTEGER NOT NULL,
+                        block_id TEXT NOT NULL,
+                        content_hash TEXT NOT NULL,
+                        updated_at TEXT NOT NULL,
+                        PRIMARY KEY (organization, repo, comment_id)
+                    )
+                """)
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS comment_toggles (
+                        organization TEXT NOT NULL,
+                        repo TEXT NOT NULL,
+                        issue_number INTEGER NOT NULL,
+                        block_id TEXT NOT NULL,
+                        PRIMARY KEY (organization, repo, issue_number)
+                    )
+                """)
+                
+                # per-repo high-water marks shared by the shard workers, see StoreHighWaterMarks
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS high_water_marks (
+                        organization TEXT NOT NULL,
+                        repo TEXT NOT NULL,
+                        mark TEXT NOT NULL,
+                        PRIMARY KEY (organization, repo)
+                    )
+                """)
+                
+            self._migrate()
+            
+        return self._connection
+    
+    def _migrate(self):
+        # an immediate transaction, so two processes opening the store don't both migrate it
+        self._connection.execute("BEGIN IMMEDIATE")
+        
+        try:
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            
+            for statement in MIGRATIONS[version:]:
+                self._connection.execute(statement)
+                
+            self._connection.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+    
+    def _row(self, record):
+        return (record.organization,
+                record.repo,
+                record.issue_number,
+                record.page_id,
+                datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                issue_fingerprint(record),
+                json.dumps(record.to_dict()))
+        
+    def put(self, record):
+        self.put_many([record])
+        
+    def put_many(self, records):
+        rows = [self._row(record) for record in records]
+        
+        # one transaction, so either every record lands or none do
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            
+    def get(self, org, repo, issue_number):
+        with self.lock:
+            row = self.connection.execute("""
+                SELECT record, content_hash FROM issues WHERE organization = ? AND repo = ? AND issue_number = ?
+            """, (org, repo, int(issue_number))).fetchone()
+            
+        return IssueRecord.from_dict(json.loads(row[0]), row[1]) if row is not None else None
+    
+    def contains(self, org, repo, issue_number):
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM issues WHERE organization = ? AND repo = ? AND issue_number = ?",
+                                          (org, repo, int(issue_number))).fetchone()
+            
+        return row is not None
+    
+    def fingerprint(self, org, repo, issue_number):
+        with self.lock:
+            row = self.connection.execute("SELECT content_hash FROM issues WHERE organization = ? AND repo = ? AND issue_number = ?",
+                                          (org, repo, int(issue_number))).fetchone()
+            
+        return row[0] if row is not None else None
+    
+    def records(self, repos=None):
+        # every cached record, or only those in `repos`, a set of (org, repo); those are read
+        # a repo at a time off the primary key, so the other repos' rows are never decoded
+        with self.lock:
+            if repos is None:
+                rows = self.connection.execute("""
+                    SELECT record, content_hash FROM issues ORDER BY organization, repo, issue_number
+                """).fetchall()
+            else:
+                rows = [row for org, repo in sorted(repos) for row in self.connection.execute("""
+                    SELECT record, content_hash FROM issues WHERE organization = ? AND repo = ? ORDER BY issue_number
+                """, (org, repo))]
+                
+        return [IssueRecord.from_dict(json.loads(record), content_hash) for record, content_hash in rows]
+    
+    def iter_keys(self, repos=None, page_size=1000):
+        # ((org, repo, issue_number), (page_id, content_hash)) for every cached record, or only
+        # those in `repos`, in key order. Read `page_size` rows at a time by seeking past the
+        # last key, so neither the rows nor the lock are held between pages
+        last = None
+        
+        while True:
+            with self.lock:
+                if last is None:
+                    rows = self.connection.execute("""
+                        SELECT organization, repo, issue_number, page_id, content_hash FROM issues
+                        ORDER BY organization, repo, issue_number LIMIT ?
+                    """, (page_size,)).fetchall()
+                else:
+                    rows = self.connection.execute("""
+                        SELECT organization, repo, issue_number, page_id, content_hash FROM issues
+                        WHERE (organization, repo, issue_number) > (?, ?, ?)
+                        ORDER BY organization, repo, issue_number LIMIT ?
+                    """, (*last, page_size)).fetchall()
+                    
+            for org, repo, issue_number, page_id, content_hash in rows:
+                if repos is None or (org, repo) in repos:
+                    yield (org, repo, issue_number), (page_id, content_hash)
+                    
+            if len(rows) < page_size:
+                return
+                
+            last = rows[-1][:3]
+            
+    def delete_many(self, keys):
+        # drop the records of `keys`, along with what is known about their comments, and give
+        # up on their pending commands, which would only be replayed against issues or pages
+        # that are gone
+        keys = [(org, repo, int(issue_number)) for org, repo, issue_number in keys]
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        
+        with self.lock, self.connection:
+            for table in ('issues', 'comments', 'comment_toggles'):
+                self.connection.executemany(f"DELETE FROM {table} WHERE organization = ? AND repo = ? AND issue_number = ?", keys)
+                
+            self.connection.executemany("""
+                UPDATE commands SET failed_at = ?, error = 'issue removed from the store'
+                WHERE organization = ? AND repo = ? AND issue_number = ? AND applied_at IS NULL AND failed_at IS NULL
+            """, [(now, *key) for key in keys])
+                
+    def move(self, key, record):
+        # re-key the record of `key` as `record`, e.g. for an issue transferred to another
+        # repo, keeping its mirrored comments with it. The pending commands of `key` still
+        # carry the old key and API URL, so they are given up on as in delete_many
+        key = (key[0], key[1], int(key[2]))
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM issues WHERE organization = ? AND repo = ? AND issue_number = ?", key)
+            self.connection.execute("INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?, ?)", self._row(record))
+            
+            for table in ('comments', 'comment_toggles'):
+                self.connection.execute(f"""
+                    UPDATE {table} SET organization = ?, repo = ?, issue_number = ?
+                    WHERE organization = ? AND repo = ? AND issue_number = ?
+                """, (*record.key, *key))
+                
+            self.connection.execute("""
+                UPDATE commands SET failed_at = ?, error = 'issue moved to another key'
+                WHERE organization = ? AND repo = ? AND issue_number = ? AND applied_at IS NULL AND failed_at IS NULL
+            """, (now, *key))
+    
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+    
+    def enqueue_command(self, source, record):
+        content_hash = issue_fingerprint(record)
+        key = record.key
+        
+        with self.lock, self.connection:
+            # the same change found again before it was applied, or after it was given up
+            # on, doesn't need another entry
+            duplicate = self.connection.execute("""
+                SELECT 1 FROM commands WHERE source = ? AND organization = ? AND repo = ? AND issue_number = ?
+                AND applied_at IS NULL AND content_hash = ?
+            """, (source, *key, content_hash)).fetchone()
+            
+            if duplicate is None:
+                self.connection.execute("""
+                    INSERT INTO commands (source, organization, repo, issue_number, content_hash, record, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (source, *key, content_hash, json.dumps(record.to_dict()),
+                      datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")))
+                
+    def pending_commands(self, source, repos=None):
+        # pending commands coalesced per issue: [(ids, latest record), ...], optionally
+        # only for `repos`, a set of (org, repo). Commands given up on aren't pending
+        with self.lock:
+            rows = self.connection.execute("""
+                SELECT id, organization, repo, issue_number, record, content_hash FROM commands
+                WHERE source = ? AND applied_at IS NULL AND failed_at IS NULL ORDER BY id
+            """, (source,)).fetchall()
+            
+        commands = {}
+        
+        for command_id, org, repo, issue_number, record, content_hash in rows:
+            if repos is not None and (org, repo) not in repos:
+                continue
+            
+            ids, _ = commands.get((org, repo, issue_number), ([], None))
+            commands[(org, repo, issue_number)] = (ids + [command_id], (record, content_hash))
+            
+        return [(ids, IssueRecord.from_dict(json.loads(record), content_hash))
+                for ids, (record, content_hash) in commands.values()]
+    
+    def complete_commands(self, ids, record):
+        # the cached record and the applied markers change in one transaction, so a
+        # command is never marked applied without the cache reflecting it
+        row = self._row(record)
+        
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self.connection.executemany("UPDATE commands SET applied_at = ? WHERE id = ?",
+                                        [(row[4], command_id) for command_id in ids])
+            
+    def fail_commands(self, ids, error, max_attempts=5, gone=False):
+        # count a failed attempt at applying the commands `ids` and keep its error. They
+        # are given up on after `max_attempts`, or at once when what they patch is `gone`;
+        # returns whether they were
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        
+        with self.lock, self.connection:
+            self.connection.executemany("""
+                UPDATE commands SET attempts = attempts + 1, error = ?,
+                failed_at = CASE WHEN ? OR attempts + 1 >= ? THEN ? END WHERE id = ?
+            """, [(error, gone, max_attempts, now, command_id) for command_id in ids])
+            
+            failed = self.connection.execute(f"""
+                SELECT COUNT(*) FROM commands WHERE failed_at IS NOT NULL AND id IN ({', '.join('?' * len(ids))})
+            """, list(ids)).fetchone()[0]
+            
+        return failed > 0
+    
+    def compact_commands(self, max_age=datetime.timedelta(days=7)):
+        # drop applied entries and those given up on once they are older than `max_age`
+        cutoff = (datetime.datetime.utcnow() - max_age).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        
+        with self.lock, self.connection:
+            return self.connection.execute("""
+                DELETE FROM commands WHERE (applied_at IS NOT NULL AND applied_at < ?) OR (failed_at IS NOT NULL AND failed_at < ?)
+            """, (cutoff, cutoff)).rowcount
+    
+    def import_completed(self, org, repo):
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM import_checkpoints WHERE organization = ? AND repo = ?",
+                                          (org, repo)).fetchone()
+            
+        return row is not None
+    
+    def mark_import_completed(self, org, repo):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO import_checkpoints VALUES (?, ?, ?)",
+                                    (org, repo, datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")))
+            
+    def reset_import(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM import_checkpoints")
+            
+    def comment_blocks(self, org, repo, comment_ids):
+        # {comment_id : (block_id, content_hash)} for the comments already mirrored
+        rows = []
+        
+        # in slices, to stay under sqlite's limit on query parameters
+        for start in range(0, len(comment_ids), 500):
+            ids = comment_ids[start:start + 500]
+            
+            with self.lock:
+                rows += self.connection.execute(f"""
+                    SELECT comment_id, block_id, content_hash FROM comments
+                    WHERE organization = ? AND repo = ? AND comment_id IN ({', '.join('?' * len(ids))})
+                """, (org, repo, *ids)).fetchall()
+            
+        return {comment_id : (block_id, content_hash) for comment_id, block_id, content_hash in rows}
+    
+    def put_comments(self, org, repo, rows):
+        # rows of (comment_id, issue_number, block_id, content_hash, updated_at)
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO comments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        [(org, repo, *row) for row in rows])
+            
+    def comment_toggle(self, org, repo, issue_number):
+        with self.lock:
+            row = self.connection.execute("""
+                SELECT block_id FROM comment_toggles WHERE organization = ? AND repo = ? AND issue_number = ?
+            """, (org, repo, int(issue_number))).fetchone()
+            
+        return row[0] if row is not None else None
+    
+    def set_comment_toggle(self, org, repo, issue_number, block_id):
+        # a new toggle starts empty, so the comments mirrored into the old one are forgotten
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM comments WHERE organization = ? AND repo = ? AND issue_number = ?",
+                                    (org, repo, int(issue_number)))
+            self.connection.execute("INSERT OR REPLACE INTO comment_toggles VALUES (?, ?, ?, ?)",
+                                    (org, repo, int(issue_number), block_id))
+    
+    def acquire_leases(self, owner, repos, ttl=300):
+        # Take this worker's share of `repos` (a list of (org, repo)): keep and renew the
+        # leases it holds, claim unowned or expired ones up to an even split between the
+        # live workers, and hand back any above that split so a newly started worker gets
+        # some. A lease handed back is expired rather than dropped, so whoever claims it
+        # next learns whose it was, as with a lease that ran out. Returns (owned repos,
+        # {repo : previous owner} for repos taken over).
+        now = time.time()
+        repos = sorted(set(repos))
+        
+        with self.lock:
+            # an immediate transaction, so two workers can't claim the same repo
+            self.connection.execute("BEGIN IMMEDIATE")
+            
+            try:
+                self.connection.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (owner, now + ttl))
+                self.connection.execute("DELETE FROM workers WHERE expires_at <= ?", (now,))
+                
+                live = self.connection.execute("SELECT COUNT(*) FROM workers").fetchone()[0]
+                share = -(-len(repos) // live)
+                
+                leases = {(org, repo) : (lease_owner, expires_at) for org, repo, lease_owner, expires_at
+                          in self.connection.execute("SELECT organization, repo, owner, expires_at FROM leases")}
+                
+                owned = [repo for repo in repos if leases.get(repo, (None, 0))[0] == owner and leases[repo][1] > now]
+                
+                # hand back the surplus
+                for repo in owned[share:]:
+                    self.connection.execute("UPDATE leases SET expires_at = 0 WHERE organization = ? AND repo = ? AND owner = ?",
+                                            (*repo, owner))
+                    
+                owned = owned[:share]
+                taken_over = {}
+                
+                for repo in repos:
+                    if len(owned) >= share:
+                        break
+                    
+                    lease_owner, expires_at = leases.get(repo, (None, 0))
+                    
+                    if repo in owned or expires_at > now:
+                        continue
+                    
+                    owned.append(repo)
+                    
+                    if lease_owner is not None and lease_owner != owner:
+                        taken_over[repo] = lease_owner
+                        
+                self.connection.executemany("INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)",
+                                            [(*repo, owner, now + ttl) for repo in owned])
+                
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            
+        return owned, taken_over
+    
+    def renew_leases(self, owner, ttl=300):
+        # extend this worker's unexpired leases and heartbeat without rebalancing; the ones
+        # it handed back or let run out are left for the others to claim
+        now = time.time()
+        
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (owner, now + ttl))
+            return self.connection.execute("UPDATE leases SET expires_at = ? WHERE owner = ? AND expires_at > ?",
+                                           (now + ttl, owner, now)).rowcount
+            
+    def release_leases(self, owner):
+        # on a clean shutdown, so the other workers don't have to wait for the leases to
+        # expire; they are expired rather than dropped, like those handed back
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE leases SET expires_at = 0 WHERE owner = ?", (owner,))
+            self.connection.execute("DELETE FROM workers WHERE owner = ?", (owner,))
+            
+    def get_mark(self, org, repo):
+        with self.lock:
+            row = self.connection.execute("SELECT mark FROM high_water_marks WHERE organization = ? AND repo = ?",
+                                          (org, repo)).fetchone()
+            
+        return datetime.datetime.strptime(row[0], "%Y-%m-%dT%H:%M:%S.%f") if row is not None else None
+    
+    def set_mark(self, org, repo, mark, backwards=False):
+        # marks only move forwards unless `backwards`; the timestamp format sorts as text
+        mark = mark.strftime("%Y-%m-%dT%H:%M:%S.%f") if mark is not None else None
+        
+        with self.lock, self.connection:
+            if mark is None:
+                self.connection.execute("DELETE FROM high_water_marks WHERE organization = ? AND repo = ?", (org, repo))
+            elif backwards:
+                self.connection.execute("INSERT OR REPLACE INTO high_water_marks VALUES (?, ?, ?)", (org, repo, mark))
+            else:
+                self.connection.execute("""
+                    INSERT INTO high_water_marks VALUES (?, ?, ?)
+                    ON CONFLICT (organization, repo) DO UPDATE SET mark = excluded.mark WHERE excluded.mark > mark
+                """, (org, repo, mark))
+    
+    def migrate_command_directories(self, cache_dir="cache"):
+        # one-time import of pending cache/{notion,github}_commands/*.json files into the journal
+        migrated = 0
+        
+        for source in ("notion", "github"):
+            paths = list((Path(cache_dir) / f"{source}_commands").glob("*.json"))
+            
+            for path in paths:
+                with open(path, 'r') as f:
+                    self.enqueue_command(source, IssueRecord.from_dict(json.load(f)))
+                    
+                path.unlink()
+                migrated += 1
+                
+        if migrated:
+            logger.info(f"Migrated {migrated} pending commands into {self.path}")
+            
+        return migrated
+    
+    def migrate_directory(self, cache_dir="cache", backup_dir="cache/json_backup"):
+        # one-time import of the old {org}_{repo}_{number}.json files; they are moved
+        # into `backup_dir` afterwards so this is a no-op on later runs
+        paths = list(Path(cache_dir).glob("*.json"))
+        
+        if not paths:
+            return 0
+        
+        records = []
+        
+        for path in paths:
+            with open(path, 'r') as f:
+                data = json.load(f)
+                
+            # older versions cached raw notion pages
+            records.append(IssueRecord.from_notion(data) if 'properties' in data else IssueRecord.from_dict(data))
+            
+        self.put_many(records)
+        
+        Path(backup_dir).mkdir(parents=True, exist_ok=True)
+        
+        for path in paths:
+            path.rename(Path(backup_dir) / path.name)
+            
+        logger.info(f"Migrated {len(records)} cache files into {self.path}")
+        
+        return len(records)
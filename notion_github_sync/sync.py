@@ -0,0 +1,732 @@
+# -*- coding: utf-8 -*-
+# The sync itself: fetching issues and comments, diffing them against the store and
+# turning the differences into commands for the other side
+import json
+import datetime
+import threading
+import time
+import logging
+
+from .metrics import metrics
+from .transport import run_concurrently, batched
+from .records import IssueRecord, lookup_notion_page, issue_fingerprint, changed_fields, block_digest, COMMENTS_TOGGLE, page_key
+from .store import StoreHighWaterMarks
+from .notion import BlockGone, check_block_response
+from .github import IssueGone
+from .engine import notion, store, github
+
+logger = logging.getLogger("notion_github_sync")
+
+def upload_issue(issue, name, org, cache=True):
+    
+    logger.debug(f"Adding {issue['title']}")
+    
+    notion_post = notion.upload_issues(issue, name, org)
+    
+    logger.debug(notion_post.json())
+    
+    if notion_post.json()['object'] == "error":
+        raise Exception(f"Error {notion_post.json()['status']}, {notion_post.json()['message']}")
+    
+    metrics.count("issues_created")
+    
+    if cache:
+        # the body went into blocks the response doesn't include, so it is taken from the issue
+        record = IssueRecord.from_notion(notion_post.json(), body = issue['body'] or "")
+        
+        store.put(record)
+        
+    return notion_post
+    
+
+def check_database():
+    database_response = notion.request_database()
+    
+    if database_response.status_code != 200:
+        raise Exception(database_response.status_code)
+    
+    return database_response.json()
+    
+
+@metrics.phase("repo_discovery")
+def discover_repos():
+    # [((name, issues_url), org), ...] for every repo we sync
+    return github.get_all_issue_urls()
+    
+
+@metrics.phase("issue_fetch")
+def upload_all_issues(cache=True, since=None, cache_glob=None, high_water_marks=None, workers=1, repos=None):
+    
+    if repos is None:
+        repos = discover_repos()
+        
+    # Check that database exists, once rather than per repo
+    check_database()
+    
+    def repo_since(org, name):
+        # a repo's own high-water mark takes precedence over the global `since`
+        return high_water_marks.get(org, name, default=since) if high_water_marks is not None else since
+    
+    def sync_repo(repo, issues=None):
+        (name, url), org = repo
+            
+        logger.info(
+            f"""
+            **************************
+            Checking {org}/{name}
+            **************************
+            """
+        )
+        
+        newest = None
+        
+        # stream the issues page by page rather than holding the whole repo in memory
+        if issues is None:
+            issues = github.iter_issues(url, since = repo_since(org, name))
+        
+        for i in issues:
+            
+            github.issue_snapshot[(org, name, i['number'])] = i
+            
+            updated_at = datetime.datetime.strptime(i['updated_at'], "%Y-%m-%dT%H:%M:%SZ")
+            
+            if newest is None or updated_at > newest:
+                newest = updated_at
+            
+            # Now check if that issue exists in the cache
+            if since is not None and store.contains(org, name, i['number']):
+                logger.debug("Issue already exists in cache, skipping")
+                metrics.count("issues_skipped")
+                continue
+            
+            upload_issue(i, name, org, cache = cache)
+        
+        # only advance once the whole repo has gone through without raising
+        if high_water_marks is not None and newest is not None:
+            high_water_marks.advance(org, name, newest)
+            
+        return newest is not None
+    
+    # {(org, name) : whether any issue was updated}
+    changed = {}
+    
+    if github.backend != "graphql":
+        # repos are independent, so they can be fetched and uploaded side by side
+        for ((name, url), org), repo_changed in zip(repos, run_concurrently(sync_repo, repos, workers = workers)):
+            changed[(org, name)] = repo_changed
+        
+        return changed
+    
+    for start in range(0, len(repos), github.graphql_batch_size):
+        batch = repos[start:start + github.graphql_batch_size]
+        
+        try:
+            fetched = github.request_issues_graphql([(org, name, repo_since(org, name)) for (name, url), org in batch])
+        except Exception as e:
+            # fall back to one REST listing per repo for this batch
+            logger.warning(f"GraphQL fetch failed ({e}), falling back to REST")
+            results = run_concurrently(sync_repo, batch, workers = workers)
+        else:
+            results = run_concurrently(lambda repo : sync_repo(repo, fetched[(repo[1], repo[0][0])]), batch, workers = workers)
+        
+        for ((name, url), org), repo_changed in zip(batch, results):
+            changed[(org, name)] = repo_changed
+            
+    return changed
+            
+
+# Counters for a bulk import, printed as a progress line with an ETA. The issue total
+# isn't known up front, so it is extrapolated from the average issues per finished repo
+class ImportProgress:
+    
+    def __init__(self, total_repos):
+        self.total_repos = total_repos
+        self.repos_done = 0
+        self.issues_seen = 0
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        
+    def add(self, created=0, skipped=0, failed=0):
+        with self.lock:
+            self.created += created
+            self.skipped += skipped
+            self.failed += failed
+            self.issues_seen += created + skipped + failed
+            
+    def repo_done(self):
+        with self.lock:
+            self.repos_done += 1
+            
+    def report(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            rate = self.created / elapsed if elapsed > 0 else 0
+            
+            eta = "unknown"
+            
+            if self.repos_done and rate:
+                estimated_total = self.issues_seen / self.repos_done * self.total_repos
+                eta = str(datetime.timedelta(seconds = int(max(estimated_total - self.issues_seen, 0) / rate)))
+                
+            logger.info(f"Imported {self.repos_done}/{self.total_repos} repos, {self.created} created, "
+                        f"{self.skipped} already present, {self.failed} failed ({rate:.1f} pages/s, ETA {eta})")
+
+def bulk_import(workers=1, high_water_marks=None, restart=False, notion_marks=None, comments=False):
+    # Seed the notion database from every issue in every repo. Safe to interrupt and re-run:
+    # finished repos are checkpointed in the store, issues already in the cache or in the
+    # notion database are not created again, and creation runs on `workers` threads held
+    # to notion's rate by its token bucket. With `comments` each finished repo's comments
+    # are mirrored too. The notion mark and the comment marks start at the time the import
+    # did, so the first sync only looks at what was edited since
+    if restart:
+        store.reset_import()
+    
+    check_database()
+    
+    started = datetime.datetime.utcnow()
+    
+    # a resumed import keeps the mark its first run set
+    if notion_marks is not None and notion_marks.get("notion", notion.database_id) is None:
+        notion_marks.advance("notion", notion.database_id, started)
+        
+    comment_marks = StoreHighWaterMarks(store)
+    
+    repos = discover_repos()
+    
+    # existence checks against a single scan of the database, not one query per issue
+    notion_index = notion.build_index()
+    
+    progress = ImportProgress(len(repos))
+    
+    def import_issue(item):
+        issue, name, org = item
+        key = (org, name, issue['number'])
+        
+        if store.contains(*key):
+            progress.add(skipped = 1)
+            metrics.count("issues_skipped")
+            return
+        
+        # created by an earlier run that died before caching it, so just re-link
+        if key in notion_index:
+            store.put(IssueRecord.from_notion(notion_index[key], body = issue['body'] or ""))
+            progress.add(skipped = 1)
+            metrics.count("issues_skipped")
+            return
+        
+        try:
+            upload_issue(issue, name, org)
+        except Exception as e:
+            logger.warning(f"Failed to import {org}/{name}/{issue['number']}: {e}")
+            progress.add(failed = 1)
+            return False
+        
+        progress.add(created = 1)
+    
+    for (name, url), org in repos:
+        
+        if store.import_completed(org, name):
+            progress.repo_done()
+            continue
+        
+        logger.info(f"Importing {org}/{name}")
+        
+        newest = None
+        failed = False
+        
+        # one page of issues at a time goes through the creation pool
+        for batch in batched(github.iter_issues(url), 100):
+            
+            for issue in batch:
+                updated_at = datetime.datetime.strptime(issue['updated_at'], "%Y-%m-%dT%H:%M:%SZ")
+                
+                if newest is None or updated_at > newest:
+                    newest = updated_at
+            
+            results = run_concurrently(import_issue, [(issue, name, org) for issue in batch], workers = workers)
+            
+            failed = failed or False in results
+            
+            progress.report()
+            
+        # a repo with failures stays unchecked so the next run picks them up
+        if not failed:
+            store.mark_import_completed(org, name)
+            
+            if high_water_marks is not None and newest is not None:
+                high_water_marks.advance(org, name, newest)
+                
+            # the listing covers every comment updated before the import started
+            if comments:
+                sync_comments([((name, url), org)])
+                comment_marks.advance("comments", f"{org}/{name}", started)
+            
+        progress.repo_done()
+        progress.report()
+        
+    return progress
+
+#TODO: If file in cache doesn't exist, then that means notion is trying to make a new issue, so post a new issue in the repository
+#TODO: Still need to figure out how best to poll github to check for new issues there
+#TODO: make more descriptive message when changes are found
+
+def comment_text(comment):
+    # who wrote it and when, then the comment, as the text of its block
+    body = (comment['body'] or "").replace('\r\n', '\n').rstrip()
+    
+    return f"{comment['user']['login']} on {comment['created_at'][0:10]}:\n{body}"
+
+def mirror_comments(org, repo, issue_number, comments, rebuilt=False):
+    # Append new comments to the comments toggle on the issue's page and rewrite the
+    # blocks of edited ones; unchanged comments cost nothing. If the toggle was deleted
+    # in notion, a new one is made and refilled from the issue's own comment listing.
+    record = store.get(org, repo, issue_number)
+    
+    # not in notion (yet), e.g. a pull request
+    if record is None or not record.page_id:
+        return
+    
+    mirrored = store.comment_blocks(org, repo, [comment['id'] for comment in comments])
+    
+    new = []
+    rows = []
+    
+    for comment in comments:
+        text = comment_text(comment)
+        digest = block_digest(text)
+        
+        if comment['id'] not in mirrored:
+            new.append((comment, text, digest))
+            continue
+        
+        block_id, content_hash = mirrored[comment['id']]
+        
+        if content_hash != digest:
+            try:
+                notion.update_block(block_id, text)
+            except BlockGone as e:
+                # the block was deleted in notion, so add the comment again; any other
+                # failure is raised, and the comment is tried again on the next run
+                logger.warning(f"The block of comment {comment['id']} is gone ({e}), appending it")
+                new.append((comment, text, digest))
+                continue
+            
+            metrics.count("comments_updated")
+            
+        rows.append((comment['id'], issue_number, block_id, digest, comment['updated_at']))
+        
+    if new:
+        toggle = store.comment_toggle(org, repo, issue_number)
+        
+        try:
+            if toggle is None:
+                toggle = notion.append_toggle(record.page_id, COMMENTS_TOGGLE)
+                store.set_comment_toggle(org, repo, issue_number, toggle)
+                
+            appended = notion.append_blocks(toggle, [text for _, text, _ in new])
+        except BlockGone as e:
+            # only a toggle deleted in notion is rebuilt: appends aren't retried, so after
+            # any other failure some of the comments may be in it already
+            if rebuilt:
+                raise
+            
+            logger.warning(f"Comments toggle of {org}/{repo}/{issue_number} is gone ({e}), rebuilding it")
+            
+            store.set_comment_toggle(org, repo, issue_number, notion.append_toggle(record.page_id, COMMENTS_TOGGLE))
+            
+            return mirror_comments(org, repo, issue_number, list(github.iter_issue_comments(record.api_url)), rebuilt = True)
+        
+        rows.extend((comment['id'], issue_number, block[0], digest, comment['updated_at'])
+                    for (comment, _, digest), block in zip(new, appended))
+        
+        metrics.count("comments_added", len(new))
+        
+    store.put_comments(org, repo, rows)
+
+@metrics.phase("comment_sync")
+def sync_comments(repos, workers=1):
+    # Mirror new and edited github comments onto the notion pages of `repos`. Each repo
+    # costs one paged `issues/comments?since=` listing, which is a free 304 when nothing
+    # changed. The checkpoint is kept in the store under ("comments", "org/repo") and
+    # only advances once the whole repo went through.
+    marks = StoreHighWaterMarks(store)
+    
+    def sync_repo(repo):
+        (name, url), org = repo
+        
+        by_issue = {}
+        newest = None
+        
+        for comment in github.iter_comments(url, since = marks.get("comments", f"{org}/{name}")):
+            by_issue.setdefault(int(comment['issue_url'].rsplit('/', 1)[1]), []).append(comment)
+            
+            updated_at = datetime.datetime.strptime(comment['updated_at'], "%Y-%m-%dT%H:%M:%SZ")
+            
+            if newest is None or updated_at > newest:
+                newest = updated_at
+                
+        for issue_number, comments in by_issue.items():
+            mirror_comments(org, name, issue_number, comments)
+            
+        if newest is not None:
+            marks.advance("comments", f"{org}/{name}", newest)
+            
+    run_concurrently(sync_repo, repos, workers = workers)
+
+def patch_notion_page(record, fields, notion_headers, blocks=None):
+    # Write `fields` of `record` to its notion page: the changed properties in one PATCH
+    # and a changed body as a diff against the page's blocks. `blocks` are the blocks
+    # last seen on the page; they are read from notion when unknown, and read again if
+    # they turn out to be out of date. Returns (the patched page or None, the blocks).
+    page = None
+    
+    if [field for field in fields if field != 'body']:
+        patch_notion = notion.request('patch', f"{notion.base_url}/v1/pages/{record.page_id}",
+                                      headers = notion_headers,
+                                      data = json.dumps(record.notion_patch(fields)))
+        
+        # a page deleted or archived in notion raises BlockGone
+        check_block_response(patch_notion)
+        
+        page = patch_notion.json()
+        
+    if 'body' not in fields:
+        return page, blocks
+    
+    def read_blocks():
+        return [[block_id, block_type, block_digest(text)] for block_id, block_type, text in notion.read_body(record.page_id)]
+    
+    if blocks is None:
+        blocks = read_blocks()
+        written = notion.write_body(record.page_id, record.body, blocks)
+    else:
+        try:
+            written = notion.write_body(record.page_id, record.body, blocks)
+        except Exception as e:
+            # edited in notion since, e.g. a paragraph we meant to update was deleted
+            logger.warning(f"Cached blocks of {record.page_id} are out of date ({e}), reading them again")
+            
+            blocks = read_blocks()
+            written = notion.write_body(record.page_id, record.body, blocks)
+            
+    # with no block of the old body left to write after, the body was appended at the end
+    # of the page, below the comments toggle
+    if written and written[0][0] not in {block[0] for block in blocks}:
+        move_comments_below_body(record)
+        
+    return page, written
+
+def move_comments_below_body(record):
+    # notion can neither move a block nor insert one first on a page, so the comments
+    # go into a new toggle after the body, refilled from the issue's comment listing
+    org, repo, issue_number = record.key
+    toggle = store.comment_toggle(org, repo, issue_number)
+    
+    if toggle is None:
+        return
+    
+    logger.info(f"Moving the comments of {org}/{repo}/{issue_number} below its body")
+    metrics.count("comment_toggles_moved")
+    
+    # already gone is as good as deleted
+    try:
+        notion.delete_block(toggle)
+    except BlockGone:
+        pass
+    
+    store.set_comment_toggle(org, repo, issue_number, notion.append_toggle(record.page_id, COMMENTS_TOGGLE))
+    
+    mirror_comments(org, repo, issue_number, list(github.iter_issue_comments(record.api_url)), rebuilt = True)
+    
+
+def notion_command(file_json, notion_headers, org, repo, issue_number, notion_index):
+    
+    # look up the page in the database snapshot instead of querying notion
+    page = lookup_notion_page(notion_index, org, repo, issue_number)
+    
+    # Now compare file and query
+    notion_record = IssueRecord.from_notion(page)
+    
+    if issue_fingerprint(file_json) != issue_fingerprint(notion_record):
+        
+        logger.info(f"Found a Change! Queueing notion command for {org}/{repo}/{issue_number}")
+        metrics.count("issues_changed_notion")
+        
+        # save command
+        with metrics.phase("command_generation"):
+            store.enqueue_command("notion", notion_record)
+    else:
+        metrics.count("issues_unchanged")
+        
+    return page
+
+def patch_github_issue(notion_command_instructions, github_headers, command_ids=()):
+    
+    # only the fields that changed since the cached record need to go out
+    fields = changed_fields(store.get(*notion_command_instructions.key), notion_command_instructions)
+    
+    if not fields:
+        store.complete_commands(command_ids, notion_command_instructions)
+        metrics.count("commands_noop")
+        return
+    
+    # convert our json to github json for send
+    github_patch = notion_command_instructions.github_patch(fields)
+    
+    # patch github
+    patch = github.request('patch', notion_command_instructions.api_url,
+                    headers=github_headers,
+                    data = json.dumps(github_patch))
+    
+    if patch.status_code in (404, 410):
+        raise IssueGone(patch.content)
+    
+    if patch.status_code != 200:
+        raise Exception(patch.content)
+    
+    # If all goes well, update the cached record and mark the commands applied
+    store.complete_commands(command_ids, notion_command_instructions)
+    metrics.count("commands_applied")
+        
+
+def github_command(file_json, github_headers, org, repo, issue_number, gh_issue=None):
+    
+    # issues fetched earlier in the run (or delivered by a webhook) don't need another request
+    if gh_issue is None:
+        gh_issue = github.issue_snapshot.get((org, repo, issue_number))
+    
+    if gh_issue is None:
+        gh_issue = github.get(file_json.api_url,
+                              headers=github_headers)
+        
+        if gh_issue.status_code != 200:
+            raise Exception(gh_issue.content)
+        
+        gh_issue = gh_issue.json()
+    
+    gh_issue = IssueRecord.from_github(gh_issue, org, repo, page_id = file_json.page_id)
+    
+    if issue_fingerprint(file_json) != issue_fingerprint(gh_issue):
+        
+        logger.info(f"Found a Change! Queueing github command for {org}/{repo}/{issue_number}")
+        metrics.count("issues_changed_github")
+        
+        with metrics.phase("command_generation"):
+            store.enqueue_command("github", gh_issue)
+    else:
+        metrics.count("issues_unchanged")
+        
+    return gh_issue
+
+def patch_notion_database(github_command_instructions, notion_headers, command_ids=()):
+    
+    cached = store.get(*github_command_instructions.key)
+    
+    # only the fields that changed since the cached record need to go out
+    fields = changed_fields(cached, github_command_instructions)
+    
+    blocks = cached.blocks if cached is not None else None
+    
+    if not fields:
+        github_command_instructions.blocks = blocks
+        store.complete_commands(command_ids, github_command_instructions)
+        metrics.count("commands_noop")
+        return
+    
+    # properties and changed paragraphs; the resulting blocks are cached for the next diff
+    _, github_command_instructions.blocks = patch_notion_page(github_command_instructions, fields,
+                                                              notion_headers, blocks)
+    
+    # If all goes well, update the cached record and mark the commands applied
+    store.complete_commands(command_ids, github_command_instructions)
+    metrics.count("commands_applied")
+    
+
+def poll_notion_changes(notion_marks, workers=1, repos=None, mark_key=None):
+    # Diff only the pages edited since the last poll. The checkpoint lives in a
+    # HighWaterMarks keyed by ("notion", database_id) and only advances once the
+    # commands for those pages have been written. Notion rounds last_edited_time
+    # to the minute, so the newest pages come back once more on the next poll
+    # and the fingerprint comparison turns them into no-ops. A shard worker passes
+    # its own `mark_key` and only diffs the pages of its `repos`.
+    if mark_key is None:
+        mark_key = ("notion", notion.database_id)
+        
+    since = notion_marks.get(*mark_key)
+    
+    logger.info(f"Checking notion pages edited since {since}")
+    
+    pages = {}
+    newest = None
+    
+    with metrics.phase("notion_query"):
+        for page in notion.iter_edited_since(since):
+            key = page_key(page)
+            
+            if key is not None:
+                pages[key] = page
+                
+            edited = datetime.datetime.strptime(page['last_edited_time'], "%Y-%m-%dT%H:%M:%S.%fZ")
+            
+            if newest is None or edited > newest:
+                newest = edited
+    
+    records = {key : store.get(*key) for key in pages if repos is None or key[:2] in repos}
+    records = {key : record for key, record in records.items() if record is not None}
+    
+    # bodies are page content, which the query doesn't return, so read it for the pages being diffed
+    with metrics.phase("notion_query"):
+        run_concurrently(notion.with_body, [pages[key] for key in records], workers = workers)
+    
+    sync_cached_issues(list(records.values()), pages, workers = workers, check_github = False)
+    
+    if newest is not None:
+        notion_marks.advance(*mark_key, newest)
+
+def updated_records():
+    # the cached records of the issues github listed as updated during this run; no other
+    # cached issue can have changed on github since it was synced
+    records = [store.get(*key) for key in list(github.issue_snapshot)]
+    
+    return [record for record in records if record is not None]
+
+@metrics.phase("diffing")
+def sync_cached_issues(records, notion_index, workers=1, check_github=True, check_notion=True):
+    
+    def check_cache_file(file_json):
+        org, repo, issue_number = file_json.key
+        
+        logger.debug(f"Checking cache: {org}/{repo}/{issue_number}")
+        
+        # Check for changes in github to be patched to notion
+        if check_github:
+            github_command(file_json, github.headers, org, repo, issue_number)
+        
+        # check for change in notion to be patched to github
+        if check_notion:
+            notion_command(file_json, notion.headers, org, repo, issue_number, notion_index)
+    
+    run_concurrently(check_cache_file, records, workers = workers)
+    
+
+# the daemon and the webhook worker both apply commands, and must not pick up the same one
+commands_lock = threading.Lock()
+
+def apply_pending_commands(workers=1, repos=None):
+    with commands_lock:
+        _apply_pending_commands(workers = workers, repos = repos)
+
+@metrics.phase("command_application")
+def _apply_pending_commands(workers=1, repos=None):
+    
+    logger.info("Beginning to implement commands...")
+    
+    # changes found in notion patch github first, then changes found in github patch notion
+    for source, patch, headers in (("notion", patch_github_issue, github.headers),
+                                   ("github", patch_notion_database, notion.headers)):
+        
+        def apply_command(command):
+            ids, record = command
+            
+            # a replayed command whose change already reached the cache was applied
+            # before a crash, so only the marker is missing
+            if store.fingerprint(*record.key) == issue_fingerprint(record):
+                store.complete_commands(ids, record)
+                metrics.count("commands_noop")
+                return
+            
+            logger.debug(f"Applying {source} command for {record.organization}/{record.repo}/{record.issue_number}")
+            
+            # one failing command mustn't hold up the others: it is retried on the next run
+            # and given up on after a few attempts, or at once when its issue or page is gone
+            try:
+                patch(record, headers, ids)
+            except Exception as e:
+                gone = isinstance(e, (IssueGone, BlockGone))
+                
+                if store.fail_commands(ids, str(e), gone = gone):
+                    logger.warning(f"Giving up on the {source} command for {record.organization}/{record.repo}/"
+                                   f"{record.issue_number}: {e}")
+                    metrics.count("commands_failed")
+                else:
+                    logger.warning(f"Failed to apply the {source} command for {record.organization}/{record.repo}/"
+                                   f"{record.issue_number}, retrying on the next run: {e}")
+                    metrics.count("commands_retried")
+        
+        # edits to one issue are coalesced into a single write, and issues are independent
+        run_concurrently(apply_command, store.pending_commands(source, repos), workers = workers)
+        
+    store.compact_commands()
+
+def list_issues(repo, since=None):
+    # the repo's issues updated since `since` over REST, or None when it can't be listed
+    (name, url), org = repo
+    
+    try:
+        return list(github.iter_issues(url, since = since))
+    except Exception as e:
+        logger.warning(f"Could not list the issues of {org}/{name}: {e}")
+        return None
+
+def iter_repo_listings(repos, workers=1, since=None):
+    # ((org, name), [issues]) for each of `repos`, a batch of repos at a time so only that
+    # batch's issues are held: every issue, or with `since` (a function of org and name
+    # giving a datetime or None) those updated since. Repos that can't be listed are
+    # logged and left out
+    def repo_since(org, name):
+        return since(org, name) if since is not None else None
+    
+    def list_repo(repo):
+        (name, url), org = repo
+        
+        return list_issues(repo, since = repo_since(org, name))
+        
+    size = github.graphql_batch_size if github.backend == "graphql" else max(workers, 1)
+    
+    for batch in batched(repos, size):
+        listings = None
+        
+        if github.backend == "graphql":
+            try:
+                fetched = github.request_issues_graphql([(org, name, repo_since(org, name)) for (name, url), org in batch])
+                listings = [fetched[(org, name)] for (name, url), org in batch]
+            except Exception as e:
+                logger.warning(f"GraphQL fetch failed ({e}), falling back to REST")
+                
+        if listings is None:
+            listings = run_concurrently(list_repo, batch, workers = workers)
+            
+        for ((name, url), org), issues in zip(batch, listings):
+            if issues is not None:
+                yield (org, name), issues
+
+def iter_listing_pages(repos, workers=1):
+    # every issue of `repos` as ((org, name), [issues], done), where `done` marks the last
+    # part of a repo that was listed in full. Over graphql that is a page at a time, so no
+    # more than a page per repo of the batch is held; over REST it is a repo per worker.
+    # A repo that fails partway is listed again from the start, so its issues can come twice
+    size = github.graphql_batch_size if github.backend == "graphql" else max(workers, 1)
+    
+    for batch in batched(repos, size):
+        unfinished = batch
+        
+        if github.backend == "graphql":
+            done = set()
+            
+            try:
+                for repo, issues, last in github.iter_issues_graphql([(org, name, None) for (name, url), org in batch]):
+                    if last:
+                        done.add(repo)
+                        
+                    yield repo, issues, last
+            except Exception as e:
+                logger.warning(f"GraphQL fetch failed ({e}), falling back to REST")
+                
+            unfinished = [((name, url), org) for (name, url), org in batch if (org, name) not in done]
+            
+        for ((name, url), org), issues in zip(unfinished, run_concurrently(list_issues, unfinished, workers = workers)):
+            if issues is not None:
+                yield (org, name), issues, True
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Rate limiting, retries and connection pooling shared by the github and notion clients
+import requests
+import threading
+import contextvars
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import metrics
+
+logger = logging.getLogger("notion_github_sync")
+
+# Blocks callers so that requests go out at most `rate` per second on average,
+# allowing bursts of up to `capacity`
+class TokenBucket:
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+        
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+                    
+            time.sleep(wait)
+            
+    def pause(self, seconds):
+        # hold back every caller, e.g. for a `Retry-After`
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            
+    def refund(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+            
+    def update(self, response):
+        pass
+
+# Spreads whatever is left of the hourly budget over the time until it resets
+class GithubRateLimiter(TokenBucket):
+    
+    def __init__(self, rate=5000 / 3600, capacity=50, share=1):
+        # `share` is this process's fraction of the token's quota, when shard workers share a token
+        self.share = share
+        
+        super().__init__(rate * share, capacity)
+        
+    def update(self, response):
+        # a 304 doesn't count against the quota, so it shouldn't use up budget here either
+        if response.status_code == 304:
+            self.refund()
+            
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        
+        if remaining is None or reset is None:
+            return
+        
+        seconds_left = max(int(reset) - time.time(), 1)
+        
+        with self.lock:
+            self.rate = max(int(remaining) * self.share / seconds_left, 1 / seconds_left)
+
+def retry_after(response):
+    # seconds to wait before retrying a rate limited response, or None if it wasn't rate limited
+    if response.status_code not in (403, 429):
+        return None
+    
+    if 'Retry-After' in response.headers:
+        return float(response.headers['Retry-After'])
+    
+    if response.headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in response.headers:
+        return max(int(response.headers['X-RateLimit-Reset']) - time.time(), 1)
+    
+    return 60 if response.status_code == 429 else None
+
+def make_session(pool_size=16):
+    # one keep-alive session per API host so repeated calls skip the TCP/TLS handshake
+    session = requests.Session()
+    
+    # only connection failures are retried here, since the request never reached the server;
+    # status based retries happen in `rate_limited_request` where the buckets can see them
+    # (including a 429 with Retry-After, which urllib3 would otherwise turn into an exception)
+    adapter = HTTPAdapter(pool_connections = 1,
+                          pool_maxsize = pool_size,
+                          max_retries = Retry(total = 3, read = 0, status = 0, backoff_factor = 0.5,
+                                              respect_retry_after_header = False))
+    
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    
+    return session
+
+def connection_stats(session):
+    # how many requests went over a reused connection versus a fresh handshake
+    new = 0
+    requests_sent = 0
+    
+    # the same adapter is mounted for both schemes, so only count it once
+    adapters = {id(adapter) : adapter for adapter in session.adapters.values()}
+    
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        
+        for key in pools.keys():
+            pool = pools[key]
+            new += pool.num_connections
+            requests_sent += pool.num_requests
+            
+    return {'new' : new, 'reused' : requests_sent - new}
+
+IDEMPOTENT_METHODS = {'get', 'head', 'options', 'put', 'patch', 'delete'}
+
+def backoff_delay(attempt):
+    # exponential backoff with jitter so concurrent workers don't retry in lockstep
+    return min(2 ** attempt, 30) + random.uniform(0, 1)
+
+def rate_limited_request(limiter, session, method, url, max_attempts=5, idempotent=None, service=None, **kwargs):
+    
+    # our PATCHes set absolute values, so replaying one is harmless
+    if idempotent is None:
+        idempotent = method.lower() in IDEMPOTENT_METHODS
+        
+    kwargs.setdefault('timeout', 30)
+    
+    for attempt in range(max_attempts):
+        limiter.acquire()
+        
+        started = time.monotonic()
+        
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.count(f"{service}_connection_errors")
+            
+            if not idempotent or attempt == max_attempts - 1:
+                raise
+            
+            logger.warning(f"{e.__class__.__name__} on {url}, retrying")
+            metrics.count(f"{service}_retries")
+            time.sleep(backoff_delay(attempt))
+            continue
+        
+        metrics.observe_request(service, method, url, response.status_code, time.monotonic() - started)
+        
+        if 'X-RateLimit-Remaining' in response.headers:
+            metrics.gauge(f"{service}_ratelimit_remaining", int(response.headers['X-RateLimit-Remaining']))
+        
+        limiter.update(response)
+        
+        wait = retry_after(response)
+        
+        if wait is not None:
+            logger.warning(f"Rate limited on {url}, waiting {wait:.0f}s")
+            metrics.count(f"{service}_retries")
+            limiter.pause(wait)
+            continue
+        
+        if response.status_code >= 500 and idempotent and attempt < max_attempts - 1:
+            logger.warning(f"Got {response.status_code} from {url}, retrying")
+            metrics.count(f"{service}_retries")
+            time.sleep(backoff_delay(attempt))
+            continue
+        
+        break
+        
+    return response
+
+def run_concurrently(function, items, workers=1):
+    # map `function` over `items` on a bounded thread pool; the first exception is re-raised.
+    # Each item runs in a copy of the caller's context, so it sees the caller's active engine
+    if workers <= 1:
+        return [function(item) for item in items]
+    
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, function, item) for item in items]
+        
+        return [future.result() for future in futures]
+
+def batched(iterable, size):
+    # lists of up to `size` items, without materializing the whole iterable
+    batch = []
+    
+    for item in iterable:
+        batch.append(item)
+        
+        if len(batch) == size:
+            yield batch
+            batch = []
+            
+    if batch:
+        yield batch
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# GitHub webhook receiver feeding changed issues into the sync
+import json
+import hashlib
+import threading
+import contextvars
+import time
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+
+from .transport import run_concurrently
+from .sync import upload_issue, github_command, apply_pending_commands
+from .engine import store, github, current_engine
+
+logger = logging.getLogger("notion_github_sync")
+
+def verify_signature(secret, body, signature):
+    # `X-Hub-Signature-256` is the hex HMAC-SHA256 of the raw body, keyed with the webhook secret
+    if not signature or not signature.startswith('sha256='):
+        return False
+    
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    
+    return hmac.compare_digest(expected, signature)
+
+# Webhook work units keyed by (org, repo, issue_number). A burst of deliveries for one
+# issue collapses into a single unit carrying the latest payload, released once the
+# issue has been quiet for `debounce` seconds
+class WebhookQueue:
+    
+    def __init__(self, debounce=2):
+        self.debounce = debounce
+        self.pending = {}
+        self.condition = threading.Condition()
+        
+    def put(self, key, issue):
+        with self.condition:
+            # a delivery without a payload must not overwrite one that has it
+            if issue is None and key in self.pending:
+                issue = self.pending[key][0]
+                
+            self.pending[key] = (issue, time.monotonic() + self.debounce)
+            self.condition.notify()
+            
+    def get_ready(self, timeout=None, flush=False):
+        # [(key, issue), ...] whose debounce has passed, waiting up to `timeout` for one
+        with self.condition:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            
+            while True:
+                now = time.monotonic()
+                
+                ready = [key for key, (_, due) in self.pending.items() if flush or due <= now]
+                
+                if ready:
+                    return [(key, self.pending.pop(key)[0]) for key in ready]
+                
+                if deadline is not None and now >= deadline:
+                    return []
+                
+                waits = [due - now for _, due in self.pending.values()]
+                
+                if deadline is not None:
+                    waits.append(deadline - now)
+                
+                self.condition.wait(min(waits) if waits else None)
+                
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        
+        if not verify_signature(self.server.secret, body, self.headers.get('X-Hub-Signature-256')):
+            self.send_response(401)
+            self.end_headers()
+            return
+        
+        event = self.headers.get('X-GitHub-Event')
+        payload = json.loads(body.decode('utf-8'))
+        
+        # handler threads don't inherit the context of the daemon that started the server
+        with self.server.engine.activate():
+            queued = webhook_work_units(event, payload)
+        
+        for key, issue in queued:
+            self.server.queue.put(key, issue)
+            
+        self.send_response(202 if queued else 204)
+        self.end_headers()
+
+def webhook_work_units(event, payload):
+    # turn one delivery into [((org, repo, issue_number), issue payload or None), ...]
+    if event == 'issues':
+        org = payload['repository']['owner']['login']
+        repo = payload['repository']['name']
+        
+        return [((org, repo, payload['issue']['number']), payload['issue'])]
+    
+    if event == 'label' and payload['action'] in ('edited', 'deleted'):
+        # a renamed or deleted label touches every cached issue carrying it, and the
+        # delivery doesn't include those issues, so they are fetched when processed
+        org = payload['repository']['owner']['login']
+        repo = payload['repository']['name']
+        
+        name = payload.get('changes', {}).get('name', {}).get('from', payload['label']['name'])
+        
+        return [(record.key, None) for record in store.records({(org, repo)}) if name in record.labels]
+    
+    return []
+
+def handle_webhook_issue(key, issue):
+    org, repo, issue_number = key
+    
+    record = store.get(org, repo, issue_number)
+    
+    if record is None:
+        # an issue we haven't seen yet goes the same way as in upload_all_issues
+        if issue is not None:
+            upload_issue(issue, repo, org)
+        return
+    
+    github_command(record, github.headers, org, repo, issue_number, gh_issue=issue)
+
+def process_webhook_queue(queue, stopping, workers=1):
+    
+    while not stopping.is_set():
+        ready = queue.get_ready(timeout = 1)
+        
+        if ready:
+            logger.info(f"Processing {len(ready)} webhook deliveries")
+            run_concurrently(lambda item : handle_webhook_issue(*item), ready, workers = workers)
+            apply_pending_commands(workers = workers)
+    
+    # flush whatever arrived before shutdown
+    ready = queue.get_ready(timeout = 0, flush = True)
+    
+    if ready:
+        run_concurrently(lambda item : handle_webhook_issue(*item), ready, workers = workers)
+        apply_pending_commands(workers = workers)
+
+def start_webhook_receiver(secret, port=8080, host='', workers=1):
+    # returns (server, worker thread, stop event); set the event and shut the server
+    # down to stop, then join the worker to let it flush
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+    server.secret = secret
+    server.engine = current_engine()
+    server.queue = WebhookQueue()
+    
+    stopping = threading.Event()
+    
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    
+    worker = threading.Thread(target = contextvars.copy_context().run,
+                              args = (process_webhook_queue, server.queue, stopping, workers))
+    worker.start()
+    
+    logger.info(f"Listening for github webhooks on port {server.server_address[1]}")
+    
+    return server, worker, stopping
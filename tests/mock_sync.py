@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# A SyncEngine run against the stand-in GitHub and Notion servers of the benchmarks
+import datetime
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from mock_api import Dataset, MockGithub, MockNotion, rich_text, notion_timestamp
+
+from notion_github_sync import SyncEngine
+from notion_github_sync.records import IssueRecord, page_key
+
+class MockSyncTestCase(unittest.TestCase):
+    
+    repos = 2
+    issues = 5
+    
+    # SyncConfig options on top of those pointing the engine at the servers
+    options = {}
+    
+    def setUp(self):
+        self.dataset = Dataset(repos = self.repos, issues = self.issues, body_size = 200, seed = 0)
+        self.github = MockGithub(self.dataset).start()
+        self.notion = MockNotion(self.dataset, rate = 0).start()
+        self.directory = tempfile.TemporaryDirectory()
+        
+        self.engine = SyncEngine(github_token = "token", notion_token = "token", database_id = "database",
+                                 github_api_url = self.github.url, notion_api_url = self.notion.url,
+                                 cache_dir = self.directory.name, notion_rate = 1000, workers = 2, **self.options)
+                                 
+    def tearDown(self):
+        self.github.stop()
+        self.notion.stop()
+        self.engine.store.connection.close()
+        self.directory.cleanup()
+        
+    def edit_issue(self, key, updated_at=None, **fields):
+        # as if someone had edited the issue on github, just now or at `updated_at`
+        with self.dataset.lock:
+            self.dataset.issues[key].update(fields, updated_at = updated_at or datetime.datetime.utcnow())
+            
+    def delete_issue(self, key):
+        with self.dataset.lock:
+            del self.dataset.issues[key]
+            self.dataset.repos[key[:2]].remove(key[2])
+            
+    def edit_page(self, key, title):
+        # as if someone had just retitled the issue's page in notion
+        with self.dataset.lock:
+            page = self.page(key)
+            page['properties']['Title'] = {'type' : 'title', 'title' : rich_text(title)}
+            page['last_edited_time'] = notion_timestamp(datetime.datetime.utcnow())
+            
+    def page(self, key):
+        return [page for page in self.dataset.pages.values() if page_key(page) == key and not page.get('archived')][0]
+        
+    def notion_record(self, key):
+        return IssueRecord.from_notion(self.page(key))
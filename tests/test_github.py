@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+from notion_github_sync.github import GithubData, ResponseCache
+
+def repo(owner, name):
+    return {'name' : name, 'owner' : {'login' : owner}, 'url' : f"https://api.github.com/repos/{owner}/{name}"}
+
+class ListedGithubData(GithubData):
+    
+    def __init__(self, listings, user_repos):
+        super().__init__("user", "token", orgs = list(listings))
+        self.listings = listings
+        self.user_repos = user_repos
+        
+    def _get_org_repos(self, org):
+        return self.listings[org]
+        
+    def _get_user_repos(self):
+        return self.user_repos
+
+class IssueUrlsTest(unittest.TestCase):
+    
+    def test_same_named_repos_under_different_owners(self):
+        github = ListedGithubData({"org-a" : [repo("org-a", "analysis")], "org-b" : [repo("org-b", "analysis")]},
+                                  [repo("user", "analysis"), repo("user", "notes")])
+                                  
+        self.assertEqual(github.get_all_issue_urls(), [
+            (("analysis", "https://api.github.com/repos/org-a/analysis/issues"), "org-a"),
+            (("analysis", "https://api.github.com/repos/org-b/analysis/issues"), "org-b"),
+            (("analysis", "https://api.github.com/repos/user/analysis/issues"), "user"),
+            (("notes", "https://api.github.com/repos/user/notes/issues"), "user"),
+        ])
+        
+    def test_repo_listed_twice_is_kept_once(self):
+        github = ListedGithubData({"user" : [repo("user", "notes")]}, [repo("user", "notes")])
+        
+        self.assertEqual(github.get_all_issue_urls(), [(("notes", "https://api.github.com/repos/user/notes/issues"), "user")])
+
+class IterIssuesTest(unittest.TestCase):
+    
+    def test_issues_updated_at_the_mark_are_listed(self):
+        since = datetime.datetime(2024, 5, 1, 12, 0, 0)
+        
+        # newest first, as github sends them: two updated in the mark's second, then an older one
+        listing = [{'number' : number, 'updated_at' : updated_at} for number, updated_at in
+                   ((3, "2024-05-01T12:00:01Z"), (2, "2024-05-01T12:00:00Z"), (1, "2024-05-01T12:00:00Z"), (0, "2024-05-01T11:59:59Z"))]
+                   
+        github = GithubData("user", "token")
+        
+        with mock.patch.object(github, '_paginate', return_value = iter(listing)):
+            self.assertEqual([issue['number'] for issue in github.iter_issues("url", since = since)], [3, 2, 1])
+
+class ResponseCacheTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.directory.name)
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def test_round_trip(self):
+        self.cache.set("url", {"etag" : "x", "body" : [1]})
+        
+        self.assertEqual(self.cache.get("url"), {"etag" : "x", "body" : [1]})
+        self.assertIsNone(self.cache.get("other"))
+        
+    def test_evicted_entry_is_a_miss(self):
+        self.cache.set("url", {"etag" : "x"})
+        self.cache._entry_path("url").unlink()
+        
+        self.assertIsNone(self.cache.get("url"))
+        
+    def test_entry_evicted_while_read_is_a_miss(self):
+        self.cache.set("url", {"etag" : "x"})
+        
+        with mock.patch("os.utime", side_effect = FileNotFoundError):
+            self.assertIsNone(self.cache.get("url"))
+            
+    def test_unreadable_entry_is_a_miss(self):
+        self.cache.set("url", {"etag" : "x"})
+        self.cache._entry_path("url").write_text('{"etag"')
+        
+        self.assertIsNone(self.cache.get("url"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from notion_github_sync.merge import SortedRuns, merge_join
+
+class SortedRunsTest(unittest.TestCase):
+    
+    def test_sorts_in_memory(self):
+        with SortedRuns(budget = 10) as runs:
+            for key in [3, 1, 2]:
+                runs.add(key, str(key))
+                
+            self.assertEqual(list(runs), [(1, "1"), (2, "2"), (3, "3")])
+            self.assertEqual(runs.runs, [])
+            
+    def test_spills_and_merges_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            runs = SortedRuns(budget = 3, directory = directory)
+            keys = [7, 2, 9, 4, 4, 1, 8, 3, 6, 5, 0]
+            
+            for n, key in enumerate(keys):
+                runs.add(key, n)
+                
+            self.assertEqual(len(runs.runs), 3)
+            self.assertEqual(len(runs), len(keys))
+            
+            # equal keys come back in the order they were added
+            self.assertEqual(list(runs), sorted(((key, n) for n, key in enumerate(keys)), key = lambda pair : pair[0]))
+            
+            runs.close()
+            self.assertEqual(os.listdir(directory), [])
+
+class MergeJoinTest(unittest.TestCase):
+    
+    def test_groups_keys_across_streams(self):
+        listing = [(1, "a"), (2, "b"), (2, "c"), (4, "d")]
+        pages = [(2, "p"), (3, "q")]
+        
+        self.assertEqual(list(merge_join(listing, pages)), [
+            (1, ["a"], []),
+            (2, ["b", "c"], ["p"]),
+            (3, [], ["q"]),
+            (4, ["d"], []),
+        ])
+        
+    def test_empty_streams(self):
+        self.assertEqual(list(merge_join([], [])), [])
+        self.assertEqual(list(merge_join([(1, "a")], [], [])), [(1, ["a"], [], [])])
+        
+    def test_tuple_keys(self):
+        listing = [(("org", "repo", 1), "x"), (("org", "repo", 10), "y")]
+        records = [(("org", "repo", 2), "z"), (("org", "repo", 10), "w")]
+        
+        self.assertEqual([key for key, *_ in merge_join(listing, records)],
+                         [("org", "repo", 1), ("org", "repo", 2), ("org", "repo", 10)])
+
+if __name__ == "__main__":
+    unittest.main()
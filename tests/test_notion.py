@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import itertools
+import unittest
+
+from notion_github_sync.notion import NotionDatabase
+from notion_github_sync.records import block_digest
+
+# a page held in memory: its blocks as [block_id, type, text], and the writes made to it
+class PageNotion(NotionDatabase):
+    
+    def __init__(self, blocks):
+        super().__init__("database", "token")
+        self.ids = (f"block-{n}" for n in itertools.count())
+        self.page = [[next(self.ids), block_type, text] for block_type, text in blocks]
+        self.calls = []
+        
+    def cached_blocks(self):
+        return [[block_id, block_type, block_digest(text)] for block_id, block_type, text in self.page]
+        
+    def append_blocks(self, block_id, chunks, after=None):
+        self.calls.append(('append', after, len(chunks)))
+        
+        position = len(self.page) if after is None else [block[0] for block in self.page].index(after) + 1
+        new = [[next(self.ids), 'paragraph', chunk] for chunk in chunks]
+        self.page[position:position] = new
+        
+        return [[block_id, 'paragraph', block_digest(text)] for block_id, _, text in new]
+        
+    def update_block(self, block_id, chunk):
+        self.calls.append(('update', block_id))
+        
+        for block in self.page:
+            if block[0] == block_id:
+                block[2] = chunk
+                
+    def delete_block(self, block_id):
+        self.calls.append(('delete', block_id))
+        
+        self.page = [block for block in self.page if block[0] != block_id]
+
+class WriteBodyTest(unittest.TestCase):
+    
+    def write(self, blocks, body):
+        notion = PageNotion(blocks)
+        written = notion.write_body("page", body, notion.cached_blocks())
+        
+        # the page reads back as the body, and the blocks returned are the page's
+        self.assertEqual("\n\n".join(text for _, _, text in notion.page), body)
+        self.assertEqual(written, notion.cached_blocks())
+        
+        return notion
+        
+    def paragraphs(self, *texts):
+        return [('paragraph', text) for text in texts]
+        
+    def test_unchanged_body_writes_nothing(self):
+        notion = self.write(self.paragraphs("a", "b"), "a\n\nb")
+        
+        self.assertEqual(notion.calls, [])
+        
+    def test_edited_paragraph_is_updated_in_place(self):
+        notion = self.write(self.paragraphs("a", "b", "c"), "a\n\nB\n\nc")
+        
+        self.assertEqual(notion.calls, [('update', "block-1")])
+        
+    def test_new_paragraph_is_appended_after_the_last(self):
+        notion = self.write(self.paragraphs("a", "b"), "a\n\nb\n\nc")
+        
+        self.assertEqual(notion.calls, [('append', "block-1", 1)])
+        
+    def test_removed_paragraph_is_deleted(self):
+        notion = self.write(self.paragraphs("a", "b", "c"), "a\n\nc")
+        
+        self.assertEqual(notion.calls, [('delete', "block-1")])
+        
+    def test_new_leading_paragraph(self):
+        # notion can't insert first, so the first block takes the new text and its own
+        # moves down after it
+        notion = self.write(self.paragraphs("a", "b"), "x\n\na\n\nb")
+        
+        self.assertEqual(notion.calls, [('update', "block-0"), ('append', "block-0", 1)])
+        
+    def test_other_blocks_are_replaced(self):
+        notion = self.write([('image', ""), ('paragraph', "a")], "a")
+        
+        self.assertEqual(notion.calls, [('delete', "block-0")])
+        
+    def test_empty_page_is_appended_to(self):
+        notion = self.write([], "a\n\nb")
+        
+        self.assertEqual(notion.calls, [('append', None, 2)])
+        
+    def test_emptied_body_is_deleted(self):
+        notion = self.write(self.paragraphs("a", "b"), "")
+        
+        self.assertEqual(notion.calls, [('delete', "block-0"), ('delete', "block-1")])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+from mock_sync import MockSyncTestCase
+
+from notion_github_sync.merge import SortedRuns
+from notion_github_sync.records import page_key
+
+class ReconcileTest(MockSyncTestCase):
+    
+    repos = 3
+    issues = 6
+    
+    def setUp(self):
+        super().setUp()
+        self.engine.bulk_import()
+        
+        # an issue deleted and one transferred on github, a page archived by hand and a page duplicated
+        drift = self.dataset.drift()
+        
+        self.deleted = tuple(drift['deleted'])
+        self.moved, self.transferred = [tuple(key) for key in drift['transferred']]
+        self.archived = page_key(self.dataset.pages[drift['archived']])
+        self.duplicated = page_key(self.dataset.pages[drift['duplicated']])
+        
+        # and an issue retitled on github since it was synced
+        drifted = (self.deleted, self.transferred, self.archived, self.duplicated)
+        self.changed = [key for key in sorted(self.dataset.issues) if key not in drifted][0]
+        self.edit_issue(self.changed, title = "Edited on github")
+        
+    def live_pages(self, key):
+        return [page for page in self.dataset.pages.values() if page_key(page) == key and not page['archived']]
+        
+    def test_classification(self):
+        found = self.engine.reconcile(dry_run = True)
+        
+        self.assertEqual(found['orphaned'], [self.deleted])
+        self.assertEqual(found['transferred'], [(self.moved, self.transferred)])
+        self.assertEqual(found['missing'], [self.archived])
+        self.assertEqual(found['duplicated'], [self.duplicated])
+        self.assertEqual(found['updated'], [self.changed])
+        
+    def test_dry_run_writes_nothing(self):
+        pages = len(self.dataset.pages)
+        
+        self.engine.reconcile(dry_run = True)
+        
+        self.assertEqual(len(self.dataset.pages), pages)
+        self.assertEqual(len(self.live_pages(self.deleted)), 1)
+        self.assertIsNotNone(self.engine.store.get(*self.deleted))
+        self.assertIsNotNone(self.engine.store.get(*self.moved))
+        
+    def test_repair(self):
+        self.engine.reconcile()
+        
+        # the deleted issue's page is archived and its record dropped
+        self.assertEqual(self.live_pages(self.deleted), [])
+        self.assertIsNone(self.engine.store.get(*self.deleted))
+        
+        # the transferred issue keeps its page, pointed at its new key
+        self.assertEqual(self.live_pages(self.moved), [])
+        self.assertEqual(len(self.live_pages(self.transferred)), 1)
+        self.assertIsNone(self.engine.store.get(*self.moved))
+        self.assertEqual(self.engine.store.get(*self.transferred).page_id, self.live_pages(self.transferred)[0]['id'])
+        
+        # the archived page is made again, and one of the duplicates is archived
+        self.assertEqual(len(self.live_pages(self.archived)), 1)
+        self.assertEqual(self.engine.store.get(*self.archived).page_id, self.live_pages(self.archived)[0]['id'])
+        self.assertEqual(len(self.live_pages(self.duplicated)), 1)
+        
+        # the retitled issue's page is brought up to date
+        self.assertEqual(self.notion_record(self.changed).title, "Edited on github")
+        
+        # and a second pass finds nothing left to do
+        self.assertFalse(any(self.engine.reconcile(dry_run = True).values()))
+        
+    def test_commands_of_dropped_records_are_given_up_on(self):
+        # a notion edit to the deleted issue still in the journal
+        record = self.engine.store.get(*self.deleted)
+        record.title = "Edited in notion"
+        self.engine.store.enqueue_command("notion", record)
+        
+        self.engine.reconcile()
+        
+        self.assertEqual(self.engine.store.pending_commands("notion"), [])
+        
+        # so the next sync doesn't replay it against the deleted issue
+        with self.assertNoLogs("notion_github_sync", "WARNING"):
+            self.engine.sync()
+            
+    def test_failing_command_does_not_stop_repair(self):
+        # the command queued for the retitled issue fails, and is left to be retried
+        with mock.patch("notion_github_sync.sync.patch_notion_database", side_effect = Exception("unavailable")):
+            with self.assertLogs("notion_github_sync", "WARNING"):
+                found = self.engine.reconcile()
+                
+        self.assertEqual(found['updated'], [self.changed])
+        self.assertEqual(self.live_pages(self.deleted), [])
+        self.assertEqual(len(self.engine.store.pending_commands("github")), 1)
+        
+        # and the next pass applies it
+        self.engine.reconcile()
+        
+        self.assertEqual(self.notion_record(self.changed).title, "Edited on github")
+        self.assertEqual(self.engine.store.pending_commands("github"), [])
+
+class SpilledReconcileTest(ReconcileTest):
+    # the same reconciliation with the listing and the database scan sorted in runs of two
+    # rows spilled to disk, so the join merges many runs
+    
+    options = {'merge_budget' : 2}
+    
+    def setUp(self):
+        super().setUp()
+        
+        spill = mock.patch.object(SortedRuns, 'spill', autospec = True, side_effect = SortedRuns.spill)
+        self.spill = spill.start()
+        self.addCleanup(spill.stop)
+        
+    def tearDown(self):
+        # every test here has to have gone through spilled runs to mean anything
+        self.assertGreater(self.spill.call_count, 2)
+        super().tearDown()
+
+if __name__ == "__main__":
+    unittest.main()
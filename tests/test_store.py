@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from notion_github_sync.records import IssueRecord
+from notion_github_sync.store import IssueStore, MIGRATIONS
+
+REPOS = [("org", f"repo{i}") for i in range(4)]
+
+def record(org, repo, issue_number):
+    return IssueRecord(title = f"Issue {issue_number}", url = f"https://github.com/{org}/{repo}/issues/{issue_number}",
+                       state = "open", labels = [], organization = org, repo = repo, issue_number = issue_number,
+                       body = "", api_url = f"https://api.github.com/repos/{org}/{repo}/issues/{issue_number}")
+
+class StoreTestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = IssueStore(Path(self.directory.name) / "issues.sqlite3")
+        
+    def tearDown(self):
+        self.store.connection.close()
+        self.directory.cleanup()
+
+class RecordsTest(StoreTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.store.put_many([record(org, repo, n) for org, repo in REPOS for n in (10, 2)])
+        
+    def test_all_records_in_key_order(self):
+        self.assertEqual([r.key for r in self.store.records()],
+                         [(org, repo, n) for org, repo in REPOS for n in (2, 10)])
+                         
+    def test_records_of_some_repos(self):
+        self.assertEqual([r.key for r in self.store.records({REPOS[2], REPOS[0], ("org", "missing")})],
+                         [(*REPOS[0], 2), (*REPOS[0], 10), (*REPOS[2], 2), (*REPOS[2], 10)])
+
+class CommandsTest(StoreTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.store.enqueue_command("notion", record(*REPOS[0], 1))
+        self.ids, _ = self.store.pending_commands("notion")[0]
+        
+    def test_given_up_on_after_max_attempts(self):
+        for _ in range(4):
+            self.assertFalse(self.store.fail_commands(self.ids, "server error"))
+            self.assertEqual(len(self.store.pending_commands("notion")), 1)
+            
+        self.assertTrue(self.store.fail_commands(self.ids, "server error"))
+        self.assertEqual(self.store.pending_commands("notion"), [])
+        
+    def test_given_up_on_at_once_when_gone(self):
+        self.assertTrue(self.store.fail_commands(self.ids, "Not Found", gone = True))
+        self.assertEqual(self.store.pending_commands("notion"), [])
+        
+        row = self.store.connection.execute("SELECT attempts, error FROM commands").fetchone()
+        self.assertEqual(row, (1, "Not Found"))
+        
+    def test_same_change_isnt_queued_again(self):
+        self.store.fail_commands(self.ids, "Not Found", gone = True)
+        self.store.enqueue_command("notion", record(*REPOS[0], 1))
+        
+        self.assertEqual(self.store.pending_commands("notion"), [])
+        
+    def test_given_up_on_when_the_issue_moves(self):
+        # the command still carries the old key and API URL
+        self.store.move((*REPOS[0], 1), record(*REPOS[1], 7))
+        
+        self.assertEqual(self.store.pending_commands("notion"), [])
+        self.assertEqual(self.store.connection.execute("SELECT error FROM commands").fetchone()[0], "issue moved to another key")
+
+class MigrationTest(unittest.TestCase):
+    
+    def test_old_store_gets_the_new_columns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "issues.sqlite3"
+            
+            # a journal from before commands could fail, and records indexed by more than their key
+            with sqlite3.connect(path) as connection:
+                connection.execute("""
+                    CREATE TABLE commands (id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT NOT NULL,
+                    organization TEXT NOT NULL, repo TEXT NOT NULL, issue_number INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL, record TEXT NOT NULL, created_at TEXT NOT NULL, applied_at TEXT)
+                """)
+                connection.execute("""
+                    CREATE TABLE issues (organization TEXT NOT NULL, repo TEXT NOT NULL, issue_number INTEGER NOT NULL,
+                    page_id TEXT, updated_at TEXT NOT NULL, content_hash TEXT NOT NULL, record TEXT NOT NULL,
+                    PRIMARY KEY (organization, repo, issue_number))
+                """)
+                
+                for column in ('page_id', 'updated_at', 'content_hash'):
+                    connection.execute(f"CREATE INDEX issues_{column} ON issues ({column})")
+                    
+            connection.close()
+            
+            store = IssueStore(path)
+            columns = [row[1] for row in store.connection.execute("PRAGMA table_info(commands)")]
+            
+            self.assertEqual(columns[-3:], ["attempts", "error", "failed_at"])
+            
+            # the primary key's own index has no sql
+            indexes = store.connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'issues' AND sql IS NOT NULL")
+            self.assertEqual(indexes.fetchall(), [])
+            self.assertEqual(store.connection.execute("PRAGMA user_version").fetchone()[0], len(MIGRATIONS))
+            
+            store.connection.close()
+            
+            # and opening it again doesn't migrate it twice
+            store = IssueStore(path)
+            store.connection.close()
+
+class LeaseTest(StoreTestCase):
+    
+    def test_single_worker_takes_everything(self):
+        owned, taken_over = self.store.acquire_leases("a", REPOS)
+        
+        self.assertEqual(owned, REPOS)
+        self.assertEqual(taken_over, {})
+        
+    def test_split_between_workers(self):
+        self.store.acquire_leases("a", REPOS)
+        
+        # b can't claim anything a holds until a hands its surplus back
+        owned, _ = self.store.acquire_leases("b", REPOS)
+        self.assertEqual(owned, [])
+        
+        owned_a, _ = self.store.acquire_leases("a", REPOS)
+        owned_b, taken_over = self.store.acquire_leases("b", REPOS)
+        
+        self.assertEqual(len(owned_a), 2)
+        self.assertEqual(sorted(owned_a + owned_b), REPOS)
+        
+    def test_handed_back_lease_names_previous_owner(self):
+        self.store.acquire_leases("a", REPOS)
+        self.store.acquire_leases("b", REPOS)
+        self.store.acquire_leases("a", REPOS)
+        
+        owned, taken_over = self.store.acquire_leases("b", REPOS)
+        
+        self.assertEqual(taken_over, {repo : "a" for repo in owned})
+        
+    def test_renew_skips_handed_back_leases(self):
+        self.store.acquire_leases("a", REPOS)
+        self.store.acquire_leases("b", REPOS)
+        self.store.acquire_leases("a", REPOS)
+        
+        self.assertEqual(self.store.renew_leases("a"), 2)
+        
+        owned, _ = self.store.acquire_leases("b", REPOS)
+        self.assertEqual(len(owned), 2)
+        
+    def test_released_lease_names_previous_owner(self):
+        self.store.acquire_leases("a", REPOS)
+        self.store.release_leases("a")
+        
+        owned, taken_over = self.store.acquire_leases("b", REPOS)
+        
+        self.assertEqual(owned, REPOS)
+        self.assertEqual(taken_over, {repo : "a" for repo in REPOS})
+        
+    def test_expired_lease_names_previous_owner(self):
+        self.store.acquire_leases("a", REPOS)
+        
+        # a dies without releasing its leases
+        with self.store.connection:
+            self.store.connection.execute("UPDATE leases SET expires_at = 0")
+            self.store.connection.execute("DELETE FROM workers")
+            
+        owned, taken_over = self.store.acquire_leases("b", REPOS)
+        
+        self.assertEqual(owned, REPOS)
+        self.assertEqual(taken_over, {repo : "a" for repo in REPOS})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import datetime
+import unittest
+from unittest import mock
+
+from mock_sync import MockSyncTestCase
+
+from notion_github_sync.daemon import SyncDaemon
+
+class ListedEditsTest(MockSyncTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.engine.bulk_import()
+        
+        self.keys = sorted(self.dataset.issues)[:3]
+        
+        # a second apart, so only the last one is at the mark a failed run reached
+        now = datetime.datetime.utcnow().replace(microsecond = 0)
+        
+        for n, key in enumerate(self.keys):
+            self.edit_issue(key, title = f"Edited {key[2]}", updated_at = now - datetime.timedelta(seconds = len(self.keys) - n))
+            
+    def assertEditsSynced(self):
+        for key in self.keys:
+            self.assertEqual(self.engine.store.get(*key).title, f"Edited {key[2]}")
+            self.assertEqual(self.notion_record(key).title, f"Edited {key[2]}")
+            
+    def test_failure_between_listing_and_diffing(self):
+        # the issues were listed, but the run dies before they are diffed
+        with mock.patch("notion_github_sync.sync.sync_comments", side_effect = Exception("comments failed")):
+            with self.assertRaises(Exception):
+                self.engine.sync()
+                
+        self.engine.sync()
+        
+        self.assertEditsSynced()
+        
+    def test_failed_daemon_cycle(self):
+        with self.engine.activate():
+            daemon = SyncDaemon(self.engine.since, self.engine.high_water_marks, self.engine.notion_marks, workers = 2)
+            daemon.discover()
+            due = daemon.due_repos()
+            
+            with mock.patch("notion_github_sync.daemon.sync_comments", side_effect = Exception("comments failed")):
+                with self.assertRaises(Exception):
+                    daemon.run_cycle(due)
+                    
+            self.engine.github.issue_snapshot.clear()
+            daemon.run_cycle(due)
+            
+        self.assertEditsSynced()
+
+class SameSecondEditsTest(MockSyncTestCase):
+    
+    # the REST listing, which stops by itself once it is past the mark
+    options = {'backend' : "rest"}
+    
+    def test_edit_in_the_same_second_as_the_mark(self):
+        self.engine.bulk_import()
+        
+        first, second = sorted(self.dataset.issues)[:2]
+        now = datetime.datetime.utcnow().replace(microsecond = 0)
+        
+        # the run's mark is the first edit, and the second lands in the same second after it
+        self.edit_issue(first, title = "Edited first", updated_at = now)
+        self.engine.sync()
+        
+        self.edit_issue(second, title = "Edited second", updated_at = now)
+        self.engine.sync()
+        
+        self.assertEqual(self.notion_record(first).title, "Edited first")
+        self.assertEqual(self.notion_record(second).title, "Edited second")
+
+class FailingCommandTest(MockSyncTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.engine.bulk_import()
+        
+        self.deleted, self.edited = sorted(self.dataset.issues)[:2]
+        
+    def test_deleted_issue_doesnt_hold_up_the_others(self):
+        # the page of an issue deleted on github is edited, so its command gets a 404
+        self.edit_page(self.deleted, "Edited in notion")
+        self.delete_issue(self.deleted)
+        self.edit_issue(self.edited, title = "Edited on github")
+        
+        with self.assertLogs("notion_github_sync", "WARNING") as logs:
+            self.engine.sync()
+            
+        self.assertIn("Giving up on the notion command", logs.output[-1])
+        
+        self.assertEqual(self.notion_record(self.edited).title, "Edited on github")
+        self.assertEqual(self.engine.store.pending_commands("notion"), [])
+        
+        attempts, failed_at = self.engine.store.connection.execute("""
+            SELECT attempts, failed_at FROM commands WHERE source = 'notion' AND issue_number = ?
+        """, (self.deleted[2],)).fetchone()
+        
+        self.assertEqual(attempts, 1)
+        self.assertIsNotNone(failed_at)
+        
+        # and later runs don't trip over it, or queue it again
+        self.engine.sync()
+        
+        commands = self.engine.store.connection.execute("SELECT COUNT(*) FROM commands WHERE source = 'notion'").fetchone()[0]
+        self.assertEqual(commands, 1)
+        
+    def test_failing_command_is_retried_then_given_up_on(self):
+        self.edit_page(self.edited, "Edited in notion")
+        
+        with mock.patch("notion_github_sync.sync.patch_github_issue", side_effect = Exception("server error")):
+            for _ in range(4):
+                with self.assertLogs("notion_github_sync", "WARNING") as logs:
+                    self.engine.sync()
+                    
+                self.assertIn("retrying on the next run", logs.output[-1])
+                self.assertEqual(len(self.engine.store.pending_commands("notion")), 1)
+                
+            with self.assertLogs("notion_github_sync", "WARNING") as logs:
+                self.engine.sync()
+                
+        self.assertIn("Giving up", logs.output[-1])
+        
+        self.assertEqual(self.engine.store.pending_commands("notion"), [])
+        self.assertEqual(self.dataset.issues[self.edited]['title'], f"Issue {self.edited[2]} in {self.edited[1]}")
+
+class ImportTest(MockSyncTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.engine.bulk_import()
+        
+    def requests(self, endpoint):
+        return self.notion.stats.snapshot()['requests'].get(endpoint, 0)
+        
+    def test_import_mirrors_comments_and_seeds_the_marks(self):
+        for org, name in self.dataset.repos:
+            ids = [comment_id for comment_id, comment in self.dataset.comments.items() if comment['key'][:2] == (org, name)]
+            
+            self.assertEqual(len(self.engine.store.comment_blocks(org, name, ids)), len(ids))
+            
+        self.assertIsNotNone(self.engine.notion_marks.get("notion", "database"))
+        
+    def test_first_sync_appends_nothing(self):
+        appends = self.requests("PATCH /v1/blocks/{id}/children")
+        pages = self.requests("POST /v1/pages")
+        
+        self.engine.sync()
+        
+        self.assertEqual(self.requests("PATCH /v1/blocks/{id}/children"), appends)
+        self.assertEqual(self.requests("POST /v1/pages"), pages)
+        
+    def test_comment_after_the_import_is_mirrored(self):
+        key = sorted(self.dataset.issues)[0]
+        
+        with self.dataset.lock:
+            self.dataset.add_comment(*key, "After the import", datetime.datetime.utcnow())
+            
+        appends = self.requests("PATCH /v1/blocks/{id}/children")
+        
+        self.engine.sync()
+        
+        self.assertEqual(self.requests("PATCH /v1/blocks/{id}/children"), appends + 1)
+
+class CommentsStayLastTest(MockSyncTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        
+        # an issue with comments, so its page has a comments toggle below the body
+        self.key = sorted({comment['key'] for comment in self.dataset.comments.values()})[0]
+        self.comments = len([comment for comment in self.dataset.comments.values() if comment['key'] == self.key])
+        
+    def content(self):
+        # the page's top-level blocks as (type, text), and the number of blocks in its toggle
+        blocks = self.dataset.blocks[self.page(self.key)['id']]
+        toggles = [block for block in blocks if block['type'] == 'toggle']
+        
+        self.assertEqual(len(toggles), 1)
+        
+        return ([(block['type'], "".join(item['plain_text'] for item in block[block['type']]['rich_text'])) for block in blocks],
+                len(self.dataset.blocks[toggles[0]['id']]))
+                
+    def write_body(self, before, after):
+        self.edit_issue(self.key, body = before)
+        self.engine.bulk_import()
+        self.engine.sync()
+        
+        self.edit_issue(self.key, body = after)
+        self.engine.sync()
+        
+        blocks, comments = self.content()
+        
+        # the body once, in order, then the toggle with every comment in it
+        self.assertEqual(blocks[:-1], [('paragraph', text) for text in after.split("\n\n")])
+        self.assertEqual(blocks[-1][0], 'toggle')
+        self.assertEqual(comments, self.comments)
+        
+    def test_longer_body(self):
+        self.write_body("First", "First\n\nSecond\n\nThird")
+        
+    def test_body_onto_an_empty_page(self):
+        # nothing to append after, so the body lands below the toggle, which is moved
+        self.write_body("", "First\n\nSecond")
+
+if __name__ == "__main__":
+    unittest.main()
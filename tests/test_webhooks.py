@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from notion_github_sync.webhooks import verify_signature, WebhookQueue
+
+# the example delivery from GitHub's webhook documentation
+SECRET = "It's a Secret to Everybody"
+BODY = b"Hello, World!"
+SIGNATURE = "sha256=757107ea0eb2509fc211221cce984b8a37570b6d7586c22c46f4379c8b043e17"
+
+class VerifySignatureTest(unittest.TestCase):
+    
+    def test_valid_signature(self):
+        self.assertTrue(verify_signature(SECRET, BODY, SIGNATURE))
+        
+    def test_tampered_body(self):
+        self.assertFalse(verify_signature(SECRET, BODY + b" ", SIGNATURE))
+        
+    def test_wrong_secret(self):
+        self.assertFalse(verify_signature("another secret", BODY, SIGNATURE))
+        
+    def test_missing_or_unprefixed_signature(self):
+        self.assertFalse(verify_signature(SECRET, BODY, None))
+        self.assertFalse(verify_signature(SECRET, BODY, ""))
+        self.assertFalse(verify_signature(SECRET, BODY, SIGNATURE[len("sha256="):]))
+
+class WebhookQueueTest(unittest.TestCase):
+    
+    def test_deliveries_for_one_issue_collapse(self):
+        queue = WebhookQueue(debounce = 0)
+        
+        queue.put(("org", "repo", 1), {'title' : "first"})
+        queue.put(("org", "repo", 1), {'title' : "second"})
+        queue.put(("org", "repo", 2), None)
+        
+        self.assertEqual(sorted(queue.get_ready(timeout = 1)),
+                         [(("org", "repo", 1), {'title' : "second"}), (("org", "repo", 2), None)])
+        self.assertEqual(len(queue), 0)
+        
+    def test_delivery_without_payload_keeps_the_last_one(self):
+        queue = WebhookQueue(debounce = 0)
+        
+        queue.put(("org", "repo", 1), {'title' : "first"})
+        queue.put(("org", "repo", 1), None)
+        
+        self.assertEqual(queue.get_ready(timeout = 1), [(("org", "repo", 1), {'title' : "first"})])
+        
+    def test_nothing_ready_before_the_debounce(self):
+        queue = WebhookQueue(debounce = 60)
+        
+        queue.put(("org", "repo", 1), None)
+        
+        self.assertEqual(queue.get_ready(timeout = 0), [])
+        self.assertEqual(queue.get_ready(flush = True), [(("org", "repo", 1), None)])
+
+if __name__ == "__main__":
+    unittest.main()